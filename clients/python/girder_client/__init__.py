@@ -23,12 +23,14 @@ import getpass
 import glob
 import json
 import mimetypes
+from multiprocessing.pool import ThreadPool
 import os
 import re
 import requests
 import shutil
 import six
 import tempfile
+import threading
 
 __version__ = '2.0.0'
 __license__ = 'Apache 2.0'
@@ -164,6 +166,7 @@ class GirderClient(object):
             self.urlBase += '/'
 
         self.token = ''
+        self._rawChunks = True
         self._folderUploadCallbacks = []
         self._itemUploadCallbacks = []
         self.incomingMetadata = {}
@@ -231,7 +234,8 @@ class GirderClient(object):
 
             self.token = resp['authToken']['token']
 
-    def sendRestRequest(self, method, path, parameters=None, data=None, files=None, json=None):
+    def sendRestRequest(self, method, path, parameters=None, data=None, files=None, json=None,
+                        headers=None):
         """
         This method looks up the appropriate method, constructs a request URL
         from the base URL, path, and parameters, and then sends the request. If
@@ -255,9 +259,12 @@ class GirderClient(object):
         :type files: dict
         :param json: A JSON object to send in the request body.
         :type json: dict
+        :param headers: Extra HTTP headers to send with the request.
+        :type headers: dict
         """
         if not parameters:
             parameters = {}
+        headers = dict(headers or {}, **{'Girder-Token': self.token})
 
         # Look up the HTTP method we need
         f = self.METHODS[method]
@@ -268,7 +275,7 @@ class GirderClient(object):
         # Make the request, passing parameters and authentication info
         result = f(
             url, params=parameters, data=data, files=files, json=json,
-            headers={'Girder-Token': self.token})
+            headers=headers)
 
         # If success, return the json object. Otherwise throw an exception.
         if result.status_code in (200, 201):
@@ -284,12 +291,12 @@ class GirderClient(object):
         """
         return self.sendRestRequest('GET', path, parameters)
 
-    def post(self, path, parameters=None, files=None, data=None, json=None):
+    def post(self, path, parameters=None, files=None, data=None, json=None, headers=None):
         """
         Convenience method to call :py:func:`sendRestRequest` with the 'POST' HTTP method.
         """
         return self.sendRestRequest('POST', path, parameters, files=files,
-                                    data=data, json=json)
+                                    data=data, json=json, headers=headers)
 
     def put(self, path, parameters=None, data=None, json=None):
         """
@@ -725,14 +732,7 @@ class GirderClient(object):
             if not data:
                 break
 
-            params = {
-                'offset': offset,
-                'uploadId': uploadId
-            }
-            files = {
-                'chunk': data
-            }
-            uploadObj = self.post('file/chunk', parameters=params, files=files)
+            uploadObj = self._sendChunk(uploadId, offset, data)
             offset += len(data)
 
             if '_id' not in uploadObj:
@@ -754,8 +754,114 @@ class GirderClient(object):
 
         return uploadObj
 
+    def _sendChunk(self, uploadId, offset, data):
+        """
+        Sends a chunk of an upload as the request body, which the server
+        passes to the assetstore as it is received. Servers that only accept
+        chunks as multipart form data are detected on the first chunk, and
+        are sent every chunk that way from then on.
+
+        :param uploadId: The ID of the upload.
+        :type uploadId: str
+        :param offset: The offset of the chunk in the file.
+        :type offset: int
+        :param data: The contents of the chunk.
+        :type data: bytes
+        :returns: The upload object, or the file object after the last chunk.
+        """
+        params = {
+            'offset': offset,
+            'uploadId': uploadId
+        }
+        if self._rawChunks:
+            try:
+                return self.post('file/chunk', parameters=params, data=data, headers={
+                    'Content-Type': 'application/octet-stream'
+                })
+            except HttpError as e:
+                if e.status != 400 or "'chunk' is required" not in e.responseText:
+                    raise
+                self._rawChunks = False
+        return self.post('file/chunk', parameters=params, files={'chunk': data})
+
+    def _uploadParts(self, uploadObj, stream, size, threads, progressCallback=None):
+        """
+        Uploads contents of a file in parts, sending several parts at the
+        same time. The upload must have been created with a part size. Parts
+        are read from the stream in order, so up to ``threads`` parts are held
+        in memory at once.
+
+        :param uploadObj: The upload object contain the upload id and part size.
+        :type uploadObj: dict
+        :param stream: Readable stream object.
+        :type stream: file-like
+        :param size: The length of the file. This must be exactly equal to the
+            total number of bytes that will be read from ``stream``, otherwise
+            the upload will fail.
+        :type size: str
+        :param threads: The number of parts to send at the same time.
+        :type threads: int
+        :param progressCallback: If passed, will be called after each part
+            with progress information. It passes a single positional argument
+            to the callable which is a dict of information about progress.
+        :type progressCallback: callable
+        """
+        uploadId = uploadObj['_id']
+        partSize = uploadObj['partSize']
+        lock = threading.Lock()
+        state = {'offset': 0, 'current': 0, 'result': uploadObj, 'failed': False}
+
+        def sendParts():
+            while True:
+                with lock:
+                    if state['failed']:
+                        return
+                    offset = state['offset']
+                    data = stream.read(min(partSize, size - offset))
+                    state['offset'] += len(data)
+                if not data:
+                    return
+
+                try:
+                    obj = self._sendChunk(uploadId, offset, data)
+                except Exception:
+                    state['failed'] = True
+                    raise
+                if '_id' not in obj:
+                    state['failed'] = True
+                    raise Exception(
+                        'After uploading a file part, did not receive object with _id. Got '
+                        'instead: ' + json.dumps(obj))
+
+                with lock:
+                    state['current'] += len(data)
+                    # The part that completes the upload returns the file
+                    if 'received' not in obj:
+                        state['result'] = obj
+                    if callable(progressCallback):
+                        progressCallback({
+                            'current': state['current'],
+                            'total': size
+                        })
+
+        pool = ThreadPool(threads)
+        try:
+            pool.map(lambda _: sendParts(), range(threads))
+        finally:
+            pool.close()
+            pool.join()
+
+        if state['offset'] != size:
+            self.delete('file/upload/' + uploadId)
+            raise IncorrectUploadLengthError(
+                'Expected upload to be %d bytes, but received %d.' % (size, state['offset']),
+                upload=uploadObj)
+
+        return state['result']
+
     def uploadFile(self, parentId, stream, name, size, parentType='item',
-                   progressCallback=None, reference=None, mimeType=None):
+                   progressCallback=None, reference=None, mimeType=None,
+                   sha512=None, threads=1, partSize=None):
         """
         Uploads a file into an item or folder.
 
@@ -780,6 +886,17 @@ class GirderClient(object):
         :param mimeType: MIME type to set on the file. Attempts to guess if not
             explicitly passed.
         :type mimeType: str or None
+        :param sha512: The SHA-512 hash of the data, as a hex string. If the
+            server already stores data with this hash and trusts this client
+            to provide it, the file is created without reading ``stream``.
+        :type sha512: str or None
+        :param threads: If greater than 1, the file is sent in parts, this
+            many at a time. The server's assetstore must support uploads in
+            parts.
+        :type threads: int
+        :param partSize: The size of the parts when ``threads`` is greater
+            than 1. Defaults to ``MAX_CHUNK_SIZE``.
+        :type partSize: int or None
         :returns: The file that was created on the server.
         """
         params = {
@@ -791,12 +908,28 @@ class GirderClient(object):
         }
         if reference is not None:
             params['reference'] = reference
+        if sha512 is not None:
+            params['sha512'] = sha512
+        if threads > 1:
+            params['partSize'] = partSize or self.MAX_CHUNK_SIZE
         obj = self.post('file', params)
         if '_id' not in obj:
             raise Exception(
                 'After creating an upload token for a new file, expected '
                 'an object with an id. Got instead: ' + json.dumps(obj))
 
+        if obj.get('_modelType') == 'file':
+            # The server already had the data, so there is nothing to upload
+            if callable(progressCallback):
+                progressCallback({
+                    'current': size,
+                    'total': size
+                })
+            return obj
+
+        if threads > 1:
+            return self._uploadParts(
+                obj, stream, size, threads, progressCallback=progressCallback)
         return self._uploadContents(obj, stream, size, progressCallback=progressCallback)
 
     def uploadFileContents(self, fileId, stream, size, reference=None):
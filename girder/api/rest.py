@@ -19,15 +19,21 @@
 
 import cherrypy
 import collections
+import copy
 import datetime
 import json
 import six
 import sys
+import threading
+import time
 import traceback
 
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+
 from . import docs
 from girder import events, logger, logprint
-from girder.constants import SettingKey, TokenScope, SortDir
+from girder.constants import CoreEventHandler, SettingKey, TokenScope, SortDir
 from girder.models.model_base import AccessException, GirderException, \
     ValidationException
 from girder.utility.model_importer import ModelImporter
@@ -121,6 +127,196 @@ def iterBody(length=READ_BUFFER_LEN, strictLength=False):
             yield buf
 
 
+class RequestBodyStream(object):
+    """
+    A read-only file-like object over the body of the current request. The
+    body is read from the connection as it is consumed (see
+    :py:func:`iterBody`), rather than being spooled to a temporary file
+    first, so it can be passed to code that expects an uploaded file.
+
+    The ``size`` attribute holds the Content-Length of the request, or None
+    if the body is sent with chunked transfer encoding.
+    """
+    def __init__(self):
+        self._body = iterBody()
+        # Pieces of the body that have been read but not consumed, which are
+        # only joined when they are returned, so each byte is copied once
+        self._pieces = collections.deque()
+        self._buffered = 0
+        length = cherrypy.request.headers.get('Content-Length')
+        self.size = int(length) if length is not None else None
+
+    def read(self, size=-1):
+        while size < 0 or self._buffered < size:
+            data = next(self._body, None)
+            if data is None:
+                break
+            self._pieces.append(data)
+            self._buffered += len(data)
+        if size < 0 or size >= self._buffered:
+            size = self._buffered
+        pieces = []
+        needed = size
+        while needed:
+            piece = self._pieces.popleft()
+            if len(piece) > needed:
+                self._pieces.appendleft(piece[needed:])
+                piece = piece[:needed]
+            pieces.append(piece)
+            needed -= len(piece)
+        self._buffered -= size
+        return b''.join(pieces)
+
+    def __iter__(self):
+        while True:
+            data = self.read(READ_BUFFER_LEN)
+            if not data:
+                return
+            yield data
+
+    def close(self):
+        self._pieces.clear()
+        self._buffered = 0
+
+
+class AuthCache(object):
+    """
+    A bounded, least-recently-used cache of token documents and the user
+    documents they authenticate, keyed by the token string. This spares the
+    database a token and a user lookup on every request made with a token
+    that has been seen recently.
+
+    Entries are evicted when the token is removed or when its user is saved or
+    removed in this process. Changes made by other server processes are only
+    noticed once an entry expires, so the lifetime of entries should be kept
+    short. It is read from the ``token_cache_ttl`` (in seconds, 0 to disable
+    the cache) and ``token_cache_size`` values in the ``auth`` section of the
+    server configuration.
+    """
+    def __init__(self):
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # Incremented by every invalidation, so that a token which was loaded
+        # before an invalidation is not cached after it
+        self._generation = 0
+
+    def _settings(self):
+        authConfig = config.getConfig().get('auth', {})
+        return (float(authConfig.get('token_cache_ttl', 30)),
+                int(authConfig.get('token_cache_size', 1000)))
+
+    def _getEntry(self, tokenStr):
+        with self._lock:
+            entry = self._entries.get(tokenStr)
+            if entry is None:
+                return None
+            if entry['expires'] < time.time():
+                del self._entries[tokenStr]
+                return None
+            # Mark this as the most recently used entry
+            del self._entries[tokenStr]
+            self._entries[tokenStr] = entry
+            return entry
+
+    def getToken(self, tokenStr):
+        """
+        Get a token by its string value, loading it from the database if it
+        is not in the cache.
+
+        :param tokenStr: The token string.
+        :type tokenStr: str
+        :returns: a copy of the token document, or None if there is no such
+            token.
+        """
+        ttl, size = self._settings()
+        entry = self._getEntry(tokenStr) if ttl > 0 else None
+        if entry is not None:
+            return copy.deepcopy(entry['token'])
+
+        with self._lock:
+            generation = self._generation
+        token = ModelImporter.model('token').load(tokenStr, force=True, objectId=False)
+        if token is not None and ttl > 0:
+            with self._lock:
+                if generation != self._generation:
+                    return token
+                self._entries.pop(tokenStr, None)
+                self._entries[tokenStr] = {
+                    'token': copy.deepcopy(token),
+                    'userId': token.get('userId'),
+                    'expires': time.time() + ttl
+                }
+                while len(self._entries) > size:
+                    self._entries.popitem(last=False)
+        return token
+
+    def getUser(self, token):
+        """
+        Get the user that owns a token, loading it from the database if it is
+        not in the cache.
+
+        :param token: The token document.
+        :type token: dict
+        :returns: a copy of the user document, or None if there is no such
+            user.
+        """
+        entry = self._getEntry(token['_id'])
+        if entry is not None and 'user' in entry:
+            return copy.deepcopy(entry['user'])
+
+        user = ModelImporter.model('user').load(token['userId'], force=True)
+        if entry is not None and user is not None:
+            entry['user'] = copy.deepcopy(user)
+        return user
+
+    def invalidateToken(self, tokenStr):
+        """
+        Remove a token from the cache.
+
+        :param tokenStr: The token string.
+        :type tokenStr: str
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(tokenStr, None)
+
+    def invalidateUser(self, userId):
+        """
+        Remove all tokens owned by a user from the cache.
+
+        :param userId: The id of the user.
+        :type userId: ObjectId
+        """
+        with self._lock:
+            self._generation += 1
+            for tokenStr in [tokenStr for tokenStr, entry in six.viewitems(self._entries)
+                             if entry['userId'] == userId]:
+                del self._entries[tokenStr]
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+authCache = AuthCache()
+
+events.bind('model.token.save.after', CoreEventHandler.AUTH_CACHE_INVALIDATE,
+            lambda event: authCache.invalidateToken(event.info['_id']))
+events.bind('model.token.remove', CoreEventHandler.AUTH_CACHE_INVALIDATE,
+            lambda event: authCache.invalidateToken(event.info['_id']))
+events.bind('model.user.save.after', CoreEventHandler.AUTH_CACHE_INVALIDATE,
+            lambda event: authCache.invalidateUser(event.info['_id']))
+events.bind('model.user.remove', CoreEventHandler.AUTH_CACHE_INVALIDATE,
+            lambda event: authCache.invalidateUser(event.info['_id']))
+# Removing a group changes the user documents of its members directly.
+events.bind('model.group.remove', CoreEventHandler.AUTH_CACHE_INVALIDATE,
+            lambda event: authCache.clear())
+
+
 def _cacheAuthUser(fun):
     """
     This decorator for getCurrentUser ensures that the authentication procedure
@@ -184,8 +380,7 @@ def getCurrentToken(allowCookie=False):
     if not tokenStr:
         return None
 
-    return ModelImporter.model('token').load(tokenStr, force=True,
-                                             objectId=False)
+    return authCache.getToken(tokenStr)
 
 
 @_cacheAuthUser
@@ -223,7 +418,7 @@ def getCurrentUser(returnToken=False):
         except AccessException:
             return retVal(None, token)
 
-        user = ModelImporter.model('user').load(token['userId'], force=True)
+        user = authCache.getUser(token)
         return retVal(user, token)
 
 
@@ -626,6 +821,68 @@ class RestException(Exception):
         Exception.__init__(self, message)
 
 
+class _RouteNode(object):
+    """
+    A node in the prefix tree of routes for one HTTP method of a Resource.
+    Each node corresponds to a token of a route; its children are keyed by
+    literal token, while wildcard children are kept in the order they were
+    added. Routes that end at this node are stored with their handlers.
+    """
+    __slots__ = ('literals', 'wildcards', 'routes')
+
+    def __init__(self):
+        self.literals = {}
+        self.wildcards = []
+        self.routes = []
+
+    def child(self, token, create=False):
+        """
+        Get the child node for a route token, optionally creating it.
+        """
+        if token[0] != ':':
+            node = self.literals.get(token)
+            if node is None and create:
+                node = self.literals[token] = _RouteNode()
+            return node
+        for name, node in self.wildcards:
+            if name == token[1:]:
+                return node
+        if create:
+            node = _RouteNode()
+            self.wildcards.append((token[1:], node))
+            return node
+
+    def match(self, path, index, wildcards):
+        """
+        Find the route matching a path, preferring literal tokens over
+        wildcards at each position.
+
+        :param path: The requested path.
+        :type path: list
+        :param index: The position within the path of the token for this node.
+        :type index: int
+        :param wildcards: The wildcard values matched so far; this is modified.
+        :type wildcards: dict
+        :returns: the matching route entry, or None.
+        """
+        if index == len(path):
+            return self.routes[0] if self.routes else None
+
+        token = path[index]
+        node = self.literals.get(token)
+        if node is not None:
+            entry = node.match(path, index + 1, wildcards)
+            if entry is not None:
+                return entry
+
+        for name, node in self.wildcards:
+            entry = node.match(path, index + 1, wildcards)
+            if entry is not None:
+                wildcards[name] = token
+                return entry
+        return None
+
+
 class Resource(ModelImporter):
     """
     All REST resources should inherit from this class, which provides utilities
@@ -634,8 +891,7 @@ class Resource(ModelImporter):
     exposed = True
 
     def __init__(self):
-        self._routes = collections.defaultdict(
-            lambda: collections.defaultdict(list))
+        self._routes = collections.defaultdict(_RouteNode)
 
     def _ensureInit(self):
         """
@@ -673,14 +929,10 @@ class Resource(ModelImporter):
         :param resource: The name of the resource at the root of this route.
         """
         self._ensureInit()
-        # Insertion sort to maintain routes in required order.
-        nLengthRoutes = self._routes[method.lower()][len(route)]
-        for i in range(len(nLengthRoutes)):
-            if self._shouldInsertRoute(route, nLengthRoutes[i][0]):
-                nLengthRoutes.insert(i, (route, handler))
-                break
-        else:
-            nLengthRoutes.append((route, handler))
+        node = self._routes[method.lower()]
+        for token in route:
+            node = node.child(token, create=True)
+        node.routes.append((route, handler, self._routeEventNames(method, route, handler)))
 
         # Now handle the api doc if the handler has any attached
         if resource is None and hasattr(self, 'resourceName'):
@@ -732,11 +984,16 @@ class Resource(ModelImporter):
         :param resource: the name of the resource at the root of this route.
         """
         self._ensureInit()
-        nLengthRoutes = self._routes[method.lower()][len(route)]
-        for i in range(len(nLengthRoutes)):
-            if nLengthRoutes[i][0] == route:
-                del nLengthRoutes[i]
+        node = self._routes[method.lower()]
+        for token in route:
+            node = node.child(token)
+            if node is None:
                 break
+        else:
+            for i in range(len(node.routes)):
+                if node.routes[i][0] == route:
+                    del node.routes[i]
+                    break
         # Remove the api doc
         if resource is None and hasattr(self, 'resourceName'):
             resource = self.resourceName
@@ -747,16 +1004,21 @@ class Resource(ModelImporter):
                 resource=resource, route=route, method=method,
                 info=handler.description.asDict(), handler=handler)
 
-    def _shouldInsertRoute(self, a, b):
+    def _routeEventNames(self, method, route, handler):
         """
-        Return bool representing whether route a should go before b. Checks by
-        comparing each token in order and making sure routes with literals in
-        forward positions come before routes with wildcards in those positions.
+        Build the names of the events fired before and after calling the
+        handler of a route. See :py:meth:`handleRoute`.
+
+        :returns: a tuple of the before and after event names.
         """
-        for i in range(len(a)):
-            if a[i][0] != ':' and b[i][0] == ':':
-                return True
-        return False
+        if hasattr(self, 'resourceName'):
+            resource = self.resourceName
+        else:
+            resource = handler.__module__.rsplit('.', 1)[-1]
+
+        routeStr = '/'.join((resource, '/'.join(route))).rstrip('/')
+        eventPrefix = '.'.join(('rest', method.lower(), routeStr))
+        return '.'.join((eventPrefix, 'before')), '.'.join((eventPrefix, 'after'))
 
     def handleRoute(self, method, path, params):
         """
@@ -784,6 +1046,9 @@ class Resource(ModelImporter):
 
             ``rest.post.group.before``
 
+        Routes are matched token by token, and literal tokens take precedence
+        over wildcards at each position.
+
         .. note:: You will normally not need to call this method directly, as it
            is called by the internals of this class during the routing process.
 
@@ -797,10 +1062,10 @@ class Resource(ModelImporter):
 
         method = method.lower()
 
-        for route, handler in self._routes[method][len(path)]:
-            kwargs = self._matchRoute(path, route)
-            if kwargs is False:
-                continue
+        kwargs = {}
+        entry = self._routes[method].match(path, 0, kwargs)
+        if entry is not None:
+            route, handler, (beforeEvent, afterEvent) = entry
 
             cherrypy.request.requiredScopes = getattr(
                 handler, 'requiredScopes', None) or TokenScope.USER_AUTH
@@ -824,18 +1089,10 @@ class Resource(ModelImporter):
             # Add before call for the API method. Listeners can return
             # their own responses by calling preventDefault() and
             # adding a response on the event.
-
-            if hasattr(self, 'resourceName'):
-                resource = self.resourceName
-            else:
-                resource = handler.__module__.rsplit('.', 1)[-1]
-
-            routeStr = '/'.join((resource, '/'.join(route))).rstrip('/')
-            eventPrefix = '.'.join(('rest', method, routeStr))
-
-            event = events.trigger('.'.join((eventPrefix, 'before')),
-                                   kwargs, pre=self._defaultAccess)
-            if event.defaultPrevented and len(event.responses) > 0:
+            event = None
+            if events.hasHandlers(beforeEvent):
+                event = events.trigger(beforeEvent, kwargs, pre=self._defaultAccess)
+            if event is not None and event.defaultPrevented and len(event.responses) > 0:
                 val = event.responses[0]
             else:
                 self._defaultAccess(handler)
@@ -845,37 +1102,17 @@ class Resource(ModelImporter):
             # return value of the API method that was called. You can
             # reassign the return value completely by adding a response to
             # the event and calling preventDefault() on it.
-            kwargs['returnVal'] = val
-            event = events.trigger('.'.join((eventPrefix, 'after')), kwargs)
-            if event.defaultPrevented and len(event.responses) > 0:
-                val = event.responses[0]
+            if events.hasHandlers(afterEvent):
+                kwargs['returnVal'] = val
+                event = events.trigger(afterEvent, kwargs)
+                if event.defaultPrevented and len(event.responses) > 0:
+                    val = event.responses[0]
 
             return val
 
         raise RestException('No matching route for "%s %s"' % (
             method.upper(), '/'.join(path)))
 
-    def _matchRoute(self, path, route):
-        """
-        Helper function that attempts to match the requested path with a
-        given route specification. Returns False if the requested path does
-        not match the route. If it does match, this will return the dict of
-        kwargs that should be passed to the underlying handler, based on the
-        wildcard tokens of the route.
-
-        :param path: The requested path.
-        :type path: list
-        :param route: The route specification to match against.
-        :type route: list
-        """
-        wildcards = {}
-        for i in range(0, len(route)):
-            if route[i][0] == ':':  # Wildcard token
-                wildcards[route[i][1:]] = path[i]
-            elif route[i] != path[i]:  # Exact match token
-                return False
-        return wildcards
-
     def requireParams(self, required, provided):
         """
         Throws an exception if any of the parameters in the required iterable
@@ -917,6 +1154,43 @@ class Resource(ModelImporter):
 
         return val.lower().strip() in ('true', 'on', '1', 'yes')
 
+    def metadataParam(self, metadata):
+        """
+        Throws an exception if metadata passed in a JSON body is not an
+        object, and otherwise returns it.
+
+        :param metadata: The metadata value from the body.
+        :returns: the metadata dict.
+        """
+        if not isinstance(metadata, dict):
+            raise RestException('The metadata must be a JSON object.')
+        return metadata
+
+    def metadataUpdatesParam(self, body, modelName):
+        """
+        Parse the body of a bulk metadata request, which is a list of objects
+        with "id" and "metadata" fields.
+
+        :param body: The parsed JSON body.
+        :param modelName: The name of the model the ids refer to, used in
+            error messages.
+        :type modelName: str
+        :returns: a list of (id, metadata dict) pairs.
+        """
+        if not isinstance(body, list):
+            raise RestException('The body must be a JSON list.')
+        updates = []
+        for entry in body:
+            if not isinstance(entry, dict):
+                raise RestException('Each update must be a JSON object.')
+            self.requireParams(('id', 'metadata'), entry)
+            try:
+                id = ObjectId(entry['id'])
+            except (InvalidId, TypeError):
+                raise RestException('Invalid %s id (%s).' % (modelName, entry['id']))
+            updates.append((id, self.metadataParam(entry['metadata'])))
+        return updates
+
     def requireAdmin(self, user, message=None):
         """
         Calling this on a user will ensure that they have admin rights.
@@ -19,13 +19,16 @@
 
 import cherrypy
 import errno
+import json
 import six
 
 from ..describe import Description, describeRoute
-from ..rest import Resource, RestException, filtermodel, loadmodel
+from ..rest import Resource, RestException, RequestBodyStream, filtermodel, loadmodel, \
+    setResponseHeader
 from ...constants import AccessType, TokenScope
 from girder.models.model_base import AccessException, GirderException
 from girder.api import access
+from girder.utility import genToken
 
 
 class File(Resource):
@@ -42,6 +45,7 @@ class File(Resource):
         self.route('GET', (':id',), self.getFile)
         self.route('GET', (':id', 'download'), self.download)
         self.route('GET', (':id', 'download', ':name'), self.downloadWithName)
+        self.route('GET', (':id', 'ranges'), self.downloadRanges)
         self.route('POST', (), self.initUpload)
         self.route('POST', ('chunk',), self.readChunk)
         self.route('POST', ('completion',), self.finalizeUpload)
@@ -79,6 +83,14 @@ class File(Resource):
                required=False)
         .param('assetstoreId', 'Direct the upload to a specific assetstore.',
                required=False)
+        .param('sha512', 'The SHA-512 hash of the file, as a hex string. If '
+               'the assetstore already holds this data and the upload '
+               'deduplication policy allows it, the file is created right away '
+               'and no data needs to be uploaded.', required=False)
+        .param('partSize', 'Send the file in parts of this many bytes, which '
+               'may be uploaded concurrently and in any order. Each part is '
+               'sent as a chunk whose offset is a multiple of the part size.',
+               dataType='integer', required=False)
         .errorResponse()
         .errorResponse('Write access was denied on the parent folder.', 403)
         .errorResponse('Failed to create upload.', 500)
@@ -89,7 +101,8 @@ class File(Resource):
         to initialize the upload. This creates the temporary record of the
         forthcoming upload that will be passed in chunks to the readChunk
         method. If you pass a "linkUrl" parameter, it will make a link file
-        in the designated parent.
+        in the designated parent. If the file is empty, or its data is already
+        stored, the file is returned instead of an upload.
         """
         self.requireParams(('name', 'parentId', 'parentType'), params)
         user = self.getCurrentUser()
@@ -111,6 +124,9 @@ class File(Resource):
                     mimeType=mimeType), user)
         else:
             self.requireParams('size', params)
+            partSize = None
+            if params.get('partSize'):
+                partSize = int(params['partSize'])
             assetstore = None
             if params.get('assetstoreId'):
                 assetstore = self.model('assetstore').load(
@@ -119,14 +135,15 @@ class File(Resource):
                 upload = self.model('upload').createUpload(
                     user=user, name=params['name'], parentType=parentType,
                     parent=parent, size=int(params['size']), mimeType=mimeType,
-                    reference=params.get('reference'), assetstore=assetstore)
+                    reference=params.get('reference'), assetstore=assetstore,
+                    sha512=params.get('sha512'), partSize=partSize)
             except OSError as exc:
                 if exc.errno == errno.EACCES:
                     raise GirderException(
                         'Failed to create upload.',
                         'girder.api.v1.file.create-upload-failed')
                 raise
-            if upload['size'] > 0:
+            if upload['size'] > 0 and 'storedData' not in upload:
                 return upload
             else:
                 return self.model('file').filter(
@@ -192,15 +209,22 @@ class File(Resource):
 
     @access.user(scope=TokenScope.DATA_WRITE)
     @describeRoute(
-        Description('Upload a chunk of a file with multipart/form-data.')
+        Description('Upload a chunk of a file.')
+        .notes('The chunk may be sent as the "chunk" field of a '
+               'multipart/form-data body, or as the whole request body with '
+               'any other content type, such as application/octet-stream, in '
+               'which case the other parameters must be passed in the query '
+               'string. Request bodies are passed to the assetstore as they '
+               'are received, without being spooled to a temporary file.')
         .consumes('multipart/form-data')
+        .consumes('application/octet-stream')
         .param('uploadId', 'The ID of the upload record.', paramType='formData')
         .param('offset', 'Offset of the chunk in the file.', dataType='integer',
                paramType='formData')
         .param('chunk', 'The actual bytes of the chunk. For external upload '
                'behaviors, this may be set to an opaque string that will be '
                'handled by the assetstore adapter.',
-               dataType='file', paramType='formData')
+               dataType='file', paramType='formData', required=False)
         .errorResponse(('ID was invalid.',
                         'Received too many bytes.',
                         'Chunk is smaller than the minimum size.'))
@@ -214,25 +238,39 @@ class File(Resource):
         must remain logged in when passing each chunk, to authenticate that
         the writer of the chunk is the same as the person who initiated the
         upload. The passed offset is a verification mechanism for ensuring the
-        server and client agree on the number of bytes sent/received.
+        server and client agree on the number of bytes sent/received. If the
+        upload was created with a part size, the offset instead identifies
+        the part being sent, and parts may be sent in any order.
         """
-        self.requireParams(('offset', 'uploadId', 'chunk'), params)
+        self.requireParams(('offset', 'uploadId'), params)
+        if 'chunk' not in params and self._isFormBody():
+            self.requireParams('chunk', params)
 
         user = self.getCurrentUser()
         upload = self.model('upload').load(params['uploadId'], exc=True)
         offset = int(params['offset'])
-        chunk = params['chunk']
+        chunk = params.get('chunk')
 
         if upload['userId'] != user['_id']:
             raise AccessException('You did not initiate this upload.')
 
-        if upload['received'] != offset:
+        if 'partSize' in upload:
+            if offset % upload['partSize']:
+                raise RestException(
+                    'The offset of a part must be a multiple of the part '
+                    'size, %d.' % upload['partSize'])
+        elif upload['received'] != offset:
             raise RestException(
                 'Server has received %s bytes, but client sent offset %s.' % (
                     upload['received'], offset))
+        if chunk is None:
+            chunk = RequestBodyStream()
+        elif isinstance(chunk, cherrypy._cpreqbody.Part):
+            chunk = chunk.file
         try:
-            if isinstance(chunk, cherrypy._cpreqbody.Part):
-                return self.model('upload').handleChunk(upload, chunk.file)
+            if 'partSize' in upload:
+                return self.model('upload').handlePart(
+                    upload, offset // upload['partSize'], chunk)
             else:
                 return self.model('upload').handleChunk(upload, chunk)
         except IOError as exc:
@@ -240,13 +278,23 @@ class File(Resource):
                 raise Exception('Failed to store upload.')
             raise
 
+    def _isFormBody(self):
+        """
+        Whether the request body is a form, which CherryPy has already parsed
+        into the parameters. A body without a content type is treated as one.
+        """
+        contentType = cherrypy.request.headers.get('Content-Type', '')
+        return not contentType or contentType.startswith(
+            ('multipart/', 'application/x-www-form-urlencoded'))
+
     @access.cookie
     @access.public(scope=TokenScope.DATA_READ)
     @loadmodel(model='file', level=AccessType.READ)
     @describeRoute(
         Description('Download a file.')
         .notes('This endpoint also accepts the HTTP "Range" header for partial '
-               'file downloads.')
+               'file downloads. If several ranges are requested, they are sent '
+               'as a multipart/byteranges response.')
         .param('id', 'The ID of the file.', paramType='path')
         .param('offset', 'Start downloading at this offset in bytes within '
                'the file.', dataType='integer', required=False)
@@ -273,8 +321,9 @@ class File(Resource):
             cherrypy.request.headers.get('Range'), file.get('size', 0))
 
         # The HTTP Range header takes precedence over query params
-        if rangeHeader and len(rangeHeader):
-            # Currently we only support a single range.
+        if rangeHeader and len(rangeHeader) > 1:
+            return self._sendRanges(file, rangeHeader)
+        elif rangeHeader and len(rangeHeader):
             offset, endByte = rangeHeader[0]
         else:
             offset = int(params.get('offset', 0))
@@ -295,6 +344,65 @@ class File(Resource):
                                            contentDisposition=contentDisp,
                                            extraParameters=extraParameters)
 
+    @access.cookie
+    @access.public(scope=TokenScope.DATA_READ)
+    @loadmodel(model='file', level=AccessType.READ)
+    @describeRoute(
+        Description('Download several byte ranges of a file.')
+        .notes('The ranges are sent as a multipart/byteranges response, with '
+               'a Content-Range header on each part. Ranges are sent in order '
+               'of their offset, and overlapping ranges are merged.')
+        .param('id', 'The ID of the file.', paramType='path')
+        .param('ranges', 'A JSON list of [offset, endByte] pairs. As with the '
+               'endByte parameter of the download endpoint, endByte is '
+               'non-inclusive.')
+        .errorResponse('ID was invalid.')
+        .errorResponse('Read access was denied on the parent folder.', 403)
+        .errorResponse('None of the ranges are within the file.', 416)
+    )
+    def downloadRanges(self, file, params):
+        self.requireParams('ranges', params)
+        try:
+            ranges = json.loads(params['ranges'])
+            ranges = [(int(start), int(end)) for start, end in ranges]
+        except (TypeError, ValueError):
+            raise RestException('The ranges parameter must be a JSON list of '
+                                '[offset, endByte] pairs.')
+        return self._sendRanges(file, ranges)
+
+    def _sendRanges(self, file, ranges):
+        """
+        Send several byte ranges of a file as a multipart/byteranges response.
+        """
+        ranges, stream = self.model('file').downloadRanges(file, ranges)
+        if not ranges:
+            raise RestException('None of the ranges are within the file.', 416)
+
+        boundary = genToken(32)
+        contentType = file.get('mimeType') or 'application/octet-stream'
+        partHeaders = [(
+            '\r\n--%s\r\nContent-Type: %s\r\nContent-Range: bytes %d-%d/%d\r\n\r\n' % (
+                boundary, contentType, start, end - 1, file['size'])).encode('utf8')
+            for start, end in ranges]
+        closing = ('\r\n--%s--\r\n' % boundary).encode('utf8')
+
+        cherrypy.response.status = 206
+        setResponseHeader('Content-Type', 'multipart/byteranges; boundary=%s' % boundary)
+        setResponseHeader('Content-Length', sum(
+            len(header) + end - start for header, (start, end) in zip(partHeaders, ranges)
+        ) + len(closing))
+
+        def multipartStream():
+            current = None
+            for index, data in stream():
+                if index != current:
+                    current = index
+                    yield partHeaders[index]
+                yield data
+            yield closing
+
+        return multipartStream
+
     @access.cookie
     @access.public(scope=TokenScope.DATA_READ)
     @describeRoute(
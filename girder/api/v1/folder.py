@@ -24,7 +24,8 @@ from ..rest import Resource, RestException, filtermodel, loadmodel, \
     setResponseHeader
 from girder.api import access
 from girder.constants import AccessType, TokenScope
-from girder.utility import ziputil
+from girder.models.model_base import AccessException
+from girder.utility import batches, ziputil
 from girder.utility.progress import ProgressContext
 
 
@@ -46,6 +47,7 @@ class Folder(Resource):
         self.route('PUT', (':id', 'access'), self.updateFolderAccess)
         self.route('POST', (':id', 'copy'), self.copyFolder)
         self.route('PUT', (':id', 'metadata'), self.setMetadata)
+        self.route('PUT', ('metadata',), self.setMetadataBulk)
 
     @access.public(scope=TokenScope.DATA_READ)
     @filtermodel(model='folder')
@@ -363,6 +365,41 @@ class Folder(Resource):
 
         return self.model('folder').setMetadata(folder, metadata)
 
+    @access.user(scope=TokenScope.DATA_WRITE)
+    @describeRoute(
+        Description('Set metadata fields on many folders.')
+        .notes('The body is a list of objects with "id" and "metadata" '
+               'fields. Set metadata fields to null in order to delete them.')
+        .param('body', 'A JSON list describing the metadata to set.',
+               paramType='body')
+        .errorResponse(('An ID was invalid.',
+                        'Invalid JSON passed in request body.',
+                        'Metadata key name was invalid.'))
+        .errorResponse('Write access was denied for a folder.', 403)
+    )
+    def setMetadataBulk(self, params):
+        body = self.getBodyJson()
+        user = self.getCurrentUser()
+
+        updates = self.metadataUpdatesParam(body, 'folder')
+
+        # Check access to the folders a batch at a time
+        ids = list({id for id, metadata in updates})
+        for batch in batches(ids, self.model('folder').metadataBatchSize):
+            query = {'_id': {'$in': batch}}
+            missing = set(batch) - {folder['_id'] for folder in self.model(
+                'folder').find(query, fields=[])}
+            if missing:
+                raise RestException('Invalid folder id (%s).' % missing.pop())
+            denied = set(batch) - {folder['_id'] for folder in self.model(
+                'folder').findWithPermissions(
+                    query, fields=[], user=user, level=AccessType.WRITE)}
+            if denied:
+                raise AccessException(
+                    'Write access denied for folder %s.' % denied.pop())
+
+        return {'updated': self.model('folder').setMetadataBulk(updates)}
+
     @access.user(scope=TokenScope.DATA_WRITE)
     @loadmodel(model='folder', level=AccessType.READ)
     @filtermodel(model='folder')
@@ -20,9 +20,10 @@
 from ..describe import Description, describeRoute
 from ..rest import Resource, RestException, filtermodel, loadmodel, \
     setResponseHeader
-from girder.utility import ziputil
+from girder.utility import batches, ziputil
 from girder.constants import AccessType, TokenScope
 from girder.api import access
+from girder.models.model_base import AccessException
 
 
 class Item(Resource):
@@ -40,6 +41,7 @@ class Item(Resource):
         self.route('PUT', (':id',), self.updateItem)
         self.route('POST', (':id', 'copy'), self.copyItem)
         self.route('PUT', (':id', 'metadata'), self.setMetadata)
+        self.route('PUT', ('metadata',), self.setMetadataBulk)
 
     @access.public(scope=TokenScope.DATA_READ)
     @filtermodel(model='item')
@@ -192,6 +194,54 @@ class Item(Resource):
 
         return self.model('item').setMetadata(item, metadata)
 
+    @access.user(scope=TokenScope.DATA_WRITE)
+    @describeRoute(
+        Description('Set metadata fields on many items.')
+        .notes('The body is either a list of objects with "id" and '
+               '"metadata" fields, to set different metadata on each item, '
+               'or an object with "folderId" and "metadata" fields, to set the '
+               'same metadata on every item in a folder. Set metadata fields '
+               'to null in order to delete them.')
+        .param('body', 'A JSON list or object describing the metadata to set.',
+               paramType='body')
+        .errorResponse(('An ID was invalid.',
+                        'Invalid JSON passed in request body.',
+                        'Metadata key name was invalid.'))
+        .errorResponse('Write access was denied for an item or the folder.',
+                       403)
+    )
+    def setMetadataBulk(self, params):
+        body = self.getBodyJson()
+        user = self.getCurrentUser()
+
+        if isinstance(body, dict):
+            self.requireParams(('folderId', 'metadata'), body)
+            folder = self.model('folder').load(
+                body['folderId'], user=user, level=AccessType.WRITE, exc=True)
+            count = self.model('item').setMetadataBulk(
+                query={'folderId': folder['_id']},
+                metadata=self.metadataParam(body['metadata']))
+            return {'updated': count}
+
+        updates = self.metadataUpdatesParam(body, 'item')
+
+        # Check access to the items a batch at a time, through their folders
+        ids = list({id for id, metadata in updates})
+        for batch in batches(ids, self.model('item').metadataBatchSize):
+            items = list(self.model('item').find(
+                {'_id': {'$in': batch}}, fields=['folderId']))
+            missing = set(batch) - {item['_id'] for item in items}
+            if missing:
+                raise RestException('Invalid item id (%s).' % missing.pop())
+            allowed = {item['_id'] for item in self.model(
+                'item').filterResultsByPermission(items, user, AccessType.WRITE)}
+            denied = set(batch) - allowed
+            if denied:
+                raise AccessException(
+                    'Write access denied for item %s.' % denied.pop())
+
+        return {'updated': self.model('item').setMetadataBulk(updates)}
+
     def _downloadMultifileItem(self, item, user):
         setResponseHeader('Content-Type', 'application/zip')
         setResponseHeader(
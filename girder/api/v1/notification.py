@@ -24,13 +24,13 @@ import time
 from ..describe import Description, describeRoute
 from ..rest import Resource, setResponseHeader
 from girder.api import access
+from girder.utility.notification_bus import getNotificationBus
 
 # If no timeout param is passed to stream, we default to this value
 DEFAULT_STREAM_TIMEOUT = 300
-# When new events are seen, we will poll at the minimum interval
-MIN_POLL_INTERVAL = 0.5
-# The interval increases when no new events are seen, capping at this value
-MAX_POLL_INTERVAL = 2
+# The longest we wait for a notification before checking whether the server
+# is shutting down
+MAX_WAIT_INTERVAL = 5
 
 
 def sseMessage(event):
@@ -54,9 +54,9 @@ class Notification(Resource):
         .notes('This uses long-polling to keep the connection open for '
                'several minutes at a time (or longer) and should be requested '
                'with an EventSource object or other SSE-capable client. '
-               '<p>Notifications are returned within a few seconds of when '
-               'they occur.  When no notification occurs for the timeout '
-               'duration, the stream is closed. '
+               '<p>Notifications are returned as soon as they occur.  When '
+               'no notification occurs for the timeout duration, the stream '
+               'is closed. '
                '<p>This connection can stay open indefinitely long.')
         .param('timeout', 'The duration without a notification before the '
                'stream is closed.', dataType='integer', required=False)
@@ -82,20 +82,27 @@ class Notification(Resource):
         timeout = int(params.get('timeout', DEFAULT_STREAM_TIMEOUT))
 
         def streamGen():
-            lastUpdate = None
-            start = time.time()
-            wait = MIN_POLL_INTERVAL
-            while cherrypy.engine.state == cherrypy.engine.states.STARTED:
-                wait = min(wait + MIN_POLL_INTERVAL, MAX_POLL_INTERVAL)
-                for event in self.model('notification').get(
-                        user, lastUpdate, token=token):
-                    if lastUpdate is None or event['updated'] > lastUpdate:
-                        lastUpdate = event['updated']
-                    wait = MIN_POLL_INTERVAL
-                    start = time.time()
-                    yield sseMessage(event)
-                if time.time() - start > timeout:
-                    break
-
-                time.sleep(wait)
+            # Subscribe before the first query so nothing saved in between
+            # is missed. The database is only queried again once the bus
+            # reports a new notification for this user or token.
+            subscription = getNotificationBus().subscribe(
+                user['_id'] if user else token['_id'])
+            try:
+                lastUpdate = None
+                start = time.time()
+                published = True
+                while cherrypy.engine.state == cherrypy.engine.states.STARTED:
+                    if published:
+                        for event in self.model('notification').get(
+                                user, lastUpdate, token=token):
+                            if lastUpdate is None or event['updated'] > lastUpdate:
+                                lastUpdate = event['updated']
+                            start = time.time()
+                            yield sseMessage(event)
+                    remaining = timeout - (time.time() - start)
+                    if remaining <= 0:
+                        break
+                    published = subscription.wait(min(remaining, MAX_WAIT_INTERVAL))
+            finally:
+                subscription.close()
         return streamGen
@@ -353,13 +353,17 @@ class System(Resource):
         with ProgressContext(progress, user=user, title=title) as pc:
             results = {}
             pc.update(
-                title='Checking for orphaned records (Step 1 of 3)')
+                title='Checking for orphaned records (Step 1 of 4)')
             results['orphansRemoved'] = self._pruneOrphans(pc)
             pc.update(
-                title='Checking for incorrect base parents (Step 2 of 3)')
+                title='Checking for incorrect base parents (Step 2 of 4)')
             results['baseParentsFixed'] = self._fixBaseParents(pc)
             pc.update(
-                title='Checking for incorrect sizes (Step 3 of 3)')
+                title='Checking for incorrect ancestors (Step 3 of 4)')
+            results['ancestorsFixed'] = self.model(
+                'folder').backfillAncestorIds(pc)
+            pc.update(
+                title='Checking for incorrect sizes (Step 4 of 4)')
             results['sizesChanged'] = self._recalculateSizes(pc)
             return results
         # TODO:
@@ -462,13 +466,4 @@ class System(Resource):
         return count
 
     def _recalculateSizes(self, progress):
-        fixes = 0
-        models = ['collection', 'user']
-        steps = sum(self.model(model).find().count() for model in models)
-        progress.update(total=steps, current=0)
-        for model in models:
-            for doc in self.model(model).find():
-                progress.update(increment=1)
-                _, f = self.model(model).updateSize(doc)
-                fixes += f
-        return fixes
+        return self.model('size_ledger').reconcile(progress)
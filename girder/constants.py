@@ -146,6 +146,7 @@ class SettingKey:
     SMTP_USERNAME = 'core.smtp.username'
     SMTP_PASSWORD = 'core.smtp.password'
     UPLOAD_MINIMUM_CHUNK_SIZE = 'core.upload_minimum_chunk_size'
+    UPLOAD_DEDUPLICATION_POLICY = 'core.upload_deduplication_policy'
     CORS_ALLOW_ORIGIN = 'core.cors.allow_origin'
     CORS_ALLOW_METHODS = 'core.cors.allow_methods'
     CORS_ALLOW_HEADERS = 'core.cors.allow_headers'
@@ -170,6 +171,7 @@ class SettingDefault:
         SettingKey.SMTP_PORT: 25,
         SettingKey.SMTP_ENCRYPTION: 'none',
         SettingKey.UPLOAD_MINIMUM_CHUNK_SIZE: 1024 * 1024 * 5,
+        SettingKey.UPLOAD_DEDUPLICATION_POLICY: 'never',
         # These headers are necessary to allow the web server to work with just
         # changes to the CORS origin
         SettingKey.CORS_ALLOW_HEADERS:
@@ -290,6 +292,9 @@ class CoreEventHandler(object):
     # For removing deleted user/group references from AccessControlledModel
     ACCESS_CONTROL_CLEANUP = 'core.cleanupDeletedEntity'
 
+    # For evicting changed tokens and users from the authentication cache.
+    AUTH_CACHE_INVALIDATE = 'core.invalidateAuthCache'
+
     # For updating an item's size to include a new file.
     FILE_PROPAGATE_SIZE = 'core.propagateSizeToItem'
 
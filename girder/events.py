@@ -242,6 +242,18 @@ def unbindAll():
     _mapping.clear()
 
 
+def hasHandlers(eventName):
+    """
+    Test whether any handlers are bound to an event. Callers can use this to
+    skip building the info for events that nothing is listening for.
+
+    :param eventName: The name that identifies the event.
+    :type eventName: str
+    :rtype: bool
+    """
+    return bool(_mapping.get(eventName))
+
+
 @contextlib.contextmanager
 def bound(eventName, handlerName, handler):
     """
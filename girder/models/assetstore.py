@@ -61,6 +61,9 @@ class Assetstore(Model):
         if doc['current'] is True:
             self.update({'current': True}, {'$set': {'current': False}})
 
+        # Shared adapter instances are rebuilt when the revision changes
+        doc['revision'] = doc.get('revision', 0) + 1
+
         return doc
 
     def remove(self, assetstore, **kwargs):
@@ -84,6 +87,7 @@ class Assetstore(Model):
             pass
         # now remove the assetstore
         Model.remove(self, assetstore)
+        assetstore_utilities.clearAssetstoreAdapters(assetstore['_id'])
         # If after removal there is no current assetstore, then pick a
         # different assetstore to be the current one.
         current = self.findOne({'current': True})
@@ -33,7 +33,8 @@ class Collection(AccessControlledModel):
 
     def initialize(self):
         self.name = 'collection'
-        self.ensureIndices(['name'])
+        self.ensureIndices(['name', 'access.users.id', 'access.groups.id',
+                            'public'])
         self.ensureTextIndex({
             'name': 10,
             'description': 1
@@ -291,19 +292,17 @@ class Collection(AccessControlledModel):
         :param level: The required access level, or None to return the raw
             top-level folder count.
         """
-        fields = () if level is None else ('access', 'public')
-
         folderModel = self.model('folder')
-        folders = folderModel.find({
+        q = {
             'parentId': collection['_id'],
             'parentCollection': 'collection'
-        }, fields=fields)
+        }
 
         if level is None:
-            return folders.count()
+            return folderModel.find(q, fields=()).count()
         else:
-            return sum(1 for _ in folderModel.filterResultsByPermission(
-                cursor=folders, user=user, level=level))
+            return folderModel.findWithPermissions(
+                q, fields=(), user=user, level=level).count()
 
     def updateSize(self, doc):
         """
@@ -18,20 +18,30 @@
 ###############################################################################
 
 import cherrypy
+import collections
 import datetime
 import six
 
+from multiprocessing.pool import ThreadPool
+
 from .model_base import Model, ValidationException
 from girder import events
 from girder.constants import AccessType, CoreEventHandler
 from girder.models.model_base import AccessControlledModel
 from girder.utility import assetstore_utilities, acl_mixin
+from girder.utility.abstract_assetstore_adapter import AbstractAssetstoreAdapter
+from girder.utility.file_handle import FileHandle
 
 
 class File(acl_mixin.AccessControlMixin, Model):
     """
     This model represents a File, which is stored in an assetstore.
+
+    copyThreads is the number of threads :py:meth:`copyFiles` uses for
+    assetstores whose adapters copy the stored data of each file.
     """
+    copyThreads = 4
+
     def initialize(self):
         self.name = 'file'
         self.ensureIndices(
@@ -49,6 +59,9 @@ class File(acl_mixin.AccessControlMixin, Model):
         events.bind('model.file.save.created',
                     CoreEventHandler.FILE_PROPAGATE_SIZE,
                     self._propagateSizeToItem)
+        events.bind('model.file.save_many.created',
+                    CoreEventHandler.FILE_PROPAGATE_SIZE,
+                    self._propagateSizesToItems)
 
     def remove(self, file, updateItemSize=True, **kwargs):
         """
@@ -72,6 +85,27 @@ class File(acl_mixin.AccessControlMixin, Model):
 
         Model.remove(self, file)
 
+    def removeMany(self, files, **kwargs):
+        """
+        Delete a batch of files. The stored data is deleted with one call to
+        deleteFiles per assetstore, and the file records with a single query.
+        Unlike :py:meth:`remove`, this does not propagate the size change to
+        the parent items, folders and roots; that is left to the caller.
+
+        :param files: The file documents to remove.
+        :type files: list of dict
+        :returns: the list of ids of the removed files.
+        """
+        byAssetstore = collections.defaultdict(list)
+        for file in files:
+            if file.get('assetstoreId'):
+                byAssetstore[file['assetstoreId']].append(file)
+        for assetstoreFiles in six.viewvalues(byAssetstore):
+            self.getAssetstoreAdapter(assetstoreFiles[0]).deleteFiles(
+                assetstoreFiles)
+
+        return Model.removeMany(self, files, **kwargs)
+
     def download(self, file, offset=0, headers=True, endByte=None,
                  contentDisposition=None, extraParameters=None):
         """
@@ -110,6 +144,53 @@ class File(acl_mixin.AccessControlMixin, Model):
         else:  # pragma: no cover
             raise Exception('File has no known download mechanism.')
 
+    def downloadRanges(self, file, ranges):
+        """
+        Download several byte ranges of a file. The ranges are clipped to the
+        size of the file and sorted, and ranges that overlap or touch are
+        merged, so that each byte is only sent once.
+
+        :param file: The file to download.
+        :type file: dict
+        :param ranges: The byte ranges, as (offset, endByte) pairs. As with
+            :py:meth:`download`, endByte is non-inclusive.
+        :type ranges: list
+        :returns: a tuple of the list of merged ranges, and a generator
+            function yielding (index, data) pairs, where index is the position
+            of the range within the merged list.
+        """
+        merged = []
+        for start, end in sorted(ranges):
+            start, end = max(start, 0), min(end, file.get('size', 0))
+            if end <= start:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+            else:
+                merged.append((start, end))
+
+        if file.get('assetstoreId'):
+            stream = self.getAssetstoreAdapter(file).downloadRanges(file, merged)
+        elif file.get('linkUrl'):
+            def stream():
+                for index, (start, end) in enumerate(merged):
+                    yield index, file['linkUrl'][start:end]
+        else:  # pragma: no cover
+            raise Exception('File has no known download mechanism.')
+        return merged, stream
+
+    def open(self, file):
+        """
+        Open a file for reading as a seekable file-like object, which
+        downloads the part of the file that is read rather than the whole
+        file. It can be used as a context manager.
+
+        :param file: The file to open.
+        :type file: dict
+        :returns: a :py:class:`girder.utility.file_handle.FileHandle`.
+        """
+        return FileHandle(file)
+
     def validate(self, doc):
         if doc.get('assetstoreId') is None:
             if 'linkUrl' not in doc:
@@ -192,21 +273,16 @@ class File(acl_mixin.AccessControlMixin, Model):
             False if you plan to delete the item immediately and don't care to
             update its size.
         """
+        deltas = [
+            # Propagate size to direct parent folder
+            ('folder', item['folderId'], sizeIncrement),
+            # Propagate size up to root data node
+            (item['baseParentType'], item['baseParentId'], sizeIncrement)
+        ]
         if updateItemSize:
             # Propagate size up to item
-            self.model('item').increment(query={
-                '_id': item['_id']
-            }, field='size', amount=sizeIncrement, multi=False)
-
-        # Propagate size to direct parent folder
-        self.model('folder').increment(query={
-            '_id': item['folderId']
-        }, field='size', amount=sizeIncrement, multi=False)
-
-        # Propagate size up to root data node
-        self.model(item['baseParentType']).increment(query={
-            '_id': item['baseParentId']
-        }, field='size', amount=sizeIncrement, multi=False)
+            deltas.append(('item', item['_id'], sizeIncrement))
+        self.model('size_ledger').record(deltas)
 
     def createFile(self, creator, item, name, size, assetstore, mimeType=None,
                    saveFile=True, reuseExisting=False):
@@ -270,6 +346,30 @@ class File(acl_mixin.AccessControlMixin, Model):
             item = self.model('item').load(itemId, force=True)
             self.propagateSizeChange(item, fileDoc['size'])
 
+    def _propagateSizesToItems(self, event):
+        """
+        This callback is the counterpart of _propagateSizeToItem for files
+        created together by saveMany. The sizes are summed per item, folder
+        and root, and recorded with a single call to the size ledger.
+        """
+        sizes = collections.Counter()
+        for fileDoc in event.info:
+            if fileDoc.get('itemId') and fileDoc.get('size'):
+                sizes[fileDoc['itemId']] += fileDoc['size']
+        if not sizes:
+            return
+        deltas = collections.Counter()
+        items = self.model('item').find({'_id': {'$in': list(sizes)}}, fields=[
+            'folderId', 'baseParentType', 'baseParentId'])
+        for item in items:
+            size = sizes[item['_id']]
+            deltas[('item', item['_id'])] += size
+            deltas[('folder', item['folderId'])] += size
+            deltas[(item['baseParentType'], item['baseParentId'])] += size
+        self.model('size_ledger').record(
+            (modelName, id, size)
+            for (modelName, id), size in six.viewitems(deltas))
+
     def updateFile(self, file):
         """
         Call this when changing properties of an existing file, such as name
@@ -318,6 +418,54 @@ class File(acl_mixin.AccessControlMixin, Model):
 
         return self.save(file)
 
+    def copyFiles(self, srcFiles, creator, items=None):
+        """
+        Copy a batch of files, creating the new file records with a single
+        query. As in :py:meth:`copyFile`, the new files share the stored data
+        of the originals, except on assetstores whose adapters override
+        copyFile to duplicate it; those copies are run in a pool of
+        copyThreads threads.
+
+        :param srcFiles: The files to copy.
+        :type srcFiles: iterable of dict
+        :param creator: The user copying the files.
+        :param items: a dict mapping the _id of an original item to the new
+            item its files should be assigned to (optional).
+        :type items: dict
+        :returns: the list of new files.
+        """
+        now = datetime.datetime.utcnow()
+        adapters = {}
+        files = []
+        dataCopies = []
+        for srcFile in srcFiles:
+            file = srcFile.copy()
+            del file['_id']
+            file['copied'] = now
+            file['copierId'] = creator['_id']
+            if items and srcFile.get('itemId') in items:
+                file['itemId'] = items[srcFile['itemId']]['_id']
+            assetstoreId = file.get('assetstoreId')
+            if assetstoreId:
+                if assetstoreId not in adapters:
+                    adapters[assetstoreId] = self.getAssetstoreAdapter(file)
+                adapter = adapters[assetstoreId]
+                if (six.get_unbound_function(type(adapter).copyFile) is not
+                        six.get_unbound_function(AbstractAssetstoreAdapter.copyFile)):
+                    dataCopies.append((adapter, srcFile, file))
+            files.append(file)
+
+        if dataCopies:
+            pool = ThreadPool(min(self.copyThreads, len(dataCopies)))
+            try:
+                pool.map(lambda args: args[0].copyFile(args[1], args[2]),
+                         dataCopies)
+            finally:
+                pool.close()
+                pool.join()
+
+        return self.saveMany(files)
+
     def isOrphan(self, file):
         """
         Returns True if this file is orphaned (its item or attached entity is
@@ -17,8 +17,10 @@
 #  limitations under the License.
 ###############################################################################
 
+import collections
 import copy
 import datetime
+import itertools
 import json
 import os
 import six
@@ -28,6 +30,7 @@ from .model_base import AccessControlledModel, ValidationException, \
     GirderException
 from girder import events
 from girder.constants import AccessType
+from girder.utility import batches
 from girder.utility.progress import noProgress, setResponseTimeLimit
 
 
@@ -38,12 +41,23 @@ class Folder(AccessControlledModel):
     its own set of access control policies, but by default the access
     control list is inherited from the folder's parent folder, if it has one.
     Top-level folders are ones whose parent is a user or a collection.
+
+    removeBatchSize is the number of folders, items or files that are deleted
+    together when a folder's contents are removed; Item.removeMany also uses
+    it for the files of the items it deletes.
+
+    copyBatchSize is the number of items that are created together when a
+    folder's contents are copied.
     """
+    removeBatchSize = 1000
+    copyBatchSize = 1000
 
     def initialize(self):
         self.name = 'folder'
         self.ensureIndices(('parentId', 'name', 'lowerName',
-                            ([('parentId', 1), ('name', 1)], {})))
+                            ([('parentId', 1), ('name', 1)], {}),
+                            'access.users.id', 'access.groups.id',
+                            'public', 'ancestorIds'))
         self.ensureTextIndex({
             'name': 10,
             'description': 1
@@ -136,23 +150,111 @@ class Folder(AccessControlledModel):
             doc = self.save(doc, triggerEvents=False)
         if doc is not None and 'lowerName' not in doc:
             doc = self.save(doc, triggerEvents=False)
+        if doc is not None and fields is None and 'ancestorIds' not in doc:
+            doc['ancestorIds'] = self.getAncestorIds(doc)
+            self.update({'_id': doc['_id']}, update={
+                '$set': {'ancestorIds': doc['ancestorIds']}}, multi=False)
 
         return doc
 
-    def getSizeRecursive(self, folder):
+    def getAncestorIds(self, folder):
         """
-        Calculate the total size of the folder by recursing into all of its
-        descendant folders.
+        Return the list of ids of the folders above the given folder, ordered
+        from the top-level folder down to the folder's direct parent. This is
+        normally stored in the ``ancestorIds`` field of the folder; for legacy
+        folders that do not have it yet, it is computed by walking up the
+        hierarchy.
+
+        :param folder: The folder.
+        :type folder: dict
+        :returns: A list of folder ids.
         """
-        size = folder['size']
+        fields = ['parentId', 'parentCollection', 'ancestorIds']
+
+        if 'ancestorIds' in folder:
+            return folder['ancestorIds']
+        if 'parentCollection' not in folder:
+            folder = self.findOne({'_id': folder['_id']}, fields=fields)
+            return self.getAncestorIds(folder) if folder else []
+
+        ancestorIds = []
+        while folder['parentCollection'] == 'folder':
+            folder = self.findOne({'_id': folder['parentId']}, fields=fields)
+            if folder is None:
+                break
+            if 'ancestorIds' in folder:
+                return folder['ancestorIds'] + [folder['_id']] + ancestorIds
+            ancestorIds.insert(0, folder['_id'])
 
-        q = {
-            'parentId': folder['_id'],
-            'parentCollection': 'folder'
-        }
+        return ancestorIds
+
+    def backfillAncestorIds(self, progress=noProgress):
+        """
+        Set the ``ancestorIds`` field of every folder and item in the database,
+        correcting any that are wrong. This walks the hierarchy from the top,
+        issuing one bulk update of the child folders and one of the child items
+        per folder. It is used to migrate databases created before this field
+        existed.
+
+        :param progress: Progress context to update.
+        :type progress: :py:class:`girder.utility.progress.ProgressContext`
+        :returns: The number of documents that were fixed.
+        """
+        fixes = self.update({
+            'parentCollection': {'$ne': 'folder'},
+            'ancestorIds': {'$ne': []}
+        }, {'$set': {'ancestorIds': []}}).modified_count
+
+        progress.update(total=self.find().count(), current=0)
+        stack = list(self.find({'parentCollection': {'$ne': 'folder'}},
+                               fields=['_id']))
+        while stack:
+            folder = stack.pop()
+            progress.update(increment=1)
+            if 'ancestorIds' not in folder:
+                folder['ancestorIds'] = []
+            ancestorIds = folder['ancestorIds'] + [folder['_id']]
+
+            fixes += self.update({
+                'parentId': folder['_id'],
+                'parentCollection': 'folder',
+                'ancestorIds': {'$ne': ancestorIds}
+            }, {'$set': {'ancestorIds': ancestorIds}}).modified_count
+            fixes += self.model('item').update({
+                'folderId': folder['_id'],
+                'ancestorIds': {'$ne': ancestorIds}
+            }, {'$set': {'ancestorIds': ancestorIds}}).modified_count
+
+            for child in self.find({
+                'parentId': folder['_id'],
+                'parentCollection': 'folder'
+            }, fields=['_id']):
+                child['ancestorIds'] = ancestorIds
+                stack.append(child)
+
+        return fixes
 
-        for child in self.find(q):
-            size += self.getSizeRecursive(child)
+    def getSizeRecursive(self, folder, exact=False):
+        """
+        Calculate the total size of the folder by summing the sizes of all of
+        its descendant folders.
+
+        :param folder: The folder.
+        :type folder: dict
+        :param exact: If True, include the size changes that the size ledger
+            has not folded into the folders yet.
+        :type exact: bool
+        """
+        result = list(self.collection.aggregate([
+            {'$match': {'ancestorIds': folder['_id']}},
+            {'$group': {'_id': None, 'size': {'$sum': '$size'}}}
+        ]))
+        size = folder['size'] + (result[0]['size'] if result else 0)
+
+        if exact:
+            ids = [folder['_id']] + [doc['_id'] for doc in self.collection.find(
+                {'ancestorIds': folder['_id']}, projection=['_id'])]
+            size += self.model('size_ledger').getPending('folder', ids)
 
         return size
 
@@ -188,7 +290,7 @@ class Folder(AccessControlledModel):
     def _updateDescendants(self, folderId, updateQuery):
         """
         This helper is used to update all items and folders underneath a
-        folder. This is expensive, so think carefully before using it.
+        folder.
 
         :param folderId: The _id of the folder at the root of the subtree.
         :param updateQuery: The mongo query to apply to all of the children of
@@ -196,21 +298,12 @@ class Folder(AccessControlledModel):
         :type updateQuery: dict
         """
         self.update(query={
-            'parentId': folderId,
-            'parentCollection': 'folder'
+            'ancestorIds': folderId
         }, update=updateQuery, multi=True)
         self.model('item').update(query={
-            'folderId': folderId,
+            'ancestorIds': folderId
         }, update=updateQuery, multi=True)
 
-        q = {
-            'parentId': folderId,
-            'parentCollection': 'folder'
-        }
-        for child in self.find(q):
-            self._updateDescendants(
-                child['_id'], updateQuery)
-
     def _isAncestor(self, ancestor, descendant):
         """
         Returns whether folder "ancestor" is an ancestor of folder "descendant",
@@ -224,15 +317,7 @@ class Folder(AccessControlledModel):
         if ancestor['_id'] == descendant['_id']:
             return True
 
-        if descendant['parentCollection'] != 'folder':
-            return False
-
-        descendant = self.load(descendant['parentId'], force=True)
-
-        if descendant is None:
-            return False
-
-        return self._isAncestor(ancestor, descendant)
+        return ancestor['_id'] in self.getAncestorIds(descendant)
 
     def move(self, folder, parent, parentType):
         """
@@ -251,8 +336,28 @@ class Folder(AccessControlledModel):
             raise ValidationException(
                 'You may not move a folder underneath itself.')
 
+        oldAncestorIds = self.getAncestorIds(folder)
+        if parentType == 'folder':
+            newAncestorIds = self.getAncestorIds(parent) + [parent['_id']]
+        else:
+            newAncestorIds = []
+
         folder['parentId'] = parent['_id']
         folder['parentCollection'] = parentType
+        folder['ancestorIds'] = newAncestorIds
+
+        if oldAncestorIds != newAncestorIds:
+            # Replace the old path prefix of every descendant with the new one
+            for model in (self, self.model('item')):
+                if oldAncestorIds:
+                    model.update({'ancestorIds': folder['_id']}, {
+                        '$pullAll': {'ancestorIds': oldAncestorIds}})
+                if newAncestorIds:
+                    model.update({'ancestorIds': folder['_id']}, {
+                        '$push': {'ancestorIds': {
+                            '$each': newAncestorIds,
+                            '$position': 0
+                        }}})
 
         if parentType == 'folder':
             rootType, rootId = parent['baseParentType'], parent['baseParentId']
@@ -261,16 +366,14 @@ class Folder(AccessControlledModel):
 
         if (folder['baseParentType'], folder['baseParentId']) !=\
            (rootType, rootId):
-            def propagateSizeChange(folder, inc):
-                self.model(folder['baseParentType']).increment(query={
-                    '_id': folder['baseParentId']
-                }, field='size', amount=inc, multi=False)
-
-            totalSize = self.getSizeRecursive(folder)
-            propagateSizeChange(folder, -totalSize)
+            # Pending ledger entries still count against the old root
+            totalSize = self.getSizeRecursive(folder, exact=True)
+            self.model('size_ledger').record([
+                (folder['baseParentType'], folder['baseParentId'], -totalSize),
+                (rootType, rootId, totalSize)
+            ])
             folder['baseParentType'] = rootType
             folder['baseParentId'] = rootId
-            propagateSizeChange(folder, totalSize)
             self._updateDescendants(folder['_id'], {
                 '$set': {
                     'baseParentType': rootType,
@@ -283,7 +386,9 @@ class Folder(AccessControlledModel):
     def clean(self, folder, progress=None, **kwargs):
         """
         Delete all contents underneath a folder recursively, but leave the
-        folder itself.
+        folder itself. The subtree is found once, then its items (with their
+        files) and subfolders are deleted in batches of removeBatchSize, which
+        trigger the ``model.<name>.remove_many`` events.
 
         :param folder: The folder document to delete.
         :type folder: dict
@@ -291,27 +396,54 @@ class Folder(AccessControlledModel):
         :type progress: girder.utility.progress.ProgressContext or None.
         """
         setResponseTimeLimit()
-        # Delete all child items
-        items = self.model('item').find({
-            'folderId': folder['_id']
-        })
-        for item in items:
-            setResponseTimeLimit()
-            self.model('item').remove(item, progress=progress, **kwargs)
-            if progress:
-                progress.update(increment=1, message='Deleted item %s' %
-                                item['name'])
-        # subsequent operations take a long time, so free the cursor's resources
-        items.close()
-
-        # Delete all child folders
-        folders = self.find({
-            'parentId': folder['_id'],
-            'parentCollection': 'folder'
-        })
-        for subfolder in folders:
-            self.remove(subfolder, progress=progress, **kwargs)
-        folders.close()
+        # Find all of the subfolders, one level at a time
+        levels = []
+        parentIds = [folder['_id']]
+        while parentIds:
+            childIds = []
+            for parentBatch in batches(parentIds, self.removeBatchSize):
+                childIds.extend(child['_id'] for child in self.find({
+                    'parentId': {'$in': parentBatch},
+                    'parentCollection': 'folder'
+                }, fields=['_id']))
+            if childIds:
+                levels.append(childIds)
+            parentIds = childIds
+
+        # Delete all items in the subtree
+        folderIds = [folder['_id']] + [id for level in levels for id in level]
+        for folderBatch in batches(folderIds, self.removeBatchSize):
+            items = self.model('item').find({
+                'folderId': {'$in': folderBatch}
+            })
+            for itemBatch in batches(items, self.removeBatchSize):
+                setResponseTimeLimit()
+                self.model('item').removeMany(
+                    itemBatch, progress=progress, **kwargs)
+                if progress:
+                    progress.update(
+                        increment=len(itemBatch),
+                        message='Deleted item %s' % itemBatch[-1]['name'])
+            # subsequent operations take a long time, so free the cursor's
+            # resources
+            items.close()
+
+        # Delete the subfolders and their pending uploads, deepest first
+        for level in reversed(levels):
+            for folderBatch in batches(level, self.removeBatchSize):
+                setResponseTimeLimit()
+                uploads = self.model('upload').find({
+                    'parentId': {'$in': folderBatch},
+                    'parentType': 'folder'
+                })
+                self.model('upload').removeMany(
+                    list(uploads), progress=progress, **kwargs)
+                subfolders = list(self.find({'_id': {'$in': folderBatch}}))
+                self.removeMany(subfolders, progress=progress, **kwargs)
+                if progress and subfolders:
+                    progress.update(
+                        increment=len(subfolders),
+                        message='Deleted folder %s' % subfolders[-1]['name'])
 
     def remove(self, folder, progress=None, **kwargs):
         """
@@ -392,17 +524,13 @@ class Folder(AccessControlledModel):
         }
         q.update(filters)
 
-        # Perform the find; we'll do access-based filtering of the result set
-        # afterward.
-        cursor = self.find(q, sort=sort, **kwargs)
-
-        return self.filterResultsByPermission(
-            cursor=cursor, user=user, level=AccessType.READ, limit=limit,
-            offset=offset)
+        return self.findWithPermissions(
+            q, sort=sort, user=user, level=AccessType.READ, limit=limit,
+            offset=offset, **kwargs)
 
     def createFolder(self, parent, name, description='', parentType='folder',
                      public=None, creator=None, allowRename=False,
-                     reuseExisting=False):
+                     reuseExisting=False, save=True):
         """
         Create a new folder under the given parent.
 
@@ -427,6 +555,9 @@ class Folder(AccessControlledModel):
             under the given parent, return that folder rather than creating a
             new one.
         :type reuseExisting: bool
+        :param save: Whether to validate and save the folder to the database.
+            If False, the unsaved document is returned.
+        :type save: bool
         :returns: The folder document that was created.
         """
         if reuseExisting:
@@ -450,9 +581,11 @@ class Folder(AccessControlledModel):
                     parent, user=creator, force=True)
                 parent['baseParentId'] = pathFromRoot[0]['object']['_id']
                 parent['baseParentType'] = pathFromRoot[0]['type']
+            ancestorIds = self.getAncestorIds(parent) + [parent['_id']]
         else:
             parent['baseParentId'] = parent['_id']
             parent['baseParentType'] = parentType
+            ancestorIds = []
 
         now = datetime.datetime.utcnow()
 
@@ -468,6 +601,7 @@ class Folder(AccessControlledModel):
             'baseParentId': parent['baseParentId'],
             'baseParentType': parent['baseParentType'],
             'parentId': ObjectId(parent['_id']),
+            'ancestorIds': ancestorIds,
             'creatorId': creatorId,
             'created': now,
             'updated': now,
@@ -485,6 +619,9 @@ class Folder(AccessControlledModel):
         if public is not None and isinstance(public, bool):
             self.setPublic(folder, public, save=False)
 
+        if not save:
+            return folder
+
         if allowRename:
             self.validate(folder, allowRename=True)
 
@@ -517,6 +654,12 @@ class Folder(AccessControlledModel):
         if not curPath:
             curPath = []
 
+        if folder.get('ancestorIds') is not None:
+            path = self._parentsToRootFromAncestors(
+                folder, user=user, force=force, level=level)
+            if path is not None:
+                return path + curPath
+
         curParentId = folder['parentId']
         curParentType = folder['parentCollection']
         if curParentType == 'user' or curParentType == 'collection':
@@ -546,6 +689,36 @@ class Folder(AccessControlledModel):
             return self.parentsToRoot(curParentObject, curPath, user=user,
                                       force=force)
 
+    def _parentsToRootFromAncestors(self, folder, user, force, level):
+        """
+        Helper for parentsToRoot that loads all of the ancestor folders of a
+        folder with a single query using its ``ancestorIds`` field.
+
+        :returns: The path from the root, or None if any ancestor is missing.
+        """
+        ancestorIds = folder['ancestorIds']
+        ancestors = {doc['_id']: doc for doc in self.find(
+            {'_id': {'$in': ancestorIds}})}
+        if len(ancestors) != len(ancestorIds):
+            return None
+
+        path = []
+        for ancestorId in reversed(ancestorIds):
+            doc = ancestors[ancestorId]
+            if not force:
+                self.requireAccess(doc, user, level)
+                doc = self.filter(doc, user)
+            path.insert(0, {'type': 'folder', 'object': doc})
+
+        top = ancestors[ancestorIds[0]] if ancestorIds else folder
+        rootType = top['parentCollection']
+        rootObject = self.model(rootType).load(
+            top['parentId'], user=user, level=level, force=force)
+        if not force:
+            rootObject = self.model(rootType).filter(rootObject, user)
+
+        return [{'type': rootType, 'object': rootObject}] + path
+
     def countItems(self, folder):
         """
         Returns the number of items within the given folder.
@@ -564,18 +737,16 @@ class Folder(AccessControlledModel):
         :param level: The required access level, or None to return the raw
             subfolder count.
         """
-        fields = () if level is None else ('access', 'public')
-
-        folders = self.find({
+        q = {
             'parentId': folder['_id'],
             'parentCollection': 'folder'
-        }, fields=fields)
+        }
 
         if level is None:
-            return folders.count()
+            return self.find(q, fields=()).count()
         else:
-            return sum(1 for _ in self.filterResultsByPermission(
-                cursor=folders, user=user, level=level))
+            return self.findWithPermissions(
+                q, fields=(), user=user, level=level).count()
 
     def subtreeCount(self, folder, includeItems=True, user=None, level=None):
         """
@@ -592,22 +763,29 @@ class Folder(AccessControlledModel):
         :type level: AccessLevel
         """
         count = 1
+        q = {'ancestorIds': folder['_id']}
 
+        if level is None:
+            count += self.find(q, fields=()).count()
+            if includeItems:
+                count += self.model('item').find(q, fields=()).count()
+            return count
+
+        # A subfolder is only counted if the user has access to it and to all
+        # of the folders between it and the root of the subtree.
+        descendants = list(self.findWithPermissions(
+            q, fields=['ancestorIds'], user=user, level=level))
+        allowed = {doc['_id'] for doc in descendants}
+        allowed.add(folder['_id'])
+        reachable = [folder['_id']] + [
+            doc['_id'] for doc in descendants if allowed.issuperset(
+                doc['ancestorIds'][doc['ancestorIds'].index(folder['_id']):])]
+
+        count += len(reachable) - 1
         if includeItems:
-            count += self.countItems(folder)
-
-        folders = self.find({
-            'parentId': folder['_id'],
-            'parentCollection': 'folder'
-        }, fields=('access',))
-
-        if level is not None:
-            folders = self.filterResultsByPermission(
-                cursor=folders, user=user, level=level)
-
-        count += sum(self.subtreeCount(subfolder, includeItems=includeItems,
-                                       user=user, level=level)
-                     for subfolder in folders)
+            count += self.model('item').find({
+                'folderId': {'$in': reachable}
+            }, fields=()).count()
 
         return count
 
@@ -727,7 +905,10 @@ class Folder(AccessControlledModel):
                              firstFolder=None):
         """
         Copy the items, subfolders, and extended data of a folder that was just
-        copied.
+        copied. The subfolders of the original folder that the creator can
+        read are found first, one level at a time. Their copies are then
+        created with one query per level, and the items are copied in batches
+        of copyBatchSize, with their files.
 
         :param srcFolder: the original folder.
         :type srcFolder: dict
@@ -741,6 +922,11 @@ class Folder(AccessControlledModel):
                             folders.
         :returns: the new folder document.
         """
+        setResponseTimeLimit()
+        # Find the subtree before copying anything, so that a folder copied
+        # into itself does not copy its own copy
+        levels = self._copyableSubfolders(srcFolder, creator, firstFolder)
+
         # copy metadata and other extension values
         filteredFolder = self.filter(newFolder, creator)
         updated = False
@@ -752,20 +938,32 @@ class Folder(AccessControlledModel):
             newFolder = self.save(newFolder, triggerEvents=False)
         # Give listeners a chance to change things
         events.trigger('model.folder.copy.prepare', (srcFolder, newFolder))
-        # copy items
-        for item in self.childItems(folder=srcFolder):
+        copies = {srcFolder['_id']: newFolder}
+
+        # copy subfolders, one level at a time
+        newLevels = []
+        for level in levels:
             setResponseTimeLimit()
-            self.model('item').copyItem(item, creator, folder=newFolder)
-            if progress:
-                progress.update(increment=1, message='Copied item ' +
-                                item['name'])
-        # copy subfolders
-        for sub in self.childFolders(parentType='folder', parent=srcFolder,
-                                     user=creator):
-            if firstFolder and firstFolder['_id'] == sub['_id']:
-                continue
-            self.copyFolder(sub, parent=newFolder, parentType='folder',
-                            creator=creator, progress=progress)
+            newFolders = self._copySubfolders(level, copies, creator)
+            newLevels.append(newFolders)
+            if progress and newFolders:
+                progress.update(increment=len(newFolders), message='Copied folder ' +
+                                newFolders[-1]['name'])
+
+        # copy items
+        for folderBatch in batches(list(copies), self.copyBatchSize):
+            items = self.model('item').find({'folderId': {'$in': folderBatch}})
+            for itemBatch in batches(items, self.copyBatchSize):
+                setResponseTimeLimit()
+                self.model('item').copyItems(itemBatch, creator, copies)
+                if progress:
+                    progress.update(increment=len(itemBatch), message='Copied item ' +
+                                    itemBatch[-1]['name'])
+            items.close()
+
+        for level in reversed(newLevels):
+            for folder in level:
+                events.trigger('model.folder.copy.after', folder)
         events.trigger('model.folder.copy.after', newFolder)
         if progress:
             progress.update(increment=1, message='Copied folder ' +
@@ -774,6 +972,63 @@ class Folder(AccessControlledModel):
         # Reload to get updated size value
         return self.load(newFolder['_id'], force=True)
 
+    def _copyableSubfolders(self, srcFolder, creator, firstFolder=None):
+        """
+        Find the subfolders of a folder that a user can read, as a list of
+        lists of folders, one per level below the folder.
+        """
+        levels = []
+        parentIds = [srcFolder['_id']]
+        while parentIds:
+            children = []
+            for parentBatch in batches(parentIds, self.copyBatchSize):
+                children.extend(self.findWithPermissions({
+                    'parentId': {'$in': parentBatch},
+                    'parentCollection': 'folder'
+                }, user=creator, level=AccessType.READ))
+            if firstFolder:
+                children = [child for child in children
+                            if child['_id'] != firstFolder['_id']]
+            if children:
+                levels.append(children)
+            parentIds = [child['_id'] for child in children]
+        return levels
+
+    def _copySubfolders(self, srcFolders, copies, creator):
+        """
+        Create the copies of one level of subfolders with a single query. The
+        new parent of each folder is looked up in copies, a dict mapping the
+        _id of each original folder to its copy, which is updated with the
+        new folders.
+
+        :returns: the list of new folders.
+        """
+        pairs = []
+        for sub in srcFolders:
+            if sub['parentId'] not in copies:
+                continue
+            folder = self.createFolder(
+                parent=copies[sub['parentId']], name=sub['name'],
+                description=sub['description'], parentType='folder',
+                creator=creator, save=False)
+            folder['lowerName'] = folder['name'].lower()
+            # copy metadata and other extension values
+            for key in sub:
+                if key not in folder and key != '_id':
+                    folder[key] = copy.deepcopy(sub[key])
+            pairs.append((sub, folder))
+        self.saveMany([folder for sub, folder in pairs], validate=False)
+
+        newFolders = []
+        for sub, folder in pairs:
+            # Folders whose save event was prevented are not created
+            if '_id' in folder:
+                copies[sub['_id']] = folder
+                # Give listeners a chance to change things
+                events.trigger('model.folder.copy.prepare', (sub, folder))
+                newFolders.append(folder)
+        return newFolders
+
     def setAccessList(self, doc, access, save=False, recurse=False, user=None,
                       progress=noProgress, setPublic=None):
         """
@@ -838,23 +1093,19 @@ class Folder(AccessControlledModel):
         :param doc: The folder.
         :type doc: dict
         """
-        size = 0
         fixes = 0
-        # recursively fix child folders but don't include their size
-        children = self.model('folder').find({
-            'parentId': doc['_id'],
-            'parentCollection': 'folder'
-        })
-        for child in children:
-            _, f = self.model('folder').updateSize(child)
-            fixes += f
-        # get correct size from child items
-        for item in self.childItems(doc):
+        # get correct sizes of all folders in the subtree from their items
+        folderSizes = collections.defaultdict(int)
+        for item in self.model('item').find({'ancestorIds': doc['_id']}):
             s, f = self.model('item').updateSize(item)
-            size += s
+            folderSizes[item['folderId']] += s
             fixes += f
-        # fix value if incorrect
-        if size != doc.get('size'):
-            self.update({'_id': doc['_id']}, update={'$set': {'size': size}})
-            fixes += 1
-        return size, fixes
+        # fix values if incorrect
+        folders = self.find({'ancestorIds': doc['_id']}, fields=['size'])
+        for folder in itertools.chain([doc], folders):
+            size = folderSizes[folder['_id']]
+            if size != folder.get('size'):
+                self.update({'_id': folder['_id']}, update={
+                    '$set': {'size': size}})
+                fixes += 1
+        return folderSizes[doc['_id']], fixes
@@ -363,6 +363,36 @@ class Group(AccessControlledModel):
             return self._hasUserAccess(doc.get('access', {}).get('users', []),
                                        user['_id'], level)
 
+    def permissionClauses(self, user=None, level=AccessType.READ):
+        """
+        This overrides the default AccessControlledModel behavior to build a
+        query clause matching the optimized access rules of ``hasAccess``.
+
+        :param user: The user to check against.
+        :type user: dict
+        :param level: The access level.
+        :type level: AccessType
+        :returns: A query dict, which is empty if no filtering is required.
+        """
+        if user is None:
+            if level == AccessType.READ:
+                return {'public': True}
+            return {'_id': {'$in': []}}
+        elif user['admin']:
+            return {}
+        elif level == AccessType.READ:
+            groupIds = list(user.get('groups', []))
+            groupIds += [i['groupId'] for i in user.get('groupInvites', [])]
+            return {'$or': [
+                {'public': True},
+                {'_id': {'$in': groupIds}}
+            ]}
+        else:
+            return {'access.users': {'$elemMatch': {
+                'id': user['_id'],
+                'level': {'$gte': level}
+            }}}
+
     def getAccessLevel(self, doc, user):
         """
         Return the maximum access level for a given user on the group.
@@ -17,6 +17,7 @@
 #  limitations under the License.
 ###############################################################################
 
+import collections
 import copy
 import datetime
 import json
@@ -28,7 +29,7 @@ from .model_base import Model, ValidationException, GirderException
 from girder import events
 from girder import logger
 from girder.constants import AccessType
-from girder.utility import acl_mixin
+from girder.utility import acl_mixin, batches
 
 
 class Item(acl_mixin.AccessControlMixin, Model):
@@ -39,7 +40,7 @@ class Item(acl_mixin.AccessControlMixin, Model):
 
     def initialize(self):
         self.name = 'item'
-        self.ensureIndices(('folderId', 'name', 'lowerName',
+        self.ensureIndices(('folderId', 'name', 'lowerName', 'ancestorIds',
                             ([('folderId', 1), ('name', 1)], {})))
         self.ensureTextIndex({
             'name': 10,
@@ -122,9 +123,28 @@ class Item(acl_mixin.AccessControlMixin, Model):
             doc = self.save(doc, triggerEvents=False)
         if doc is not None and 'lowerName' not in doc:
             doc = self.save(doc, triggerEvents=False)
+        if doc is not None and fields is None and 'ancestorIds' not in doc:
+            doc['ancestorIds'] = self.getAncestorIds(doc)
+            self.update({'_id': doc['_id']}, update={
+                '$set': {'ancestorIds': doc['ancestorIds']}}, multi=False)
 
         return doc
 
+    def getAncestorIds(self, item):
+        """
+        Return the list of ids of the folders above the given item, ordered
+        from the top-level folder down to the item's own folder.
+
+        :param item: The item.
+        :type item: dict
+        :returns: A list of folder ids.
+        """
+        if 'ancestorIds' in item:
+            return item['ancestorIds']
+
+        return self.model('folder').getAncestorIds(
+            {'_id': item['folderId']}) + [item['folderId']]
+
     def move(self, item, folder):
         """
         Move the given item from its current folder into another folder.
@@ -134,24 +154,25 @@ class Item(acl_mixin.AccessControlMixin, Model):
         :param folder: The folder to move the item into.
         :type folder: dict.
         """
-        self.propagateSizeChange(item, -item['size'])
+        # Pending ledger entries still count against the old folder and root
+        size = self.model('size_ledger').getSize('item', item, exact=True)
+        self.propagateSizeChange(item, -size)
 
         item['folderId'] = folder['_id']
         item['baseParentType'] = folder['baseParentType']
         item['baseParentId'] = folder['baseParentId']
+        item['ancestorIds'] = self.model('folder').getAncestorIds(folder) + [
+            folder['_id']]
 
-        self.propagateSizeChange(item, item['size'])
+        self.propagateSizeChange(item, size)
 
         return self.save(item)
 
     def propagateSizeChange(self, item, inc):
-        self.model('folder').increment(query={
-            '_id': item['folderId']
-        }, field='size', amount=inc, multi=False)
-
-        self.model(item['baseParentType']).increment(query={
-            '_id': item['baseParentId']
-        }, field='size', amount=inc, multi=False)
+        self.model('size_ledger').record([
+            ('folder', item['folderId'], inc),
+            (item['baseParentType'], item['baseParentId'], inc)
+        ])
 
     def recalculateSize(self, item):
         """
@@ -220,8 +241,48 @@ class Item(acl_mixin.AccessControlMixin, Model):
         # Delete the item itself
         Model.remove(self, item)
 
+    def removeMany(self, items, **kwargs):
+        """
+        Delete a batch of items, along with their files and pending uploads,
+        using bulk deletes. The total size of the deleted files is subtracted
+        from each parent folder and root with one update apiece.
+
+        :param items: The item documents to delete.
+        :type items: list of dict
+        :returns: the list of ids of the removed items.
+        """
+        itemsById = {item['_id']: item for item in items}
+        sizes = collections.Counter()
+
+        files = self.model('file').find({
+            'itemId': {'$in': list(itemsById)}
+        })
+        for fileBatch in batches(files, self.model('folder').removeBatchSize):
+            for file in fileBatch:
+                # files that are linkUrls might not have a size field
+                if file.get('size'):
+                    item = itemsById[file['itemId']]
+                    sizes[('folder', item['folderId'])] += file['size']
+                    sizes[(item['baseParentType'], item['baseParentId'])] += \
+                        file['size']
+            self.model('file').removeMany(fileBatch, **kwargs)
+        files.close()
+
+        uploads = self.model('upload').find({
+            'parentId': {'$in': list(itemsById)},
+            'parentType': 'item'
+        })
+        self.model('upload').removeMany(list(uploads), **kwargs)
+
+        ids = Model.removeMany(self, items, **kwargs)
+
+        self.model('size_ledger').record(
+            (modelName, id, -size)
+            for (modelName, id), size in six.viewitems(sizes))
+        return ids
+
     def createItem(self, name, creator, folder, description='',
-                   reuseExisting=False):
+                   reuseExisting=False, save=True):
         """
         Create a new item. The creator will be given admin access to it.
 
@@ -236,6 +297,9 @@ class Item(acl_mixin.AccessControlMixin, Model):
             under the given folder, return that item rather than creating a
             new one.
         :type reuseExisting: bool
+        :param save: Whether to save the item to the database. If False, the
+            unsaved document is returned.
+        :type save: bool
         :returns: The item document that was created.
         """
         if reuseExisting:
@@ -259,17 +323,22 @@ class Item(acl_mixin.AccessControlMixin, Model):
             folder['baseParentType'] = pathFromRoot[0]['type']
             folder['baseParentId'] = pathFromRoot[0]['object']['_id']
 
-        return self.save({
+        item = {
             'name': self._validateString(name),
             'description': self._validateString(description),
             'folderId': ObjectId(folder['_id']),
+            'ancestorIds': self.model('folder').getAncestorIds(folder) + [
+                ObjectId(folder['_id'])],
             'creatorId': creator['_id'],
             'baseParentType': folder['baseParentType'],
             'baseParentId': folder['baseParentId'],
             'created': now,
             'updated': now,
             'size': 0
-        })
+        }
+        if save:
+            item = self.save(item)
+        return item
 
     def updateItem(self, item):
         """
@@ -376,14 +445,66 @@ class Item(acl_mixin.AccessControlMixin, Model):
         # Give listeners a chance to change things
         events.trigger('model.item.copy.prepare', (srcItem, newItem))
         # copy files
-        for file in self.childFiles(item=srcItem):
-            self.model('file').copyFile(file, creator=creator, item=newItem)
+        self.model('file').copyFiles(
+            self.childFiles(item=srcItem), creator=creator,
+            items={srcItem['_id']: newItem})
 
         # Reload to get updated size value
         newItem = self.load(newItem['_id'], force=True)
         events.trigger('model.item.copy.after', newItem)
         return newItem
 
+    def copyItems(self, srcItems, creator, folders):
+        """
+        Copy a batch of items into new folders, including duplicating files
+        and metadata. The items are created with one query, and their files
+        with another. The names of the items are not checked for uniqueness,
+        so each destination folder should be a new copy of the original
+        item's folder. The ``model.item.copy.prepare`` and
+        ``model.item.copy.after`` events are triggered for each item when
+        something is bound to them.
+
+        :param srcItems: the items to copy.
+        :type srcItems: list of dict
+        :param creator: the user who will own the copied items.
+        :param folders: a dict mapping the _id of each original item's folder
+            to the folder the copy should be created in.
+        :type folders: dict
+        :returns: the list of new items.
+        """
+        newItems = []
+        for srcItem in srcItems:
+            newItem = self.createItem(
+                name=srcItem['name'], creator=creator,
+                folder=folders[srcItem['folderId']],
+                description=srcItem['description'], save=False)
+            newItem['lowerName'] = newItem['name'].lower()
+            # copy metadata and other extension values
+            for key in srcItem:
+                if key not in newItem and key != '_id':
+                    newItem[key] = copy.deepcopy(srcItem[key])
+            # add a reference to the original item
+            newItem['copyOfItem'] = srcItem['_id']
+            newItems.append(newItem)
+        newItems = self.saveMany(newItems, validate=False)
+        copies = {item['copyOfItem']: item for item in newItems}
+
+        if events.hasHandlers('model.item.copy.prepare'):
+            for srcItem in srcItems:
+                if srcItem['_id'] in copies:
+                    events.trigger('model.item.copy.prepare',
+                                   (srcItem, copies[srcItem['_id']]))
+        # copy files
+        files = self.model('file').find({'itemId': {'$in': list(copies)}})
+        self.model('file').copyFiles(files, creator=creator, items=copies)
+
+        if events.hasHandlers('model.item.copy.after'):
+            # Reload to get updated size values
+            for newItem in self.find({'_id': {'$in': [
+                    item['_id'] for item in newItems]}}):
+                events.trigger('model.item.copy.after', newItem)
+        return newItems
+
     def fileList(self, doc, user=None, path='', includeMetadata=False,
                  subpath=True, mimeFilter=None, data=True):
         """
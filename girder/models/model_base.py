@@ -18,6 +18,7 @@
 ###############################################################################
 
 import copy
+import datetime
 import functools
 import itertools
 import pymongo
@@ -26,11 +27,13 @@ import six
 
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
-from pymongo.errors import WriteError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, WriteError
 from girder import events, logprint
 from girder.constants import AccessType, CoreEventHandler, TEXT_SCORE_SORT_MAX
 from girder.external.mongodb_proxy import MongoProxy
 from girder.models import getDbConnection
+from girder.utility import batches
 from girder.utility.model_importer import ModelImporter
 
 # pymongo3 complains about extra kwargs to find(), so we must filter them.
@@ -44,7 +47,11 @@ class Model(ModelImporter):
     persistence layer. Each collection in the database should have its own
     model. Methods that deal with database interaction belong in the
     model layer.
+
+    metadataBatchSize is the number of documents updated with one bulk write
+    by setMetadataBulk.
     """
+    metadataBatchSize = 1000
 
     def __init__(self):
         self.name = None
@@ -389,6 +396,57 @@ class Model(ModelImporter):
 
         return document
 
+    def saveMany(self, documents, validate=True, triggerEvents=True):
+        """
+        Create a batch of new documents with a single query. The per-document
+        ``validate`` and ``save`` events are triggered as in :py:meth:`save`,
+        but are skipped when nothing is bound to them; documents whose
+        ``save`` event has its default prevented are not inserted. Instead of
+        the per-document ``save.created`` and ``save.after`` events, one
+        ``model.<name>.save_many.created`` event is triggered whose info is
+        the list of new documents.
+
+        :param documents: The documents to create. They must not have an _id.
+        :type documents: list of dict
+        :param validate: Whether to call the model's validate() on each
+            document before saving.
+        :type validate: bool
+        :param triggerEvents: Whether to trigger events for validate and
+            pre- and post-save hooks.
+        :returns: the list of documents that were created.
+        """
+        prefix = '.'.join(('model', self.name, ''))
+        validateEvents = triggerEvents and events.hasHandlers(prefix + 'validate')
+        saveEvents = triggerEvents and events.hasHandlers(prefix + 'save')
+
+        created = []
+        for document in documents:
+            validateDocument = validate
+            if validate and validateEvents:
+                event = events.trigger(prefix + 'validate', document)
+                if event.defaultPrevented:
+                    validateDocument = False
+            if validateDocument:
+                document = self.validate(document)
+            if saveEvents:
+                event = events.trigger(prefix + 'save', document)
+                if event.defaultPrevented:
+                    continue
+            created.append(document)
+
+        if not created:
+            return created
+        try:
+            result = self.collection.insert_many(created)
+        except BulkWriteError as e:
+            raise ValidationException('Database save failed: %s' % e.details)
+        for document, id in zip(created, result.inserted_ids):
+            document['_id'] = id
+
+        if triggerEvents:
+            events.trigger(prefix + 'save_many.created', created)
+        return created
+
     def update(self, query, update, multi=True):
         """
         This method should be used for updating multiple documents in the
@@ -413,6 +471,64 @@ class Model(ModelImporter):
         else:
             return self.collection.update_one(query, update)
 
+    def setMetadataBulk(self, updates=None, query=None, metadata=None):
+        """
+        Set metadata on many documents at once, with bulk writes that neither
+        load nor validate the documents. Either pass ``updates`` to give each
+        document its own metadata, or ``query`` and ``metadata`` to set the
+        same metadata on every document that matches the query. Metadata
+        fields set to None are removed. Rather than a save event per
+        document, a single ``model.<name>.setMetadataBulk.after`` event is
+        triggered, with either the updates or the query and metadata as its
+        info.
+
+        :param updates: (document id, metadata dict) pairs.
+        :type updates: iterable
+        :param query: The search query for the documents to update.
+        :type query: dict
+        :param metadata: The metadata to set on the documents matching query.
+        :type metadata: dict
+        :returns: the number of documents that were found.
+        """
+        now = datetime.datetime.utcnow()
+        if query is not None:
+            matched = self.collection.update_many(
+                query, self._metadataUpdate(metadata, now)).matched_count
+            info = {'query': query, 'metadata': metadata}
+        else:
+            updates = list(updates)
+            matched = 0
+            # Validate all of the metadata before writing any of it
+            ops = [UpdateOne({'_id': id}, self._metadataUpdate(meta, now))
+                   for id, meta in updates]
+            for batch in batches(ops, self.metadataBatchSize):
+                matched += self.collection.bulk_write(
+                    batch, ordered=False).matched_count
+            info = {'updates': updates}
+
+        events.trigger('model.%s.setMetadataBulk.after' % self.name, info)
+        return matched
+
+    def _metadataUpdate(self, metadata, updated):
+        """
+        Build the update that sets metadata fields on a document, removing
+        those that are set to None, and validate the metadata keys.
+        """
+        update = {'$set': {'updated': updated}}
+        for key, value in six.viewitems(metadata):
+            if not key:
+                raise ValidationException(
+                    'Key names must be at least one character long.')
+            if '.' in key or key[0] == '$':
+                raise ValidationException(
+                    'The key name %s must not contain a period or begin '
+                    'with a dollar sign.' % key)
+            if value is None:
+                update.setdefault('$unset', {})['meta.' + key] = ''
+            else:
+                update['$set']['meta.' + key] = value
+        return update
+
     def increment(self, query, field, amount, **kwargs):
         """
         This is a specialization of the update method that atomically increments
@@ -450,6 +566,48 @@ class Model(ModelImporter):
         if not event.defaultPrevented and not kwargsEvent.defaultPrevented:
             return self.collection.delete_one({'_id': document['_id']})
 
+    def removeMany(self, documents, **kwargs):
+        """
+        Delete a batch of documents with a single query. This triggers one
+        ``model.<name>.remove_many`` event whose info holds the list of
+        documents and the kwargs; preventing its default keeps every document
+        in the batch. Handlers bound to the per-document ``remove`` and
+        ``remove_with_kwargs`` events are still called for each document,
+        but those events are skipped when nothing is bound to them.
+
+        :param documents: the documents to remove; each must have its _id set.
+        :type documents: list of dict
+        :returns: the list of ids of the removed documents.
+        """
+        if not documents:
+            return []
+
+        prefix = '.'.join(('model', self.name, ''))
+        event = events.trigger(prefix + 'remove_many', {
+            'documents': documents,
+            'kwargs': kwargs
+        })
+        if event.defaultPrevented:
+            return []
+
+        perDocument = (events.hasHandlers(prefix + 'remove') or
+                       events.hasHandlers(prefix + 'remove_with_kwargs'))
+        ids = []
+        for document in documents:
+            if perDocument:
+                event = events.trigger(prefix + 'remove', document)
+                kwargsEvent = events.trigger(prefix + 'remove_with_kwargs', {
+                    'document': document,
+                    'kwargs': kwargs
+                })
+                if event.defaultPrevented or kwargsEvent.defaultPrevented:
+                    continue
+            ids.append(document['_id'])
+
+        if ids:
+            self.collection.delete_many({'_id': {'$in': ids}})
+        return ids
+
     def removeWithQuery(self, query):
         """
         Remove all documents matching a given query from the collection.
@@ -947,6 +1105,80 @@ class AccessControlledModel(Model):
 
         return False
 
+    def permissionClauses(self, user=None, level=AccessType.READ):
+        """
+        Build a MongoDB query clause that matches exactly the documents in
+        this collection that the given user has the given access level on.
+        This mirrors the logic of :py:func:`hasAccess`, so models that override
+        ``hasAccess`` must override this method as well.
+
+        :param user: The user to check against.
+        :type user: dict or None
+        :param level: The access level.
+        :type level: AccessType
+        :returns: A query dict, which is empty if no filtering is required.
+        """
+        if user is not None and user['admin']:
+            return {}
+
+        clauses = []
+        if level <= AccessType.READ:
+            clauses.append({'public': True})
+
+        if user is not None:
+            clauses.append({'access.users': {'$elemMatch': {
+                'id': user['_id'],
+                'level': {'$gte': level}
+            }}})
+            if user.get('groups'):
+                clauses.append({'access.groups': {'$elemMatch': {
+                    'id': {'$in': user['groups']},
+                    'level': {'$gte': level}
+                }}})
+
+        if not clauses:
+            # Nothing can match, e.g. anonymous users requesting write access
+            return {'_id': {'$in': []}}
+        if len(clauses) == 1:
+            return clauses[0]
+        return {'$or': clauses}
+
+    def findWithPermissions(self, query=None, offset=0, limit=0, timeout=None,
+                            fields=None, sort=None, user=None,
+                            level=AccessType.READ, **kwargs):
+        """
+        Search the collection by a set of parameters, only returning results
+        that the given user has the given access level on. Unlike
+        :py:func:`filterResultsByPermission`, access filtering, offset, and
+        limit are all applied by the database.
+
+        Takes the same parameters as :py:func:`Model.find`, plus:
+
+        :param user: The user to check policies against.
+        :type user: dict or None
+        :param level: The access level.
+        :type level: AccessType
+        :returns: A pymongo database cursor.
+        """
+        return self.find(
+            self._addPermissionClauses(query, user, level), offset=offset,
+            limit=limit, timeout=timeout, fields=fields, sort=sort, **kwargs)
+
+    def _addPermissionClauses(self, query, user, level):
+        """
+        Private helper that returns a copy of a query with the permission
+        clauses for the given user and level added to it.
+        """
+        query = dict(query or {})
+        permQuery = self.permissionClauses(user, level)
+
+        if permQuery:
+            # Use $and so that we don't clobber any $or, $text, etc. clauses
+            # of the original query.
+            query['$and'] = query.get('$and', []) + [permQuery]
+
+        return query
+
     def requireAccess(self, doc, user=None, level=AccessType.READ):
         """
         This wrapper just provides a standard way of throwing an
@@ -1033,10 +1265,9 @@ class AccessControlledModel(Model):
         :param sort: The sort order
         :type sort: List of (key, order) tuples
         """
-        cursor = self.find({}, sort=sort)
-        return self.filterResultsByPermission(
-            cursor=cursor, user=user, level=AccessType.READ, limit=limit,
-            offset=offset)
+        return self.findWithPermissions(
+            {}, user=user, level=AccessType.READ, limit=limit, offset=offset,
+            sort=sort)
 
     def copyAccessPolicies(self, src, dest, save=False):
         """
@@ -1113,12 +1344,10 @@ class AccessControlledModel(Model):
         :param level: The access level to require.
         :type level: girder.constants.AccessType
         """
-        filters = filters or {}
-
-        cursor = Model.textSearch(
-            self, query=query, filters=filters, sort=sort, fields=fields)
-        return self.filterResultsByPermission(
-            cursor, user=user, level=level, limit=limit, offset=offset)
+        return Model.textSearch(
+            self, query=query, sort=sort, fields=fields, limit=limit,
+            offset=offset, filters=self._addPermissionClauses(
+                filters, user, level))
 
     def prefixSearch(self, query, user=None, filters=None, limit=0, offset=0,
                      sort=None, fields=None, level=AccessType.READ):
@@ -1147,12 +1376,10 @@ class AccessControlledModel(Model):
         :returns: A pymongo cursor. It is left to the caller to build the
             results from the cursor.
         """
-        filters = filters or {}
-
-        cursor = Model.prefixSearch(
-            self, query=query, filters=filters, sort=sort, fields=fields)
-        return self.filterResultsByPermission(
-            cursor, user=user, level=level, limit=limit, offset=offset)
+        return Model.prefixSearch(
+            self, query=query, sort=sort, fields=fields, limit=limit,
+            offset=offset, filters=self._addPermissionClauses(
+                filters, user, level))
 
 
 class AccessException(Exception):
@@ -22,6 +22,7 @@ import six
 import time
 
 from .model_base import Model
+from girder.utility.notification_bus import getNotificationBus
 
 
 class ProgressState(object):
@@ -52,10 +53,22 @@ class Notification(Model):
         self.name = 'notification'
         self.ensureIndices(('userId', 'time', 'updated', 'tokenId'))
         self.ensureIndex(('expires', {'expireAfterSeconds': 0}))
+        self._progressStats = {'updates': 0, 'writes': 0}
 
     def validate(self, doc):
         return doc
 
+    def save(self, document, *args, **kwargs):
+        """
+        Save the notification, then wake any streams waiting on notifications
+        for its user or token.
+        """
+        document = super(Notification, self).save(document, *args, **kwargs)
+        key = document.get('userId', document.get('tokenId'))
+        if key is not None:
+            getNotificationBus().publish(key)
+        return document
+
     def createNotification(self, type, data, user, expires=None, token=None):
         """
         Create a generic notification.
@@ -169,34 +182,93 @@ class Notification(Model):
             if field in ('total', 'current', 'state', 'message'):
                 record['data'][field] = value
 
-        now = datetime.datetime.utcnow()
-
-        if 'expires' in kwargs:
-            expires = kwargs['expires']
+        if save:
+            return self.flushProgress(
+                record, fields=('total', 'current', 'state', 'message'),
+                expires=kwargs.get('expires'))
         else:
-            expires = now + datetime.timedelta(hours=1)
+            self._touchProgress(record, kwargs.get('expires'))
+            self._progressStats['updates'] += 1
+            return record
 
+    def _touchProgress(self, record, expires=None):
+        now = datetime.datetime.utcnow()
         record['updated'] = now
-        record['expires'] = expires
+        record['expires'] = expires or now + datetime.timedelta(hours=1)
         record['updatedTime'] = time.time()
-        if save:
-            # Only update the time estimate if we are also saving
-            if (record['updatedTime'] > record['startTime'] and
-                    record['data']['estimateTime']):
-                if 'estimatedTotalTime' in record:
-                    del record['estimatedTotalTime']
-                try:
-                    total = float(record['data']['total'])
-                    current = float(record['data']['current'])
-                    if total >= current and total > 0 and current > 0:
-                        record['estimatedTotalTime'] = (total * (
-                            record['updatedTime'] - record['startTime']) /
-                            current)
-                except ValueError:
-                    pass
-            return self.save(record)
+
+    def flushProgress(self, record, fields=(), increment=0, updates=1,
+                      expires=None):
+        """
+        Write the changes to a progress record to the database. Rather than
+        saving the whole document, only the given data fields, the time stamps
+        and the time estimate are set, and the current value is incremented
+        on the database side, which allows several updates to be coalesced
+        into one write.
+
+        :param record: The progress record, which must already reflect the
+            changes being written.
+        :type record: dict
+        :param fields: The names of the data fields to set from the record.
+        :type fields: list of str
+        :param increment: Amount to increment the stored current value by.
+            Ignored if "current" is in fields.
+        :type increment: int, long, or float
+        :param updates: The number of progress updates this write is for,
+            which is used to count the writes avoided by coalescing.
+        :type updates: int
+        :param expires: Set a custom (UTC) expiration time on the record.
+            Default is one hour from the current time.
+        :type expires: datetime
+        """
+        self._touchProgress(record, expires)
+        update = {'$set': {
+            'updated': record['updated'],
+            'expires': record['expires'],
+            'updatedTime': record['updatedTime']
+        }}
+        for field in fields:
+            update['$set']['data.' + field] = record['data'][field]
+        if increment and 'current' not in fields:
+            update['$inc'] = {'data.current': increment}
+
+        if (record['updatedTime'] > record['startTime'] and
+                record['data']['estimateTime']):
+            record.pop('estimatedTotalTime', None)
+            try:
+                total = float(record['data']['total'])
+                current = float(record['data']['current'])
+                if total >= current and total > 0 and current > 0:
+                    record['estimatedTotalTime'] = (total * (
+                        record['updatedTime'] - record['startTime']) /
+                        current)
+            except ValueError:
+                pass
+        if 'estimatedTotalTime' in record:
+            update['$set']['estimatedTotalTime'] = record['estimatedTotalTime']
         else:
-            return record
+            update['$unset'] = {'estimatedTotalTime': True}
+
+        self.update({'_id': record['_id']}, update, multi=False)
+        self._progressStats['updates'] += updates
+        self._progressStats['writes'] += 1
+
+        key = record.get('userId', record.get('tokenId'))
+        if key is not None:
+            getNotificationBus().publish(key)
+        return record
+
+    def progressStats(self):
+        """
+        Report on how many progress updates were made, and how many database
+        writes they took.
+
+        :returns: a dictionary with the number of updates, writes, and the
+            number of writes saved by coalescing updates.
+        """
+        stats = dict(self._progressStats)
+        stats['saved'] = stats['updates'] - stats['writes']
+        return stats
 
     def get(self, user, since=None, token=None):
         """
@@ -19,8 +19,11 @@
 
 from collections import OrderedDict
 import cherrypy
+import copy
 import pymongo
 import six
+import threading
+import time
 
 from ..constants import GIRDER_ROUTE_ID, GIRDER_STATIC_ROUTE_ID, SettingDefault, SettingKey
 from .model_base import Model, ValidationException
@@ -33,9 +36,27 @@ from bson.objectid import ObjectId
 class Setting(Model):
     """
     This model represents server-wide configuration settings as key/value pairs.
+
+    Setting values are cached in memory, since many of them are read on every
+    request. Cached entries expire after ``cacheTtl`` seconds. Calls to
+    :py:meth:`set` and :py:meth:`unset` clear the cache and increment a version
+    counter stored in the database; other server processes check this counter
+    at most every ``cachePollInterval`` seconds and clear their own cache when
+    it changes.
     """
+    cacheTtl = 60
+    cachePollInterval = 1
+
     def initialize(self):
         self.name = 'setting'
+        self._cache = {}
+        self._cacheLock = threading.Lock()
+        # Incremented by every invalidation, so that a value which was read
+        # before an invalidation is not cached after it
+        self._cacheGeneration = 0
+        self._cacheVersion = None
+        self._cacheLastPoll = 0
+        self._cacheStats = {'hits': 0, 'misses': 0, 'invalidations': 0}
         # We had been asking for an index on key, like so:
         #   self.ensureIndices(['key'])
         # We really want the index to be unique, which could be done:
@@ -50,6 +71,9 @@ class Setting(Model):
         extant index on key and removing duplicate keys if necessary.
         """
         super(Setting, self).reconnect()
+        self._versionCollection = self.database['setting_version']
+        self._cacheLastPoll = 0
+        self.invalidateCache(broadcast=False)
         try:
             indices = self.collection.index_information()
         except pymongo.errors.OperationFailure:
@@ -106,13 +130,84 @@ class Setting(Model):
         :param default: If no such setting exists, returns this value instead.
         :returns: The value, or the default value if the key is not found.
         """
-        setting = self.findOne({'key': key})
-        if setting is None:
+        found, value = self._getCached(key)
+        if not found:
             if default is '__default__':
                 default = self.getDefault(key)
             return default
         else:
-            return setting['value']
+            return value
+
+    def _getCached(self, key):
+        """
+        Look up a setting through the cache.
+
+        :param key: The key identifying the setting.
+        :returns: a tuple of whether the setting is stored in the database and
+            a copy of its value.
+        """
+        now = time.time()
+        if now - self._cacheLastPoll >= self.cachePollInterval:
+            self._pollCacheVersion(now)
+        entry = self._cache.get(key)
+        if entry is not None and entry[2] > now:
+            self._cacheStats['hits'] += 1
+        else:
+            self._cacheStats['misses'] += 1
+            with self._cacheLock:
+                generation = self._cacheGeneration
+            setting = self.findOne({'key': key}, fields=['value'])
+            entry = (setting is not None, setting['value'] if setting else None,
+                     now + self.cacheTtl)
+            with self._cacheLock:
+                if generation == self._cacheGeneration:
+                    self._cache[key] = entry
+        found, value = entry[:2]
+        if not isinstance(value, six.string_types + six.integer_types + (float, bool)):
+            # Callers are free to modify the values they are given.
+            value = copy.deepcopy(value)
+        return found, value
+
+    def _pollCacheVersion(self, now):
+        """
+        Check the shared version counter and clear the cache if another
+        process has changed a setting since it was last checked.
+        """
+        self._cacheLastPoll = now
+        doc = self._versionCollection.find_one({'_id': 'setting'})
+        version = doc['version'] if doc else None
+        if version != self._cacheVersion:
+            self._cacheVersion = version
+            self.invalidateCache(broadcast=False)
+
+    def invalidateCache(self, broadcast=True):
+        """
+        Clear the cache of setting values.
+
+        :param broadcast: If True, also increment the shared version counter so
+            that other server processes clear their caches.
+        :type broadcast: bool
+        """
+        with self._cacheLock:
+            self._cache = {}
+            self._cacheGeneration += 1
+            self._cacheStats['invalidations'] += 1
+        if broadcast:
+            self._versionCollection.update_one(
+                {'_id': 'setting'}, {'$inc': {'version': 1}}, upsert=True)
+            # Pick up the new version on the next lookup.
+            self._cacheLastPoll = 0
+
+    def cacheStats(self):
+        """
+        Report on the usage of the setting cache.
+
+        :returns: a dictionary with the number of cache hits, misses,
+            invalidations, and the number of currently cached keys.
+        """
+        stats = dict(self._cacheStats)
+        stats['size'] = len(self._cache)
+        return stats
 
     def set(self, key, value):
         """
@@ -133,7 +228,9 @@ class Setting(Model):
         else:
             setting['value'] = value
 
-        return self.save(setting)
+        setting = self.save(setting)
+        self.invalidateCache()
+        return setting
 
     def unset(self, key):
         """
@@ -145,6 +242,7 @@ class Setting(Model):
         """
         for setting in self.find({'key': key}):
             self.remove(setting)
+        self.invalidateCache()
 
     def getDefault(self, key):
         """
@@ -361,6 +459,14 @@ class Setting(Model):
             pass  # We want to raise the ValidationException
         raise ValidationException('Upload minimum chunk size must be an integer >= 0.', 'value')
 
+    @staticmethod
+    @setting_utilities.validator(SettingKey.UPLOAD_DEDUPLICATION_POLICY)
+    def validateCoreUploadDeduplicationPolicy(doc):
+        if doc['value'] not in ('never', 'admin', 'all'):
+            raise ValidationException(
+                'Upload deduplication policy must be one of "never", "admin", '
+                'or "all".', 'value')
+
     @staticmethod
     @setting_utilities.validator(SettingKey.USER_DEFAULT_FOLDERS)
     def validateCoreUserDefaultFolders(doc):
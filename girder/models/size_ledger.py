@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import cherrypy
+import collections
+import datetime
+import pymongo
+import six
+import threading
+import time
+
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+
+from .model_base import Model
+from girder import logger
+from girder.utility import config
+from girder.utility.progress import noProgress
+
+
+class SizeLedger(Model):
+    """
+    This model keeps track of changes to the size field of items, folders,
+    collections and users. Every file that is created, replaced or deleted
+    changes the size of its item, folder and root, and the root in
+    particular is updated by every upload beneath it.
+
+    If the ``size_ledger_interval`` value of the ``database`` config section
+    is set to a number of seconds, size changes are appended to this
+    collection instead, and folded into the size fields with one bulk write
+    per collection at that interval. Sizes read from the documents may then
+    lag behind; use :py:meth:`getSize` with exact=True where that matters.
+    When the interval is 0 (the default), size changes are applied right
+    away, with one bulk write per collection.
+
+    batchSize is the number of updates sent in one bulk write by
+    :py:meth:`reconcile`. claimTimeout is the number of seconds after which
+    entries claimed by a fold that never finished are folded again.
+    """
+    batchSize = 1000
+    claimTimeout = 600
+
+    def initialize(self):
+        self.name = 'size_ledger'
+        self.ensureIndices(('resourceId', 'claim', 'claimed'))
+        self._foldLock = threading.Lock()
+        self._lastFold = time.time()
+        self._monitor = None
+
+    def validate(self, doc):
+        return doc
+
+    def interval(self):
+        """
+        The number of seconds between folds of the ledger, or 0 if size
+        changes are applied immediately.
+        """
+        return float(config.getConfig()['database'].get('size_ledger_interval', 0))
+
+    def record(self, deltas):
+        """
+        Record changes to the size of some documents.
+
+        :param deltas: the changes, as (model name, document id, amount)
+            tuples.
+        :type deltas: iterable
+        """
+        deltas = [(model, id, amount) for model, id, amount in deltas if amount]
+        if not deltas:
+            return
+        interval = self.interval()
+        if interval <= 0:
+            self._applyDeltas(deltas)
+            return
+
+        self.collection.insert_many([{
+            'model': model,
+            'resourceId': id,
+            'amount': amount
+        } for model, id, amount in deltas])
+        self._startMonitor(interval)
+        if time.time() - self._lastFold > interval:
+            self.fold()
+
+    def _startMonitor(self, interval):
+        # Fold periodically, so sizes catch up once writes stop
+        if self._monitor is None:
+            self._monitor = cherrypy.process.plugins.Monitor(
+                cherrypy.engine, self.fold, frequency=interval,
+                name='SizeLedger')
+            self._monitor.subscribe()
+            if cherrypy.engine.state == cherrypy.engine.states.STARTED:
+                self._monitor.start()
+
+    def fold(self):
+        """
+        Apply the recorded size changes to the documents, with one bulk write
+        per collection, and remove them from the ledger. Entries are claimed
+        first, so that several processes may fold at the same time, and the
+        entries for each collection are removed as soon as they have been
+        applied. A bulk write that fails may have been partly applied, so its
+        entries are discarded rather than applied again, and the error is
+        logged; the system consistency check corrects the sizes. Claims older
+        than claimTimeout, left by a process that died while folding, are
+        taken over.
+
+        :returns: the number of documents whose size was changed.
+        """
+        if not self._foldLock.acquire(False):
+            return 0
+        try:
+            self._lastFold = time.time()
+            claim = ObjectId()
+            now = datetime.datetime.utcnow()
+            stale = now - datetime.timedelta(seconds=self.claimTimeout)
+            self.collection.update_many({'$or': [
+                {'claim': None},
+                {'claimed': {'$lt': stale}}
+            ]}, {'$set': {'claim': claim, 'claimed': now}})
+            changed = 0
+            for model in sorted(self.collection.distinct('model', {'claim': claim})):
+                # Renew the claim, so a long fold isn't taken over
+                self.collection.update_many({'claim': claim}, {
+                    '$set': {'claimed': datetime.datetime.utcnow()}})
+                query = {'claim': claim, 'model': model}
+                totals = self.collection.aggregate([
+                    {'$match': query},
+                    {'$group': {'_id': '$resourceId', 'amount': {'$sum': '$amount'}}}
+                ])
+                try:
+                    changed += self._applyDeltas(
+                        (model, total['_id'], total['amount'])
+                        for total in totals if total['amount'])
+                except pymongo.errors.PyMongoError:
+                    logger.exception(
+                        'Failed to fold size changes into %s documents; run '
+                        'the system consistency check to fix sizes.' % model)
+                    self.collection.delete_many(query)
+                    # The other collections haven't been written to yet
+                    self.collection.update_many({'claim': claim}, {
+                        '$set': {'claim': None, 'claimed': None}})
+                    return changed
+                self.collection.delete_many(query)
+            return changed
+        finally:
+            self._foldLock.release()
+
+    def _applyDeltas(self, deltas):
+        """
+        Increment the sizes of documents with one bulk write per collection.
+
+        :returns: the number of documents whose size was changed.
+        """
+        updates = collections.defaultdict(list)
+        for model, id, amount in deltas:
+            updates[model].append(UpdateOne(
+                {'_id': id}, {'$inc': {'size': amount}}))
+        for model, ops in six.viewitems(updates):
+            self.model(model).collection.bulk_write(ops, ordered=False)
+        return sum(len(ops) for ops in six.viewvalues(updates))
+
+    def getSize(self, model, doc, exact=False):
+        """
+        Get the size of a document.
+
+        :param model: the name of the document's model.
+        :type model: str
+        :param doc: the document.
+        :type doc: dict
+        :param exact: if True and the ledger is in use, include the size
+            changes that have not been folded into the document yet.
+        :type exact: bool
+        """
+        size = doc.get('size', 0)
+        if exact:
+            size += self.getPending(model, [doc['_id']])
+        return size
+
+    def getPending(self, model, ids):
+        """
+        Get the total of the size changes that have not been folded into
+        some documents yet.
+
+        :param model: the name of the documents' model.
+        :type model: str
+        :param ids: the ids of the documents.
+        :type ids: list
+        :returns: the sum of the pending changes, or 0 if the ledger is not
+            in use.
+        """
+        if self.interval() <= 0:
+            return 0
+        for total in self.collection.aggregate([
+            {'$match': {'model': model, 'resourceId': {'$in': ids}}},
+            {'$group': {'_id': None, 'amount': {'$sum': '$amount'}}}
+        ]):
+            return total['amount']
+        return 0
+
+    def reconcile(self, progress=noProgress):
+        """
+        Recompute the size of every item from its files, of every folder from
+        its items, and of every collection and user from the items beneath
+        it, and fix the sizes that are wrong. The sums are computed by
+        aggregation in the database, and compared with the stored sizes in a
+        single pass over each collection. Pending ledger entries are
+        discarded, as they are accounted for by the recomputed sizes.
+
+        :param progress: a progress context to record progress on.
+        :type progress: girder.utility.progress.ProgressContext
+        :returns: the number of sizes that were fixed.
+        """
+        self.collection.delete_many({})
+        models = ['item', 'folder', 'collection', 'user']
+        steps = sum(self.model(model).find().count() for model in models)
+        progress.update(total=steps, current=0)
+
+        fixes = self._fixSizes('item', self._sumSizes('file', 'itemId'), progress)
+        fixes += self._fixSizes(
+            'folder', self._sumSizes('item', 'folderId'), progress)
+
+        rootSizes = collections.defaultdict(dict)
+        for total in self._sumSizes('item', 'baseParentId', 'baseParentType'):
+            rootSizes[total['_id']['type']][total['_id']['id']] = total['size']
+        for model in ('collection', 'user'):
+            sizes = rootSizes[model]
+            fixes += self._fixSizes(model, (
+                {'_id': id, 'size': sizes[id]} for id in sorted(sizes)), progress)
+        return fixes
+
+    def _sumSizes(self, model, idField, typeField=None):
+        """
+        Sum the sizes of the documents of a model, grouped by a parent id,
+        sorted by that id.
+        """
+        group = '$' + idField
+        if typeField:
+            group = {'type': '$' + typeField, 'id': group}
+        return self.model(model).collection.aggregate([
+            {'$match': {idField: {'$exists': True, '$ne': None}}},
+            {'$group': {'_id': group, 'size': {'$sum': '$size'}}},
+            {'$sort': {'_id': 1}}
+        ], allowDiskUse=True)
+
+    def _fixSizes(self, model, sizes, progress):
+        """
+        Merge the sorted output of _sumSizes with the documents of a model in
+        _id order, setting the sizes that are wrong in batches.
+        """
+        fixes = 0
+        ops = []
+        collection = self.model(model).collection
+        sizes = iter(sizes)
+        total = next(sizes, None)
+        for doc in collection.find({}, projection=['size'], sort=[('_id', 1)]):
+            progress.update(increment=1)
+            # Skip totals for parents that no longer exist
+            while total is not None and total['_id'] < doc['_id']:
+                total = next(sizes, None)
+            size = 0
+            if total is not None and total['_id'] == doc['_id']:
+                size = total['size']
+            if size != doc.get('size'):
+                ops.append(UpdateOne({'_id': doc['_id']}, {'$set': {'size': size}}))
+                fixes += 1
+            if len(ops) >= self.batchSize:
+                collection.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            collection.bulk_write(ops, ordered=False)
+        return fixes
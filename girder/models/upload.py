@@ -18,8 +18,10 @@
 ###############################################################################
 
 import datetime
+import re
 import six
 from bson.objectid import ObjectId
+from pymongo import ReturnDocument
 
 from girder import events
 from girder.constants import SettingKey
@@ -31,7 +33,9 @@ class Upload(Model):
     """
     This model stores temporary records for uploads that have been approved
     but are not yet complete, so that they can be uploaded in chunks of
-    arbitrary size. The chunks must be uploaded in order.
+    arbitrary size. The chunks must be uploaded in order, unless the upload
+    was created with a part size: its parts may then be uploaded concurrently
+    and in any order, if the assetstore supports it.
     """
     def initialize(self):
         self.name = 'upload'
@@ -136,11 +140,54 @@ class Upload(Model):
         else:
             return upload
 
+    def handlePart(self, upload, part, chunk):
+        """
+        When a part of an upload that was created with a part size is
+        uploaded, this should be called to store it. Parts may be handled
+        concurrently and in any order; whichever call stores the last missing
+        part finalizes the upload. Parts that were already received are
+        stored again, but only counted once.
+
+        :param upload: The upload document.
+        :type upload: dict
+        :param part: The index of the part, starting at 0.
+        :type part: int
+        :param chunk: The file object representing the data of the part.
+        :type chunk: file
+        :returns: The upload document, or the file that was created if the
+            upload is complete.
+        """
+        assetstore = self.model('assetstore').load(upload['assetstoreId'])
+        adapter = assetstore_utilities.getAssetstoreAdapter(assetstore)
+
+        size = adapter.uploadPart(upload, part, chunk)
+
+        # Other parts may be recorded at the same time, so this is atomic
+        updated = self.collection.find_one_and_update({
+            '_id': upload['_id'],
+            'partsReceived': {'$ne': part}
+        }, {
+            '$addToSet': {'partsReceived': part},
+            '$inc': {'received': size},
+            '$set': {'updated': datetime.datetime.utcnow()}
+        }, return_document=ReturnDocument.AFTER)
+        if updated is None:
+            return self.load(upload['_id'], exc=True)
+
+        partCount = (updated['size'] + updated['partSize'] - 1) // updated['partSize']
+        if len(updated['partsReceived']) == partCount:
+            return self.finalizeUpload(updated, assetstore)
+        else:
+            return updated
+
     def requestOffset(self, upload):
         """
         Requests the offset that should be used to resume uploading. This
-        makes the request from the assetstore adapter.
+        makes the request from the assetstore adapter. For uploads in parts,
+        this returns the sorted list of the parts that were received instead.
         """
+        if 'partSize' in upload:
+            return {'partsReceived': sorted(upload['partsReceived'])}
         assetstore = self.model('assetstore').load(upload['assetstoreId'])
         adapter = assetstore_utilities.getAssetstoreAdapter(assetstore)
         return adapter.requestOffset(upload)
@@ -201,7 +248,11 @@ class Upload(Model):
                     file['attachedToId'] = upload['parentId']
 
         adapter = assetstore_utilities.getAssetstoreAdapter(assetstore)
-        file = adapter.finalizeUpload(upload, file)
+        if 'storedData' in upload:
+            # The assetstore already held the data, so none was uploaded
+            file.update(upload['storedData'])
+        else:
+            file = adapter.finalizeUpload(upload, file)
 
         event_document = {'file': file, 'upload': upload}
         events.trigger('model.file.finalizeUpload.before', event_document)
@@ -282,7 +333,8 @@ class Upload(Model):
         return self.save(upload)
 
     def createUpload(self, user, name, parentType, parent, size, mimeType=None,
-                     reference=None, assetstore=None, attachParent=False):
+                     reference=None, assetstore=None, attachParent=False,
+                     sha512=None, partSize=None):
         """
         Creates a new upload record, and creates its temporary file
         that the chunks will be written into. Chunks should then be sent
@@ -312,6 +364,16 @@ class Upload(Model):
             appear as direct children of the parent, but are still associated
             with it.
         :type attachParent: boolean
+        :param sha512: The SHA-512 hash of the file, if known. When the
+            assetstore already holds data with this hash and size, and the
+            core.upload_deduplication_policy setting trusts the user to give
+            it, no data needs to be sent: the upload is marked as fully
+            received and can be finalized right away.
+        :type sha512: str
+        :param partSize: If set, the upload is sent in parts of this many
+            bytes (except for the last part), which may be sent concurrently
+            and in any order with :py:meth:`handlePart`.
+        :type partSize: int
         :returns: The upload document that was created.
         """
         assetstore = self.getTargetAssetstore(parentType, parent, assetstore)
@@ -346,9 +408,44 @@ class Upload(Model):
         else:
             upload['userId'] = None
 
-        upload = adapter.initUpload(upload)
+        storedData = None
+        if sha512 is not None:
+            storedData = self._findStoredData(adapter, user, sha512, size)
+        if storedData is not None:
+            upload['storedData'] = storedData
+            upload['received'] = size
+        else:
+            if partSize is not None:
+                self._setPartSize(adapter, upload, partSize)
+            upload = adapter.initUpload(upload)
         return self.save(upload)
 
+    def _setPartSize(self, adapter, upload, partSize):
+        """
+        Mark a new upload as being sent in parts of the given size.
+        """
+        if not adapter.supportsPartUploads:
+            raise ValidationException(
+                'This assetstore does not support uploads in parts.',
+                'partSize')
+        if partSize <= 0:
+            raise ValidationException(
+                'The part size must be positive.', 'partSize')
+        upload['partSize'] = partSize
+        upload['partsReceived'] = []
+
+    def _findStoredData(self, adapter, user, sha512, size):
+        """
+        Ask an assetstore adapter whether it already holds the data of a new
+        upload, if the deduplication policy lets this user skip uploading it.
+        """
+        if not re.match(r'^[0-9a-fA-F]{128}$', sha512):
+            raise ValidationException('Invalid SHA-512 hash.', 'sha512')
+        policy = self.model('setting').get(SettingKey.UPLOAD_DEDUPLICATION_POLICY)
+        if policy == 'all' or (policy == 'admin' and user and user['admin']):
+            return adapter.findStoredData(sha512.lower(), size)
+        return None
+
     def moveFileToAssetstore(self, file, user, assetstore):
         """
         Move a file from whatever assetstore it is located in to a different
@@ -433,7 +530,7 @@ class Upload(Model):
         assetstore = self.model('assetstore').load(upload['assetstoreId'])
         # If the assetstore was deleted, the upload may still be in our
         # database
-        if assetstore:
+        if assetstore and 'storedData' not in upload:
             adapter = assetstore_utilities.getAssetstoreAdapter(assetstore)
             try:
                 adapter.cancelUpload(upload)
@@ -34,7 +34,8 @@ class User(AccessControlledModel):
 
     def initialize(self):
         self.name = 'user'
-        self.ensureIndices(['login', 'email', 'groupInvites.groupId'])
+        self.ensureIndices(['login', 'email', 'groupInvites.groupId',
+                            'access.users.id', 'public'])
         self.prefixSearchFields = (
             'login', ('firstName', 'i'), ('lastName', 'i'))
 
@@ -214,15 +215,12 @@ class User(AccessControlledModel):
         :param sort: The sort structure to pass to pymongo.
         :returns: Iterable of users.
         """
-        # Perform the find; we'll do access-based filtering of the result set
-        # afterward.
         if text is not None:
-            cursor = self.textSearch(text, sort=sort)
-        else:
-            cursor = self.find({}, sort=sort)
+            return self.textSearch(
+                text, user=user, sort=sort, limit=limit, offset=offset)
 
-        return self.filterResultsByPermission(
-            cursor=cursor, user=user, level=AccessType.READ, limit=limit,
+        return self.findWithPermissions(
+            {}, sort=sort, user=user, level=AccessType.READ, limit=limit,
             offset=offset)
 
     def setPassword(self, user, password, save=True):
@@ -462,19 +460,17 @@ class User(AccessControlledModel):
         :param level: The required access level, or None to return the raw
             top-level folder count.
         """
-        fields = () if level is None else ('access', 'public')
-
         folderModel = self.model('folder')
-        folders = folderModel.find({
+        q = {
             'parentId': user['_id'],
             'parentCollection': 'user'
-        }, fields=fields)
+        }
 
         if level is None:
-            return folders.count()
+            return folderModel.find(q, fields=()).count()
         else:
-            return sum(1 for _ in folderModel.filterResultsByPermission(
-                cursor=folders, user=filterUser, level=level))
+            return folderModel.findWithPermissions(
+                q, fields=(), user=filterUser, level=level).count()
 
     def updateSize(self, doc):
         """
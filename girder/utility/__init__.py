@@ -20,6 +20,7 @@
 import datetime
 import dateutil.parser
 import errno
+import itertools
 import json
 import os
 import pytz
@@ -78,6 +79,22 @@ def camelcase(value):
                    re.split("[._]+", value))
 
 
+def batches(iterable, size):
+    """
+    Split an iterable, such as a cursor, into lists of up to a given size.
+
+    :param iterable: the values to split.
+    :param size: the maximum length of each list.
+    :type size: int
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
 def mkdir(path, mode=0o777, recurse=True, existOk=True):
     """
     Create a new directory or ensure a directory already exists.
@@ -24,11 +24,58 @@ from girder.models.model_base import ValidationException
 from girder.utility import progress
 from .model_importer import ModelImporter
 
+# Ranges separated by less than this many bytes are read with a single request
+# to the backend by downloadRanges.
+RANGE_READ_GAP = 65536
+
+
+def splitRanges(stream, position, ranges, firstIndex=0):
+    """
+    Split a stream of bytes into the parts that fall within a set of byte
+    ranges, discarding the bytes in between.
+
+    :param stream: An iterable of byte strings, starting at ``position``.
+    :param position: The offset within the file of the start of the stream.
+    :type position: int
+    :param ranges: A sorted list of non-overlapping (offset, endByte) pairs,
+        none of which end before ``position``.
+    :type ranges: list
+    :param firstIndex: The index to report for the first range.
+    :type firstIndex: int
+    :returns: a generator yielding (index, data) pairs.
+    """
+    current = 0
+    for chunk in stream:
+        chunkEnd = position + len(chunk)
+        while current < len(ranges) and ranges[current][0] < chunkEnd:
+            start, end = ranges[current]
+            data = chunk[max(start - position, 0):min(end, chunkEnd) - position]
+            if data:
+                yield firstIndex + current, data
+            if end > chunkEnd:
+                break
+            current += 1
+        if current == len(ranges):
+            return
+        position = chunkEnd
+
 
 class AbstractAssetstoreAdapter(ModelImporter):
     """
     This defines the interface to be used by all assetstore adapters.
+
+    Adapters that set ``supportsPartUploads`` to True accept uploads that are
+    created with a part size, whose parts may be sent concurrently and in any
+    order through :py:meth:`uploadPart`.
+
+    An adapter instance is shared by every request to its assetstore until
+    the assetstore is saved again, so it may be used by several threads at
+    once and must not keep per-request state. Adapters that cannot be shared
+    should set ``shareable`` to False.
     """
+    supportsPartUploads = False
+    shareable = True
+
     def __init__(self, assetstore):
         self.assetstore = assetstore
 
@@ -76,6 +123,22 @@ class AbstractAssetstoreAdapter(ModelImporter):
         """
         return upload  # pragma: no cover
 
+    def findStoredData(self, sha512, size):
+        """
+        If this assetstore already holds data with the given SHA-512 hash and
+        size, return the fields that a file referencing that data should
+        have, so that it can be created without uploading the data again.
+        The default behavior is to return None, meaning that the data must
+        always be uploaded.
+
+        :param sha512: The SHA-512 hash of the data, as a lowercase hex string.
+        :type sha512: str
+        :param size: The size of the data in bytes.
+        :type size: int
+        :returns: A dict of file fields, or None.
+        """
+        return None
+
     def uploadChunk(self, upload, chunk):
         """
         Call this method to process each chunk of an upload.
@@ -89,6 +152,60 @@ class AbstractAssetstoreAdapter(ModelImporter):
         raise NotImplementedError('Must override processChunk in %s.' %
                                   self.__class__.__name__)  # pragma: no cover
 
+    def uploadPart(self, upload, part, chunk):
+        """
+        Call this method to store one part of an upload that was created with
+        a ``partSize``. Parts may arrive in any order, and several parts of
+        the same upload may be stored at the same time, so this must not
+        modify the upload document; the caller records the part as received.
+        Storing a part that was already stored must be harmless.
+
+        :param upload: The upload document.
+        :type upload: dict
+        :param part: The index of the part, starting at 0.
+        :type part: int
+        :param chunk: The file object representing the data of the part.
+        :type chunk: file
+        :returns: The number of bytes that were stored.
+        """
+        raise ValidationException(
+            'The %s assetstore type does not support uploads in parts.' %
+            self.__class__.__name__)
+
+    def partRange(self, upload, part):
+        """
+        Get the position of a part of an upload that was created with a
+        ``partSize``.
+
+        :param upload: The upload document.
+        :type upload: dict
+        :param part: The index of the part, starting at 0.
+        :type part: int
+        :returns: the offset and length of the part, in bytes.
+        """
+        offset = part * upload['partSize']
+        if part < 0 or offset >= upload['size']:
+            raise ValidationException('Invalid part %d.' % part)
+        return offset, min(upload['partSize'], upload['size'] - offset)
+
+    def checkPartSize(self, upload, part, size):
+        """
+        Check that the number of bytes received for a part of an upload is
+        the length of that part. Adapters may stop reading a part once they
+        have received one byte more than its length.
+
+        :param upload: The upload document.
+        :type upload: dict
+        :param part: The index of the part, starting at 0.
+        :type part: int
+        :param size: The number of bytes received.
+        :type size: int
+        """
+        length = self.partRange(upload, part)[1]
+        if size != length:
+            raise ValidationException(
+                'Part %d must be %d bytes long.' % (part, length))
+
     def finalizeUpload(self, upload, file):
         """
         Call this once the last chunk has been processed. This method does not
@@ -126,6 +243,20 @@ class AbstractAssetstoreAdapter(ModelImporter):
         raise NotImplementedError('Must override deleteFile in %s.' %
                                   self.__class__.__name__)  # pragma: no cover
 
+    def deleteFiles(self, files):
+        """
+        This is called when a batch of Files in this assetstore is about to be
+        deleted together. The default implementation calls deleteFile for
+        each file. Adapters that can remove data in bulk, or that only remove
+        data once no other File refers to it, should override this: all of
+        the File documents in the batch still exist when this is called.
+
+        :param files: The File documents about to be deleted.
+        :type files: list of dict
+        """
+        for file in files:
+            self.deleteFile(file)
+
     def shouldImportFile(self, path, params):
         """
         This is a helper used during the import process to determine if a file located at
@@ -176,6 +307,37 @@ class AbstractAssetstoreAdapter(ModelImporter):
         raise NotImplementedError('Must override downloadFile in %s.' %
                                   self.__class__.__name__)  # pragma: no cover
 
+    def downloadRanges(self, file, ranges):
+        """
+        Returns a generator function that streams several byte ranges of a
+        file. By default, ranges that are close together are fetched with one
+        call to :py:meth:`downloadFile`; adapters may override this to read the
+        ranges more efficiently from their backend.
+
+        :param file: The file document being downloaded.
+        :type file: dict
+        :param ranges: The byte ranges to download, as a sorted list of
+            non-overlapping (offset, endByte) pairs within the file.
+        :type ranges: list
+        :returns: a generator function yielding (index, data) pairs, where
+            index is the position within ``ranges`` of the range that data is
+            part of.
+        """
+        def stream():
+            first = 0
+            while first < len(ranges):
+                last = first
+                while (last + 1 < len(ranges) and
+                       ranges[last + 1][0] - ranges[last][1] < RANGE_READ_GAP):
+                    last += 1
+                start, end = ranges[first][0], ranges[last][1]
+                data = self.downloadFile(file, start, headers=False, endByte=end)()
+                for index, chunk in splitRanges(data, start, ranges[first:last + 1], first):
+                    yield index, chunk
+                first = last + 1
+
+        return stream
+
     def findInvalidFiles(self, progress=progress.noProgress, filters=None,
                          checkSize=True, **kwargs):
         """
@@ -212,7 +374,8 @@ class AbstractAssetstoreAdapter(ModelImporter):
         """
         Given a chunk that is either a file-like object or a string, attempt to
         determine its length.  If it is a file-like object, then this relies on
-        being able to use fstat.
+        being able to use fstat, or on it having a size attribute, as request
+        bodies that are streamed to the assetstore do.
 
         :param chunk: the chunk to get the size of
         :type chunk: a file-like object or a string
@@ -222,6 +385,8 @@ class AbstractAssetstoreAdapter(ModelImporter):
             return
         elif hasattr(chunk, "fileno"):
             return os.fstat(chunk.fileno()).st_size
+        elif hasattr(chunk, 'read'):
+            return getattr(chunk, 'size', None)
         elif isinstance(chunk, six.text_type):
             return len(chunk.encode('utf8'))
         else:
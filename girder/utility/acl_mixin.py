@@ -18,7 +18,6 @@
 ###############################################################################
 
 import itertools
-import six
 
 from ..models.model_base import Model, AccessException
 from ..constants import AccessType
@@ -36,9 +35,13 @@ class AccessControlMixin(object):
 
     resourceParent corresponds to the field in which the parent resource
     belongs, so for an item it would be the folderId.
+
+    accessBatchSize is the number of documents that filterResultsByPermission
+    reads from a cursor before resolving their parents' access in bulk.
     """
     resourceColl = None
     resourceParent = None
+    accessBatchSize = 1000
 
     def load(self, id, level=AccessType.ADMIN, user=None, objectId=True,
              force=False, fields=None, exc=False):
@@ -98,42 +101,80 @@ class AccessControlMixin(object):
                                   (perm, self.name, doc.get('_id', 'unknown'),
                                    userid))
 
-    def filterResultsByPermission(self, cursor, user, level, limit, offset,
-                                  removeKeys=()):
+    def filterResultsByPermission(self, cursor, user, level, limit=0,
+                                  offset=0, removeKeys=()):
         """
         Yields filtered results from the cursor based on the access control
-        existing for the resourceParent.
+        existing for the resourceParent. The cursor is consumed in windows of
+        up to ``accessBatchSize`` documents, and the access of all distinct
+        parents within a window is resolved with a single query per level of
+        the hierarchy rather than one load per parent.
 
         Takes the same parameters as
         :py:func:`girder.models.model_base.AccessControlledModel.filterResultsByPermission`.
         """
         # Cache mapping resourceIds -> access granted (bool)
         resourceAccessCache = {}
-
-        def hasAccess(_result):
-            resourceId = _result[self.resourceParent]
-
-            # return cached check if it exists
-            if resourceId in resourceAccessCache:
-                return resourceAccessCache[resourceId]
-
-            # if the resourceId is not cached, check for permission "level"
-            # and set the cache
-            resource = self.model(self.resourceColl).load(resourceId,
-                                                          force=True)
-            resourceAccessCache[resourceId] = \
-                self.model(self.resourceColl).hasAccess(
-                    resource, user=user, level=level)
-
-            return resourceAccessCache[resourceId]
-
         endIndex = offset + limit if limit else None
-        filteredCursor = six.moves.filter(hasAccess, cursor)
-        for result in itertools.islice(filteredCursor, offset, endIndex):
-            for key in removeKeys:
-                if key in result:
-                    del result[key]
-            yield result
+        windowSize = min(self.accessBatchSize, endIndex or self.accessBatchSize)
+        index = 0
+
+        while True:
+            window = list(itertools.islice(cursor, windowSize))
+            if not window:
+                return
+            windowSize = self.accessBatchSize
+
+            newIds = {doc.get(self.resourceParent) for doc in window}
+            newIds.difference_update(resourceAccessCache)
+            newIds.discard(None)
+            if newIds:
+                allowed = self._accessibleParentIds(newIds, user, level)
+                for resourceId in newIds:
+                    resourceAccessCache[resourceId] = resourceId in allowed
+
+            for result in window:
+                if not resourceAccessCache.get(result.get(self.resourceParent)):
+                    continue
+                if index >= offset:
+                    for key in removeKeys:
+                        if key in result:
+                            del result[key]
+                    yield result
+                index += 1
+                if endIndex is not None and index >= endIndex:
+                    return
+
+    def _accessibleParentIds(self, parentIds, user, level):
+        """
+        Return the subset of a set of resourceParent ids on which the user has
+        the given access level. If the parent model itself resolves access
+        through its own parent, this recurses up the hierarchy, issuing one
+        query per level.
+
+        :param parentIds: The ids of the parent resources to check.
+        :type parentIds: set of ObjectId
+        :param user: The user to check policies against.
+        :type user: dict or None
+        :param level: The access level.
+        :type level: AccessType
+        :returns: The set of accessible parent ids.
+        """
+        parentModel = self.model(self.resourceColl)
+        query = {'_id': {'$in': list(parentIds)}}
+
+        if isinstance(parentModel, AccessControlMixin):
+            grandparentField = parentModel.resourceParent
+            parents = list(parentModel.find(query, fields=[grandparentField]))
+            grandparentIds = {p.get(grandparentField) for p in parents}
+            grandparentIds.discard(None)
+            allowed = parentModel._accessibleParentIds(
+                grandparentIds, user, level) if grandparentIds else set()
+            return {p['_id'] for p in parents
+                    if p.get(grandparentField) in allowed}
+
+        return {p['_id'] for p in parentModel.findWithPermissions(
+            query, fields=(), user=user, level=level)}
 
     def textSearch(self, query, user=None, filters=None, limit=0, offset=0,
                    sort=None, fields=None, level=AccessType.READ):
@@ -17,6 +17,8 @@
 #  limitations under the License.
 ###############################################################################
 
+import threading
+
 from .filesystem_assetstore_adapter import FilesystemAssetstoreAdapter
 from .gridfs_assetstore_adapter import GridFsAssetstoreAdapter
 from .s3_assetstore_adapter import S3AssetstoreAdapter
@@ -29,6 +31,11 @@ _assetstoreTable = {
     AssetstoreType.S3: S3AssetstoreAdapter
 }
 
+# Adapter instances that are reused, keyed by assetstore id, as (revision of
+# the assetstore document, adapter) pairs.
+_adapterCache = {}
+_adapterCacheLock = threading.Lock()
+
 
 def getAssetstoreAdapter(assetstore, instance=True):
     """
@@ -43,6 +50,12 @@ def getAssetstoreAdapter(assetstore, instance=True):
         unwanted exceptions during instantiation.
     :type instance: bool
     :returns: An adapter descending from AbstractAssetstoreAdapter
+
+    Adapter instances are shared by all callers for as long as the revision
+    of the assetstore document stays the same, so that they can keep their
+    connections to the backend. The revision changes whenever the assetstore
+    is saved. Adapters whose class sets ``shareable`` to False, and those
+    that are unavailable, are built on every call.
     """
     storeType = assetstore['type']
 
@@ -50,10 +63,37 @@ def getAssetstoreAdapter(assetstore, instance=True):
     if cls is None:
         raise Exception('No AssetstoreAdapter for type: %s.' % storeType)
 
-    if instance:
-        return cls(assetstore)
-    else:
+    if not instance:
         return cls
+    if not cls.shareable or '_id' not in assetstore:
+        return cls(assetstore)
+
+    revision = assetstore.get('revision', 0)
+    with _adapterCacheLock:
+        cached = _adapterCache.get(assetstore['_id'])
+    if cached is not None and cached[0] == revision and type(cached[1]) is cls:
+        return cached[1]
+
+    adapter = cls(assetstore)
+    if not getattr(adapter, 'unavailable', False):
+        with _adapterCacheLock:
+            _adapterCache[assetstore['_id']] = (revision, adapter)
+    return adapter
+
+
+def clearAssetstoreAdapters(assetstoreId=None):
+    """
+    Discard the shared adapter instances, so that they are built again the
+    next time they are needed.
+
+    :param assetstoreId: if set, only discard the adapter of this assetstore.
+    :type assetstoreId: ObjectId or None
+    """
+    with _adapterCacheLock:
+        if assetstoreId is None:
+            _adapterCache.clear()
+        else:
+            _adapterCache.pop(assetstoreId, None)
 
 
 def setAssetstoreAdapter(storeType, cls):
@@ -71,6 +111,7 @@ def setAssetstoreAdapter(storeType, cls):
     :type cls: AbstractAssetstoreAdapter
     """
     _assetstoreTable[storeType] = cls
+    clearAssetstoreAdapters()
 
 
 def fileIndexFields():
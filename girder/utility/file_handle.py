@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import os
+import six
+
+from .model_importer import ModelImporter
+
+
+class FileHandle(ModelImporter):
+    """
+    A read-only, seekable file-like object over the contents of a Girder
+    file, for libraries that expect to read and seek a file object. Data is
+    read with :py:meth:`girder.models.file.File.download`, starting at the
+    current position, and the download keeps streaming as long as reads
+    follow on from each other. Seeking elsewhere starts a new download from
+    the new position, except for seeks back into the last ``keepBytes``
+    bytes read, which are kept in memory since decoders often look back a
+    little, e.g. to reread a header, and for seeks less than ``keepBytes``
+    ahead, which read through the current download instead.
+
+    Use :py:meth:`girder.models.file.File.open` to get one.
+
+    :param file: The file document.
+    :type file: dict
+    """
+    keepBytes = 65536
+
+    def __init__(self, file):
+        self.file = file
+        self.size = file.get('size') or 0
+        self._pos = 0
+        self._buffer = b''
+        self._bufferStart = 0
+        self._stream = None
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise IOError('Cannot seek before the start of the file.')
+        self._pos = offset
+        return self._pos
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        """
+        Read up to size bytes from the current position, or the rest of the
+        file if size is negative or omitted.
+        """
+        if size is None or size < 0:
+            size = self.size - self._pos
+        size = min(size, self.size - self._pos)
+        if size <= 0:
+            return b''
+
+        bufferEnd = self._bufferStart + len(self._buffer)
+        if (self._stream is None or self._pos < self._bufferStart or
+                self._pos > bufferEnd + self.keepBytes):
+            self._restart()
+            bufferEnd = self._pos
+
+        end = self._pos + size
+        if bufferEnd < end:
+            chunks = [self._buffer]
+            while bufferEnd < end:
+                chunk = next(self._stream, None)
+                if chunk is None:
+                    break
+                if isinstance(chunk, six.text_type):
+                    chunk = chunk.encode('utf8')
+                chunks.append(chunk)
+                bufferEnd += len(chunk)
+            self._buffer = b''.join(chunks)
+
+        start = self._pos - self._bufferStart
+        data = self._buffer[start:start + size]
+        self._pos += len(data)
+
+        # Drop the data that is too far behind the position to be kept, once
+        # there is enough of it to be worth copying the rest
+        if self._pos - self._bufferStart > 2 * self.keepBytes:
+            drop = self._pos - self._bufferStart - self.keepBytes
+            self._buffer = self._buffer[drop:]
+            self._bufferStart += drop
+        return data
+
+    def _restart(self):
+        """
+        Start a new download from the current position.
+        """
+        self._closeStream()
+        self._stream = iter(self.model('file').download(
+            self.file, offset=self._pos, headers=False)())
+        self._buffer = b''
+        self._bufferStart = self._pos
+
+    def _closeStream(self):
+        if self._stream is not None and hasattr(self._stream, 'close'):
+            self._stream.close()
+        self._stream = None
+
+    def close(self):
+        self._closeStream()
+        self._buffer = b''
+
+    def __iter__(self):
+        while True:
+            data = self.read(self.keepBytes)
+            if not data:
+                return
+            yield data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
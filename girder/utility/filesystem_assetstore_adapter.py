@@ -17,20 +17,23 @@
 #  limitations under the License.
 ###############################################################################
 
+import cherrypy
+import collections
 from hashlib import sha512
 import os
 import psutil
 import shutil
 import six
 from six import BytesIO
+from six.moves import urllib
 import stat
 import tempfile
+import threading
 
 from girder import events, logger
 from girder.api.rest import setResponseHeader
 from girder.models.model_base import ValidationException, GirderException
-from girder.utility import mkdir, progress
-from . import hash_state
+from girder.utility import config, mkdir, progress
 from .abstract_assetstore_adapter import AbstractAssetstoreAdapter
 
 BUF_SIZE = 65536
@@ -38,6 +41,15 @@ BUF_SIZE = 65536
 # Default permissions for the files written to the filesystem
 DEFAULT_PERMS = stat.S_IRUSR | stat.S_IWUSR
 
+# The number of uploads in progress whose SHA-512 hasher each process keeps in
+# memory. Uploads beyond this are hashed again from disk when they resume.
+HASHER_CACHE_SIZE = 1000
+
+# Live hashers of uploads in progress, keyed by temp file path, as
+# (hasher, number of bytes hashed) pairs, least recently used first.
+_hashers = collections.OrderedDict()
+_hashersLock = threading.Lock()
+
 
 class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
     """
@@ -45,9 +57,17 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
     directory. Files are named by their SHA-512 hash, which avoids duplication
     of file content.
 
+    The SHA-512 hash of an upload is computed as its chunks are written, by a
+    hasher that this process keeps in memory between chunks. If a chunk
+    arrives at a process that doesn't hold the upload's hasher, for instance
+    after a restart, the temporary file is hashed again from disk first.
+    Uploads in parts are written at their offsets within a temporary file of
+    the full size, and hashed when they are finalized.
+
     :param assetstore: The assetstore to act on.
     :type assetstore: dict
     """
+    supportsPartUploads = True
 
     @staticmethod
     def validateInfo(doc):
@@ -138,14 +158,41 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
     def initUpload(self, upload):
         """
         Generates a temporary file and sets its location in the upload document
-        as tempFile. This is the file that the chunks will be appended to.
+        as tempFile. This is the file that the chunks will be appended to. If
+        the upload is sent in parts, the file is created at its full size
+        instead, so that parts can be written at their offsets.
         """
-        fd, path = tempfile.mkstemp(dir=self.tempDir)
-        os.close(fd)  # Must close this file descriptor or it will leak
+        try:
+            fd, path = tempfile.mkstemp(dir=self.tempDir)
+        except OSError:
+            # Adapters are reused, so the temp directory may have been removed
+            # since this one was built.
+            mkdir(self.tempDir)
+            fd, path = tempfile.mkstemp(dir=self.tempDir)
+        try:
+            if 'partSize' in upload:
+                os.ftruncate(fd, upload['size'])
+        finally:
+            os.close(fd)  # Must close this file descriptor or it will leak
         upload['tempFile'] = path
-        upload['sha512state'] = hash_state.serializeHex(sha512())
         return upload
 
+    def findStoredData(self, sha512, size):
+        """
+        Data is stored at a path derived from its SHA-512 hash, so it is
+        already present if a file of the right size exists at that path.
+        """
+        path = os.path.join(sha512[0:2], sha512[2:4], sha512)
+        try:
+            if os.path.getsize(os.path.join(self.assetstore['root'], path)) != size:
+                return None
+        except OSError:
+            return None
+        return {
+            'sha512': sha512,
+            'path': path
+        }
+
     def uploadChunk(self, upload, chunk):
         """
         Appends the chunk into the temporary file.
@@ -159,20 +206,9 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
         if isinstance(chunk, six.binary_type):
             chunk = BytesIO(chunk)
 
-        # Restore the internal state of the streaming SHA-512 checksum
-        checksum = hash_state.restoreHex(upload['sha512state'], 'sha512')
-
-        if self.requestOffset(upload) > upload['received']:
-            # This probably means the server died midway through writing last
-            # chunk to disk, and the database record was not updated. This
-            # means we need to update the sha512 state with the difference.
-            with open(upload['tempFile'], 'rb') as tempFile:
-                tempFile.seek(upload['received'])
-                while True:
-                    data = tempFile.read(BUF_SIZE)
-                    if not data:
-                        break
-                    checksum.update(data)
+        # The hasher covers everything in the temp file, including the end of
+        # a chunk that was written before the server died midway through it.
+        checksum, position = self._takeHasher(upload)
 
         with open(upload['tempFile'], 'a+b') as tempFile:
             size = 0
@@ -188,15 +224,80 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
         try:
             self.checkUploadSize(upload, size)
         except ValidationException:
+            # The hasher has consumed the rejected data, so it is discarded
             with open(upload['tempFile'], 'a+b') as tempFile:
                 tempFile.truncate(upload['received'])
             raise
 
-        # Persist the internal state of the checksum
-        upload['sha512state'] = hash_state.serializeHex(checksum)
+        self._keepHasher(upload, checksum, position + size)
         upload['received'] += size
         return upload
 
+    def _takeHasher(self, upload):
+        """
+        Get a SHA-512 hasher that has consumed the whole temporary file of an
+        upload. It is taken out of the registry while it is in use, and must
+        be put back with :py:meth:`_keepHasher` to be used for the next chunk.
+        If this process has no hasher for the upload at the end of the file,
+        the file is hashed from disk.
+
+        :returns: the hasher and the number of bytes it has consumed.
+        """
+        path = upload['tempFile']
+        with _hashersLock:
+            checksum, position = _hashers.pop(path, (None, None))
+        if checksum is not None and position == os.stat(path).st_size:
+            return checksum, position
+
+        checksum = sha512()
+        position = 0
+        with open(path, 'rb') as tempFile:
+            while True:
+                data = tempFile.read(BUF_SIZE)
+                if not data:
+                    break
+                position += len(data)
+                checksum.update(data)
+        return checksum, position
+
+    def _keepHasher(self, upload, checksum, position):
+        """
+        Keep the hasher of an upload in memory for its next chunk, dropping
+        the least recently used hashers beyond HASHER_CACHE_SIZE.
+        """
+        with _hashersLock:
+            _hashers[upload['tempFile']] = (checksum, position)
+            while len(_hashers) > HASHER_CACHE_SIZE:
+                _hashers.popitem(last=False)
+
+    def uploadPart(self, upload, part, chunk):
+        """
+        Writes the part at its offset within the temporary file. Each call
+        opens the file separately, so parts can be written concurrently.
+        """
+        offset, length = self.partRange(upload, part)
+
+        if isinstance(chunk, six.text_type):
+            chunk = chunk.encode('utf8')
+
+        if isinstance(chunk, six.binary_type):
+            chunk = BytesIO(chunk)
+
+        size = 0
+        with open(upload['tempFile'], 'r+b') as tempFile:
+            tempFile.seek(offset)
+            while size <= length:
+                data = chunk.read(min(BUF_SIZE, length + 1 - size))
+                if not data:
+                    break
+                size += len(data)
+                if size <= length:
+                    tempFile.write(data)
+        chunk.close()
+
+        self.checkPartSize(upload, part, size)
+        return size
+
     def requestOffset(self, upload):
         """
         Returns the size of the temp file.
@@ -208,8 +309,9 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
         Moves the file into its permanent content-addressed location within the
         assetstore. Directory hierarchy yields 256^2 buckets.
         """
-        hash = hash_state.restoreHex(upload['sha512state'],
-                                     'sha512').hexdigest()
+        # Parts that arrived out of order have no hasher, so they are hashed
+        # from disk here.
+        hash = self._takeHasher(upload)[0].hexdigest()
         dir = os.path.join(hash[0:2], hash[2:4])
         absdir = os.path.join(self.assetstore['root'], dir)
 
@@ -251,6 +353,15 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
         """
         Returns a generator function that will be used to stream the file from
         disk to the response.
+
+        If the server is behind a proxy that can serve files itself, and the
+        ``sendfile_header`` value of the ``server`` config section is set, the
+        proxy is asked to send the file instead by setting that header (e.g.
+        ``X-Accel-Redirect`` for nginx or ``X-Sendfile`` for Apache) to the
+        path of the file, prefixed with ``sendfile_prefix``. nginx takes a URI,
+        so the path is URL-encoded for ``X-Accel-Redirect``. Since
+        the proxy applies the Range header of the request itself, this is only
+        done when the requested bytes are those the proxy would send.
         """
         if endByte is None or endByte > file['size']:
             endByte = file['size']
@@ -264,6 +375,19 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
                 'file-does-not-exist')
 
         if headers:
+            sendfileHeader = config.getConfig()['server'].get('sendfile_header')
+            if sendfileHeader and self._proxyCanSendRange(file, offset, endByte):
+                setResponseHeader('Accept-Ranges', 'bytes')
+                self.setContentHeaders(file, 0, file['size'], contentDisposition)
+                # The proxy computes the length (and range) of what it sends.
+                del cherrypy.response.headers['Content-Length']
+                prefix = config.getConfig()['server'].get('sendfile_prefix', '')
+                sendfilePath = prefix + os.path.abspath(path)
+                if sendfileHeader.lower() == 'x-accel-redirect':
+                    sendfilePath = urllib.parse.quote(sendfilePath.encode('utf8'))
+                setResponseHeader(sendfileHeader, sendfilePath)
+                return lambda: iter(())
+
             setResponseHeader('Accept-Ranges', 'bytes')
             self.setContentHeaders(file, offset, endByte, contentDisposition)
 
@@ -287,6 +411,44 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
 
         return stream
 
+    def downloadRanges(self, file, ranges):
+        """
+        Returns a generator function that reads each of the byte ranges from
+        a single open handle on the file.
+        """
+        path = self.fullPath(file)
+
+        if not os.path.isfile(path):
+            raise GirderException(
+                'File %s does not exist.' % path,
+                'girder.utility.filesystem_assetstore_adapter.'
+                'file-does-not-exist')
+
+        def stream():
+            with open(path, 'rb') as f:
+                for index, (start, end) in enumerate(ranges):
+                    f.seek(start)
+                    while start < end:
+                        data = f.read(min(BUF_SIZE, end - start))
+                        if not data:
+                            break
+                        start += len(data)
+                        yield index, data
+
+        return stream
+
+    def _proxyCanSendRange(self, file, offset, endByte):
+        """
+        Check whether the byte range being downloaded is the one a proxy would
+        send in response to the current request: either the whole file with no
+        Range header, or the single range given by the Range header.
+        """
+        ranges = cherrypy.lib.httputil.get_ranges(
+            cherrypy.request.headers.get('Range'), file['size'])
+        if not ranges:
+            return offset == 0 and endByte == file['size']
+        return len(ranges) == 1 and tuple(ranges[0]) == (offset, endByte)
+
     def deleteFile(self, file):
         """
         Deletes the file from disk if it is the only File in this assetstore
@@ -305,10 +467,35 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
             if os.path.isfile(path):
                 os.remove(path)
 
+    def deleteFiles(self, files):
+        """
+        Deletes the data of a batch of files from disk, except for imported
+        files and data that is still used by a File outside of the batch.
+        """
+        paths = {file['sha512']: file['path'] for file in files
+                 if not file.get('imported')}
+        if not paths:
+            return
+
+        stillUsed = self.model('file').find({
+            'sha512': {'$in': list(paths)},
+            'assetstoreId': self.assetstore['_id'],
+            '_id': {'$nin': [file['_id'] for file in files]}
+        }, fields=['sha512'])
+        for file in stillUsed:
+            paths.pop(file['sha512'], None)
+
+        for relpath in six.viewvalues(paths):
+            path = os.path.join(self.assetstore['root'], relpath)
+            if os.path.isfile(path):
+                os.remove(path)
+
     def cancelUpload(self, upload):
         """
         Delete the temporary files associated with a given upload.
         """
+        with _hashersLock:
+            _hashers.pop(upload['tempFile'], None)
         if os.path.exists(upload['tempFile']):
             os.unlink(upload['tempFile'])
 
@@ -22,6 +22,9 @@ from hashlib import sha512
 import pymongo
 import six
 from six import BytesIO
+from six.moves import queue
+import sys
+import threading
 import uuid
 
 from girder import logger
@@ -29,13 +32,20 @@ from girder.api.rest import setResponseHeader
 from girder.models import getDbConnection
 from girder.models.model_base import ValidationException
 from . import hash_state
-from .abstract_assetstore_adapter import AbstractAssetstoreAdapter
+from .abstract_assetstore_adapter import AbstractAssetstoreAdapter, splitRanges
 
 
 # 2MB chunks. Clients must not send any chunks that are smaller than this
 # unless they are sending the final chunk.
 CHUNK_SIZE = 2097152
 
+# The number of chunks to write to the database with each insert_many call.
+INSERT_BATCH_SIZE = 8
+
+# The number of chunks to fetch from the database with each query when
+# downloading a file.
+DOWNLOAD_BATCH_SIZE = 8
+
 
 def _ensureChunkIndices(collection):
     """
@@ -47,11 +57,69 @@ def _ensureChunkIndices(collection):
     ], unique=True)
 
 
+def _prefetch(iterable, depth):
+    """
+    Iterate over an iterable in a background thread, keeping up to ``depth``
+    of its items ready ahead of the caller. The thread stops when the
+    returned generator is exhausted or closed.
+
+    :param iterable: The iterable to read ahead.
+    :param depth: The maximum number of items to read ahead.
+    :type depth: int
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((None, item)):
+                    return
+            put((None, done))
+        except Exception:
+            put((sys.exc_info(), None))
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            excInfo, item = items.get()
+            if excInfo is not None:
+                six.reraise(*excInfo)
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+
+
 class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
     """
     This assetstore type stores files within MongoDB using the GridFS data
     model.
+
+    Downloads fetch the chunks of a file in batches, and read up to
+    ``prefetchDepth`` batches ahead in a background thread so that database
+    latency overlaps with sending data to the client. Set it to 0 to fetch
+    each batch only when it is needed.
+
+    Uploads in parts must use a part size that is a multiple of the chunk
+    size, so that each part is stored as whole chunks whose index follows
+    from the part's offset.
     """
+    prefetchDepth = 2
+    supportsPartUploads = True
 
     @staticmethod
     def validateInfo(doc):
@@ -110,9 +178,61 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
         Creates a UUID that will be used to uniquely link each chunk to
         """
         upload['chunkUuid'] = uuid.uuid4().hex
+        if 'partSize' in upload:
+            if upload['partSize'] % CHUNK_SIZE:
+                raise ValidationException(
+                    'The part size must be a multiple of %d.' % CHUNK_SIZE,
+                    'partSize')
+            return upload
+        upload['chunkCount'] = 0
         upload['sha512state'] = hash_state.serializeHex(sha512())
         return upload
 
+    def findStoredData(self, sha512, size):
+        """
+        Files with the same data share their chunks, so the data is already
+        present if another file in this assetstore has the same hash and
+        size, and its last chunk exists.
+        """
+        file = self.model('file').findOne({
+            'sha512': sha512,
+            'size': size,
+            'assetstoreId': self.assetstore['_id'],
+            'chunkUuid': {'$exists': True}
+        }, fields=['chunkUuid', 'chunkSize'])
+        if file is None:
+            return None
+        chunkSize = file.get('chunkSize', CHUNK_SIZE)
+        if size and self.chunkColl.find_one({
+                'uuid': file['chunkUuid'],
+                'n': (size - 1) // chunkSize
+        }, projection=['_id']) is None:
+            return None
+        return {
+            'sha512': sha512,
+            'chunkUuid': file['chunkUuid'],
+            'chunkSize': chunkSize
+        }
+
+    def _insertChunks(self, upload, chunks):
+        """
+        Write a batch of chunks to the database. If a timeout occurs while we
+        are writing, we might have succeeded, in which case some of the
+        chunks will already exist when the write is retried. Therefore, log
+        duplicate key errors but don't stop.
+        """
+        try:
+            self.chunkColl.insert_many(chunks, ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            if e.details.get('writeConcernErrors') or any(
+                    error['code'] != 11000 for error in errors):
+                raise
+            logger.info('Received a DuplicateKeyError while uploading, '
+                        'probably because we reconnected to the database '
+                        '(chunk uuid %s parts %s)', upload['chunkUuid'],
+                        ', '.join(str(chunks[error['index']]['n']) for error in errors))
+
     def uploadChunk(self, upload, chunk):
         """
         Stores the uploaded chunk in fixed-sized pieces in the chunks
@@ -130,51 +250,33 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
         # Restore the internal state of the streaming SHA-512 checksum
         checksum = hash_state.restoreHex(upload['sha512state'], 'sha512')
 
-        # This bit of code will only do anything if there is a discrepancy
-        # between the received count of the upload record and the length of
-        # the file stored as chunks in the database. This code simply updates
-        # the sha512 state with the difference before reading the bytes sent
-        # from the user.
-        if self.requestOffset(upload) > upload['received']:
-            cursor = self.chunkColl.find({
-                'uuid': upload['chunkUuid'],
-                'n': {'$gte': upload['received'] // CHUNK_SIZE}
-            }, projection=['data']).sort('n', pymongo.ASCENDING)
-            for result in cursor:
-                checksum.update(result['data'])
-
-        cursor = self.chunkColl.find({
-            'uuid': upload['chunkUuid']
-        }, projection=['n']).sort('n', pymongo.DESCENDING).limit(1)
-        if cursor.count(True) == 0:
-            n = 0
-        else:
-            n = cursor[0]['n'] + 1
+        # Uploads track how many chunks they have stored; this is only missing
+        # from uploads started by older versions of Girder.
+        n = upload.get('chunkCount')
+        if n is None:
+            n = self._legacyNextChunk(upload, checksum)
 
         size = 0
         startingN = n
+        batch = []
 
         while not upload['received']+size > upload['size']:
             data = chunk.read(CHUNK_SIZE)
             if not data:
                 break
-            # If a timeout occurs while we are trying to load data, we might
-            # have succeeded, in which case we will get a DuplicateKeyError
-            # when it automatically retries.  Therefore, log this error but
-            # don't stop.
-            try:
-                self.chunkColl.insert_one({
-                    'n': n,
-                    'uuid': upload['chunkUuid'],
-                    'data': bson.binary.Binary(data)
-                })
-            except pymongo.errors.DuplicateKeyError:
-                logger.info('Received a DuplicateKeyError while uploading, '
-                            'probably because we reconnected to the database '
-                            '(chunk uuid %s part %d)', upload['chunkUuid'], n)
+            batch.append({
+                'n': n,
+                'uuid': upload['chunkUuid'],
+                'data': bson.binary.Binary(data)
+            })
+            if len(batch) >= INSERT_BATCH_SIZE:
+                self._insertChunks(upload, batch)
+                batch = []
             n += 1
             size += len(data)
             checksum.update(data)
+        if batch:
+            self._insertChunks(upload, batch)
         chunk.close()
 
         try:
@@ -185,21 +287,97 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
             self.chunkColl.delete_many({
                 'uuid': upload['chunkUuid'],
                 'n': {'$gte': startingN}
-            }, multi=True)
+            })
             raise
 
         # Persist the internal state of the checksum
         upload['sha512state'] = hash_state.serializeHex(checksum)
         upload['received'] += size
+        upload['chunkCount'] = n
         return upload
 
+    def uploadPart(self, upload, part, chunk):
+        """
+        Stores the part as the chunks that cover its offset. Chunks are
+        replaced if they already exist, so a part may be sent again.
+        """
+        offset, length = self.partRange(upload, part)
+
+        if isinstance(chunk, six.text_type):
+            chunk = chunk.encode('utf8')
+
+        if isinstance(chunk, six.binary_type):
+            chunk = BytesIO(chunk)
+
+        n = offset // CHUNK_SIZE
+        size = 0
+        batch = []
+        while size <= length:
+            data = chunk.read(min(CHUNK_SIZE, length + 1 - size))
+            if not data:
+                break
+            size += len(data)
+            if size > length:
+                break
+            batch.append(pymongo.ReplaceOne({
+                'uuid': upload['chunkUuid'],
+                'n': n
+            }, {
+                'n': n,
+                'uuid': upload['chunkUuid'],
+                'data': bson.binary.Binary(data)
+            }, upsert=True))
+            if len(batch) >= INSERT_BATCH_SIZE:
+                self.chunkColl.bulk_write(batch, ordered=False)
+                batch = []
+            n += 1
+        if batch:
+            self.chunkColl.bulk_write(batch, ordered=False)
+        chunk.close()
+
+        self.checkPartSize(upload, part, size)
+        return size
+
+    def _legacyNextChunk(self, upload, checksum):
+        """
+        Find the index of the next chunk of an upload that doesn't record it
+        by looking at the chunks in the database.
+
+        This bit of code will only do anything if there is a discrepancy
+        between the received count of the upload record and the length of the
+        file stored as chunks in the database. This code simply updates the
+        sha512 state with the difference before reading the bytes sent from
+        the user.
+        """
+        if self.requestOffset(upload) > upload['received']:
+            cursor = self.chunkColl.find({
+                'uuid': upload['chunkUuid'],
+                'n': {'$gte': upload['received'] // CHUNK_SIZE}
+            }, projection=['data']).sort('n', pymongo.ASCENDING)
+            for result in cursor:
+                checksum.update(result['data'])
+
+        cursor = self.chunkColl.find({
+            'uuid': upload['chunkUuid']
+        }, projection=['n']).sort('n', pymongo.DESCENDING).limit(1)
+        if cursor.count(True) == 0:
+            return 0
+        else:
+            return cursor[0]['n'] + 1
+
     def requestOffset(self, upload):
         """
         The offset will be the CHUNK_SIZE * total number of chunks in the
         database for this file. We return the max of that and the received
         count because in testing mode we are uploading chunks that are smaller
         than the CHUNK_SIZE, which in practice will not work.
+
+        If the upload records its chunk count, the stored chunks hold exactly
+        the bytes it has received.
         """
+        if 'chunkCount' in upload:
+            return upload['received']
+
         cursor = self.chunkColl.find({
             'uuid': upload['chunkUuid']
         }, projection=['n']).sort('n', pymongo.DESCENDING).limit(1)
@@ -213,10 +391,19 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
     def finalizeUpload(self, upload, file):
         """
         Grab the final state of the checksum and set it on the file object,
-        and write the generated UUID into the file itself.
+        and write the generated UUID into the file itself. Uploads in parts
+        are hashed by reading their chunks back in order.
         """
-        hash = hash_state.restoreHex(upload['sha512state'],
-                                     'sha512').hexdigest()
+        if 'partSize' in upload:
+            checksum = sha512()
+            for batch in self._chunkBatches(
+                    upload, 0, (upload['size'] - 1) // CHUNK_SIZE):
+                for data in batch:
+                    checksum.update(data)
+            hash = checksum.hexdigest()
+        else:
+            hash = hash_state.restoreHex(upload['sha512state'],
+                                         'sha512').hexdigest()
 
         file['sha512'] = hash
         file['chunkUuid'] = upload['chunkUuid']
@@ -249,32 +436,85 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
             n = offset // file['chunkSize']
             chunkOffset = offset % file['chunkSize']
 
-        cursor = self.chunkColl.find({
-            'uuid': file['chunkUuid'],
-            'n': {'$gte': n}
-        }, projection=['data']).sort('n', pymongo.ASCENDING)
-
         def stream():
             co = chunkOffset  # Can't assign to outer scope without "nonlocal"
             position = offset
-            shouldBreak = False
 
-            for chunk in cursor:
-                chunkLen = len(chunk['data'])
+            batches = self._chunkBatches(
+                file, n, (endByte - 1) // file['chunkSize'])
+            if self.prefetchDepth > 0:
+                batches = _prefetch(batches, self.prefetchDepth)
 
-                if position + chunkLen > endByte:
-                    chunkLen = endByte - position + co
-                    shouldBreak = True
+            for batch in batches:
+                for data in batch:
+                    chunkLen = len(data)
+                    shouldBreak = False
 
-                yield chunk['data'][co:chunkLen]
+                    if position + chunkLen > endByte:
+                        chunkLen = endByte - position + co
+                        shouldBreak = True
 
-                if shouldBreak:
-                    break
+                    # Only copy the data if we need part of the chunk
+                    if co > 0 or chunkLen < len(data):
+                        data = data[co:chunkLen]
+                    yield data
 
-                position += chunkLen - co
+                    if shouldBreak:
+                        return
 
-                if co > 0:
-                    co = 0
+                    position += chunkLen - co
+
+                    if co > 0:
+                        co = 0
+
+        return stream
+
+    def _chunkBatches(self, file, n, last):
+        """
+        Generate the data of a file's chunks in order, from chunk n through
+        chunk last, as lists of up to DOWNLOAD_BATCH_SIZE chunks fetched with
+        one query.
+        """
+        while n <= last:
+            end = min(n + DOWNLOAD_BATCH_SIZE, last + 1)
+            cursor = self.chunkColl.find({
+                'uuid': file['chunkUuid'],
+                'n': {'$gte': n, '$lt': end}
+            }, projection=['data'], batch_size=end - n
+            ).sort('n', pymongo.ASCENDING)
+            batch = [chunk['data'] for chunk in cursor]
+            if not batch:
+                return
+            yield batch
+            n = end
+
+    def downloadRanges(self, file, ranges):
+        """
+        Returns a generator function that fetches all of the chunks needed for
+        the byte ranges with a single query.
+        """
+        chunkSize = file['chunkSize']
+        needed = set()
+        for start, end in ranges:
+            needed.update(range(start // chunkSize, (end - 1) // chunkSize + 1))
+        if not needed:
+            return lambda: iter(())
+
+        cursor = self.chunkColl.find({
+            'uuid': file['chunkUuid'],
+            'n': {'$in': sorted(needed)}
+        }, projection=['n', 'data']).sort('n', pymongo.ASCENDING)
+
+        def stream():
+            current = 0
+            for chunk in cursor:
+                position = chunk['n'] * chunkSize
+                for index, data in splitRanges(
+                        (chunk['data'],), position, ranges[current:], current):
+                    yield index, data
+                # Skip past the ranges that end within this chunk
+                while current < len(ranges) and ranges[current][1] <= position + chunkSize:
+                    current += 1
 
         return stream
 
@@ -296,6 +536,24 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
                 # check will be necessary to remove the abandoned file
                 pass
 
+    def deleteFiles(self, files):
+        """
+        Delete the chunks of a batch of files with a single query, except for
+        chunks that are still used by a File outside of the batch.
+        """
+        uuids = set(file['chunkUuid'] for file in files)
+        stillUsed = self.model('file').find({
+            'chunkUuid': {'$in': list(uuids)},
+            'assetstoreId': self.assetstore['_id'],
+            '_id': {'$nin': [file['_id'] for file in files]}
+        }, fields=['chunkUuid'])
+        uuids -= set(file['chunkUuid'] for file in stillUsed)
+        if uuids:
+            try:
+                self.chunkColl.delete_many({'uuid': {'$in': list(uuids)}})
+            except pymongo.errors.AutoReconnect:
+                pass
+
     def cancelUpload(self, upload):
         """
         Delete all of the chunks associated with a given upload.
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+"""
+This module wakes up the threads that are streaming notifications to a user
+or token when new notifications are saved for them, so that those threads
+don't have to poll the database.
+
+Subscribers are identified by a key, which is the user or token id the
+notifications are for. Whenever a notification is saved, its key is published
+on the bus, and every subscription with that key is woken. Which bus is used
+is chosen by the ``notification_bus`` value of the ``server`` config section:
+
+``local``
+    Only notifications saved in this process wake subscribers. This is
+    appropriate when running a single server process, and in the tests.
+``mongo`` (the default)
+    Published keys are also written to a capped collection, which every
+    server process tails, so notifications saved by any process (or by
+    scripts using the models directly) wake subscribers in all of them.
+"""
+
+import collections
+import pymongo
+import threading
+import time
+
+from bson.objectid import ObjectId
+from girder import logger
+from girder.utility import config
+
+# The name and size in bytes of the capped collection used by MongoNotificationBus
+BUS_COLLECTION = 'notification_bus'
+BUS_COLLECTION_SIZE = 1024 * 1024
+
+
+class Subscription(object):
+    """
+    A subscription to the notifications for one key. Call :py:meth:`wait` to
+    block until a notification is published, and :py:meth:`close` when the
+    subscription is no longer needed.
+    """
+    def __init__(self, bus, key):
+        self.key = key
+        self._bus = bus
+        self._event = threading.Event()
+
+    def notify(self):
+        self._event.set()
+
+    def wait(self, timeout):
+        """
+        Block until a notification is published for this key, or the timeout
+        expires. Notifications published since the last call return
+        immediately.
+
+        :param timeout: The maximum time to wait, in seconds.
+        :type timeout: float
+        :returns: True if a notification was published.
+        """
+        published = self._event.wait(timeout)
+        # Only clear after a successful wait, so that a notification that
+        # arrives just as the wait times out is kept for the next call
+        if published:
+            self._event.clear()
+        return bool(published)
+
+    def close(self):
+        self._bus._unsubscribe(self)
+
+
+class LocalNotificationBus(object):
+    """
+    A notification bus that only delivers notifications within this process.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = collections.defaultdict(set)
+
+    def subscribe(self, key):
+        """
+        Subscribe to the notifications for a key.
+
+        :param key: The user or token id.
+        :returns: a :py:class:`Subscription`.
+        """
+        subscription = Subscription(self, str(key))
+        with self._lock:
+            self._subscriptions[subscription.key].add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.key)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.key]
+
+    def publish(self, key):
+        """
+        Wake all of the subscriptions for a key.
+
+        :param key: The user or token id.
+        """
+        self._notify(str(key))
+
+    def _notify(self, key):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(key, ()))
+        for subscription in subscriptions:
+            subscription.notify()
+
+    def subscriberCount(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscriptions.values())
+
+
+class MongoNotificationBus(LocalNotificationBus):
+    """
+    A notification bus that also delivers notifications between processes by
+    way of a capped collection. The collection is tailed by a background
+    thread, which is started when the first subscription is made.
+    """
+    def __init__(self):
+        super(MongoNotificationBus, self).__init__()
+        self._origin = ObjectId()
+        self._thread = None
+        self._busCollection = None
+
+    def _collection(self):
+        if self._busCollection is None:
+            self._busCollection = self._createCollection()
+        return self._busCollection
+
+    def _createCollection(self):
+        from girder.models import getDbConnection
+
+        db = getDbConnection().get_default_database()
+        if BUS_COLLECTION not in db.collection_names():
+            try:
+                db.create_collection(
+                    BUS_COLLECTION, capped=True, size=BUS_COLLECTION_SIZE)
+            except pymongo.errors.CollectionInvalid:
+                pass  # Another process created it first
+        elif not db[BUS_COLLECTION].options().get('capped'):
+            # The collection was dropped and recreated by an insert
+            db.command('convertToCapped', BUS_COLLECTION, size=BUS_COLLECTION_SIZE)
+        return db[BUS_COLLECTION]
+
+    def subscribe(self, key):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._tail)
+                    self._thread.daemon = True
+                    self._thread.start()
+        return super(MongoNotificationBus, self).subscribe(key)
+
+    def publish(self, key):
+        super(MongoNotificationBus, self).publish(key)
+        try:
+            self._collection().insert_one({'key': str(key), 'origin': self._origin})
+        except pymongo.errors.PyMongoError:
+            logger.exception('Failed to publish notification for %s' % key)
+            self._busCollection = None
+
+    def _tail(self):
+        while True:
+            try:
+                collection = self._collection()
+                # Tailable cursors on empty collections are closed immediately,
+                # so make sure there is something to start from.
+                last = list(collection.find().sort('$natural', -1).limit(1))
+                if last:
+                    lastId = last[0]['_id']
+                else:
+                    lastId = collection.insert_one({'origin': self._origin}).inserted_id
+                cursor = collection.find(cursor_type=pymongo.CursorType.TAILABLE_AWAIT)
+                # Anything published while the cursor was being (re)opened was
+                # missed, so have every subscriber check for notifications.
+                self._notifyAll()
+                seen = False
+                checked = False
+                while cursor.alive:
+                    for doc in cursor:
+                        # Skip the entries that were there before we started;
+                        # ObjectIds from other processes aren't ordered, so
+                        # this uses the insertion order rather than a query.
+                        if not seen:
+                            if doc['_id'] == lastId:
+                                seen = True
+                                continue
+                            if not checked:
+                                # If lastId was evicted from the capped
+                                # collection before the cursor opened, the
+                                # cursor never reaches it, so treat every
+                                # entry as new (at worst a spurious wakeup).
+                                checked = True
+                                seen = collection.find_one(
+                                    {'_id': lastId}, projection=['_id']) is None
+                            if not seen:
+                                continue
+                        if doc.get('key') and doc['origin'] != self._origin:
+                            self._notify(doc['key'])
+            except pymongo.errors.PyMongoError:
+                logger.exception('Error tailing the notification bus')
+                self._busCollection = None
+            time.sleep(1)
+
+    def _notifyAll(self):
+        with self._lock:
+            subscriptions = [sub for subs in self._subscriptions.values() for sub in subs]
+        for subscription in subscriptions:
+            subscription.notify()
+
+
+_bus = None
+_busLock = threading.Lock()
+
+
+def getNotificationBus():
+    """
+    Get the notification bus for this process, as chosen by the server
+    configuration.
+    """
+    global _bus
+    if _bus is None:
+        with _busLock:
+            if _bus is None:
+                kind = config.getConfig()['server'].get('notification_bus', 'mongo')
+                if kind == 'local':
+                    _bus = LocalNotificationBus()
+                else:
+                    _bus = MongoNotificationBus()
+    return _bus
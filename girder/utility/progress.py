@@ -19,6 +19,7 @@
 
 import cherrypy
 import datetime
+import threading
 import time
 
 from .model_importer import ModelImporter
@@ -31,7 +32,11 @@ class ProgressContext(ModelImporter):
     """
     This class is a context manager that can be used to update progress in a way
     that rate-limits writes to the database and guarantees a flush when the
-    context is exited. This is a no-op if "on" is set to False, which is
+    context is exited. Updates are applied to the in-memory progress record
+    right away, and accumulated so that each write only sets the fields that
+    changed and increments the current value by the sum of the increments
+    since the last write. It may be updated from several threads at once.
+    This is a no-op if "on" is set to False, which is
     meant as a convenience for callers. Any additional kwargs passed to this
     constructor are passed through to the ``initProgress`` method of the
     notification model.
@@ -53,8 +58,16 @@ class ProgressContext(ModelImporter):
 
         if on:
             self._lastSave = time.time()
+            self._lock = threading.Lock()
+            self._resetPending()
             self.progress = self.model('notification').initProgress(**kwargs)
 
+    def _resetPending(self):
+        self._pendingFields = set()
+        self._pendingIncrement = 0
+        self._pendingUpdates = 0
+        self._pendingExpires = None
+
     def __enter__(self):
         return self
 
@@ -76,17 +89,17 @@ class ProgressContext(ModelImporter):
             if isinstance(excValue, (ValidationException, RestException)):
                 message = 'Error: '+excValue.message
 
-        self.model('notification').updateProgress(
-            self.progress, state=state, message=message,
-            expires=datetime.datetime.utcnow() + datetime.timedelta(seconds=30)
-        )
+        self._update(
+            True, state=state, message=message,
+            expires=datetime.datetime.utcnow() + datetime.timedelta(seconds=30))
 
     def update(self, force=False, **kwargs):
         """
         Update the underlying progress record. This will only actually save
         to the database if at least self.interval seconds have passed since
         the last time the record was written to the database. Accepts the
-        same kwargs as Notification.updateProgress.
+        same kwargs as Notification.updateProgress, and always writes on
+        completion or error, when the context is exited.
 
         :param force: Whether we should force the write to the database. Use
             only in cases where progress may be indeterminate for a long time.
@@ -96,12 +109,30 @@ class ProgressContext(ModelImporter):
         setResponseTimeLimit()
         if not self.on:
             return
-        save = (time.time() - self._lastSave > self.interval) or force
-        self.progress = self.model('notification').updateProgress(
-            self.progress, save, **kwargs)
-
-        if save:
-            self._lastSave = time.time()
+        self._update(force, **kwargs)
+
+    def _update(self, force, **kwargs):
+        with self._lock:
+            data = self.progress['data']
+            if 'increment' in kwargs:
+                data['current'] += kwargs['increment']
+                self._pendingIncrement += kwargs['increment']
+            for field in ('total', 'current', 'state', 'message'):
+                if field in kwargs:
+                    data[field] = kwargs[field]
+                    self._pendingFields.add(field)
+            if 'expires' in kwargs:
+                self._pendingExpires = kwargs['expires']
+            self._pendingUpdates += 1
+
+            if force or time.time() - self._lastSave > self.interval:
+                self.model('notification').flushProgress(
+                    self.progress, fields=self._pendingFields,
+                    increment=self._pendingIncrement,
+                    updates=self._pendingUpdates,
+                    expires=self._pendingExpires)
+                self._resetPending()
+                self._lastSave = time.time()
 
 
 noProgress = ProgressContext(False)
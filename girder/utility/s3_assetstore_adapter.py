@@ -23,7 +23,10 @@ import cherrypy
 import json
 import re
 import requests
+import shutil
 import six
+import tempfile
+import threading
 import uuid
 
 from girder import logger, events
@@ -104,9 +107,14 @@ class S3AssetstoreAdapter(AbstractAssetstoreAdapter):
     This assetstore type stores files on S3. It is responsible for generating
     HMAC-signed messages that authorize the client to communicate directly with
     the S3 server where the files are stored.
+
+    Uploads in parts are proxied through Girder to an S3 multipart upload, so
+    every part except the last must be at least MIN_PART_LEN bytes long.
     """
 
     CHUNK_LEN = 1024 * 1024 * 32  # Chunk size for uploading
+    MIN_PART_LEN = 1024 * 1024 * 5  # Smallest part S3 accepts, except the last
+    supportsPartUploads = True
     HMAC_TTL = 120  # Number of seconds each signed message is valid
 
     @staticmethod
@@ -169,6 +177,7 @@ class S3AssetstoreAdapter(AbstractAssetstoreAdapter):
         :param assetstore: The assetstore to act on.
         """
         super(S3AssetstoreAdapter, self).__init__(assetstore)
+        self._local = threading.local()
         if ('accessKeyId' in self.assetstore and 'secret' in self.assetstore and
                 'service' in self.assetstore):
             self.assetstore['botoConnect'] = makeBotoConnectParams(
@@ -203,6 +212,9 @@ class S3AssetstoreAdapter(AbstractAssetstoreAdapter):
         path = '/%s/%s' % (self.assetstore['bucket'], key)
         headers = self._getRequestHeaders(upload)
 
+        if 'partSize' in upload:
+            return self._initPartUpload(upload, path, key, headers)
+
         chunked = upload['size'] > self.CHUNK_LEN
 
         upload['behavior'] = 's3'
@@ -231,6 +243,48 @@ class S3AssetstoreAdapter(AbstractAssetstoreAdapter):
         upload['s3']['request']['headers'] = headers
         return upload
 
+    def _initPartUpload(self, upload, path, key, headers):
+        """
+        Start the S3 multipart upload that the parts of an upload will be
+        sent to, so that they can be proxied concurrently.
+        """
+        if (upload['partSize'] < self.MIN_PART_LEN and
+                upload['size'] > upload['partSize']):
+            raise ValidationException(
+                'The part size must be at least %d.' % self.MIN_PART_LEN,
+                'partSize')
+
+        mp = self._getBucket().initiate_multipart_upload(key, headers=headers)
+        upload['s3'] = {
+            'chunked': True,
+            'chunkLength': upload['partSize'],
+            'relpath': path,
+            'key': key,
+            'uploadId': mp.id,
+            'keyName': mp.key_name
+        }
+        return upload
+
+    def uploadPart(self, upload, part, chunk):
+        """
+        Sends the part to S3 as the matching part of the multipart upload.
+        S3 replaces a part that is sent again.
+        """
+        self.partRange(upload, part)
+
+        if isinstance(chunk, six.text_type):
+            chunk = chunk.encode('utf8')
+
+        chunk = self._seekable(chunk)
+        mp = boto.s3.multipart.MultiPartUpload(self._getBucket())
+        mp.id = upload['s3']['uploadId']
+        mp.key_name = upload['s3']['keyName']
+        key = mp.upload_part_from_file(
+            chunk, part + 1, headers={'Content-Type': upload.get('mimeType', '')})
+
+        self.checkPartSize(upload, part, key.size)
+        return key.size
+
     def uploadChunk(self, upload, chunk):
         """
         Rather than processing actual bytes of the chunk, this will generate
@@ -286,6 +340,15 @@ class S3AssetstoreAdapter(AbstractAssetstoreAdapter):
         return upload
 
     def _getBucket(self, validate=True):
+        """
+        Get the bucket of this assetstore. The connection to S3 is kept for
+        the next call from the same thread, since adapters are shared between
+        requests but boto connections should not be shared between threads.
+        """
+        bucket = getattr(self._local, 'bucket', None)
+        if bucket is not None:
+            return bucket
+
         conn = botoConnectS3(self.assetstore['botoConnect'])
         bucket = conn.lookup(bucket_name=self.assetstore['bucket'],
                              validate=validate)
@@ -293,16 +356,33 @@ class S3AssetstoreAdapter(AbstractAssetstoreAdapter):
         if not bucket:
             raise Exception('Could not connect to S3 bucket.')
 
+        self._local.bucket = bucket
         return bucket
 
+    def _seekable(self, chunk):
+        """
+        boto reads a chunk twice, to sign it and to send it, so chunks that
+        are streamed from the request body are spooled to a temporary file.
+        """
+        if isinstance(chunk, six.binary_type):
+            return six.BytesIO(chunk)
+        if hasattr(chunk, 'seek'):
+            return chunk
+        spool = tempfile.TemporaryFile()
+        shutil.copyfileobj(chunk, spool)
+        chunk.close()
+        spool.seek(0)
+        return spool
+
     def _proxiedUploadChunk(self, upload, chunk):
         """
         Clients that do not support direct-to-S3 upload behavior will go through
         this method by sending the chunk as a multipart-encoded file parameter
-        as they would with other assetstore types. Girder will send the data
-        to S3 on behalf of the client.
+        or as the request body, as they would with other assetstore types.
+        Girder will send the data to S3 on behalf of the client.
         """
         bucket = self._getBucket()
+        chunk = self._seekable(chunk)
 
         if upload['s3']['chunked']:
             if 'uploadId' in upload['s3']:
@@ -418,9 +498,16 @@ class S3AssetstoreAdapter(AbstractAssetstoreAdapter):
                     yield ''
                 return stream
         else:
+            if endByte is None or endByte > file['size']:
+                endByte = file['size']
+
             def stream():
-                if file['size'] > 0:
-                    pipe = requests.get(urlFn(key=file['s3Key']), stream=True)
+                if endByte > offset:
+                    rangeHeaders = {}
+                    if offset > 0 or endByte < file['size']:
+                        rangeHeaders['Range'] = 'bytes=%d-%d' % (offset, endByte - 1)
+                    pipe = requests.get(
+                        urlFn(key=file['s3Key']), headers=rangeHeaders, stream=True)
                     for chunk in pipe.iter_content(chunk_size=BUF_LEN):
                         if chunk:
                             yield chunk
@@ -490,6 +577,32 @@ class S3AssetstoreAdapter(AbstractAssetstoreAdapter):
                     'key': file['s3Key']
                 })
 
+    def deleteFiles(self, files):
+        """
+        Queue a single asynchronous request deleting the keys of a batch of
+        files, except for keys that are still used by a File outside of the
+        batch.
+        """
+        keys = {file['relpath']: file['s3Key'] for file in files
+                if file['size'] > 0 and 'relpath' in file}
+        if not keys:
+            return
+
+        stillUsed = self.model('file').find({
+            'relpath': {'$in': list(keys)},
+            'assetstoreId': self.assetstore['_id'],
+            '_id': {'$nin': [file['_id'] for file in files]}
+        }, fields=['relpath'])
+        for file in stillUsed:
+            keys.pop(file['relpath'], None)
+
+        if keys:
+            events.daemon.trigger('_s3_assetstore_delete_files', {
+                'botoConnect': self.assetstore.get('botoConnect', {}),
+                'bucket': self.assetstore['bucket'],
+                'keys': list(six.viewvalues(keys))
+            })
+
     def fileUpdated(self, file):
         """
         On file update, if the name or the MIME type changed, we must update
@@ -756,5 +869,19 @@ def _deleteFileImpl(event):
         bucket.delete_key(key)
 
 
+def _deleteFilesImpl(event):
+    """
+    Uses boto to delete several keys with multi-object delete requests.
+    """
+    info = event.info
+    conn = botoConnectS3(info.get('botoConnect', {}))
+    bucket = conn.lookup(bucket_name=info['bucket'], validate=False)
+    result = bucket.delete_keys(info['keys'], quiet=True)
+    for error in result.errors:
+        logger.error('Failed to delete S3 key %s: %s' % (error.key, error.message))
+
+
 events.bind('_s3_assetstore_delete_file', '_s3_assetstore_delete_file',
             _deleteFileImpl)
+events.bind('_s3_assetstore_delete_files', '_s3_assetstore_delete_files',
+            _deleteFilesImpl)
@@ -44,6 +44,7 @@ def configureServer(test=False, plugins=None, curConfig=None):
     if curConfig is None:
         curConfig = config.getConfig()
 
+    migrateDatabase()
     routeTable = loadRouteTable()
 
     appconf = {
@@ -89,7 +90,8 @@ def configureServer(test=False, plugins=None, curConfig=None):
             'mode': 'testing',
             'api_root': 'api/v1',
             'static_root': 'static',
-            'api_static_root': '../static'
+            'api_static_root': '../static',
+            'notification_bus': 'local'
         }})
 
     mode = curConfig['server']['mode'].lower()
@@ -129,6 +131,20 @@ def configureServer(test=False, plugins=None, curConfig=None):
     return root, appconf
 
 
+def migrateDatabase():
+    """
+    Bring documents created by older versions of Girder up to date with the
+    current schema. Each step is a no-op if there is nothing to migrate.
+    """
+    folderModel = model_importer.ModelImporter().model('folder')
+    itemModel = model_importer.ModelImporter().model('item')
+    legacy = {'ancestorIds': {'$exists': False}}
+    if (folderModel.findOne(legacy, fields=['_id']) or
+            itemModel.findOne(legacy, fields=['_id'])):
+        logprint.info('Recording ancestors of all folders and items')
+        folderModel.backfillAncestorIds()
+
+
 def loadRouteTable(reconcileRoutes=False):
     """
     Retrieves the route table from Girder and reconciles the state of it with the current
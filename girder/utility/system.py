@@ -28,6 +28,7 @@ import time
 import girder
 from girder import logger
 from girder.models import getDbConnection
+from girder.utility.model_importer import ModelImporter
 
 
 def _objectToDict(obj):
@@ -152,6 +153,8 @@ def getStatus(mode='basic', user=None):
             True for threadId in cherrypy.tools.status.seenThreads
             if 'end' not in cherrypy.tools.status.seenThreads[threadId]])
         status['cherrypyThreadPoolSize'] = cherrypy.server.thread_pool
+        status['settingCache'] = ModelImporter.model('setting').cacheStats()
+        status['progressWrites'] = ModelImporter.model('notification').progressStats()
 
     if mode == 'slow' and isAdmin:
         _computeSlowStatus(process, status, db)
@@ -168,6 +168,39 @@ class MockSnakebiteClient(object):
 # sufficient in my initial experiments.
 sys.modules['snakebite.client'].Client = MockSnakebiteClient
 
+# The (offset, length) of each WebHDFS read served by webHdfsReadMock
+_webHdfsReads = []
+
+
+@httmock.all_requests
+def webHdfsReadMock(url, request):
+    """
+    A stand-in for WebHDFS OPEN requests, which redirects the read to a data
+    node like WebHDFS does, and serves the requested range of a file from the
+    mock filesystem.
+    """
+    params = dict(six.moves.urllib.parse.parse_qsl(url.query))
+    if params.get('op') != 'OPEN':
+        raise Exception('Unexpected request: ' + repr(url))
+    if url.netloc == 'localhost:50070':
+        return {
+            'status_code': 307,
+            'headers': {
+                'Location': 'http://localhost:50075%s?%s' % (url.path, url.query)
+            }
+        }
+    elif url.netloc == 'localhost:50075':
+        offset, length = int(params['offset']), int(params['length'])
+        _webHdfsReads.append((offset, length))
+        path = url.path[len('/webhdfs/v1/'):]
+        with open(os.path.join(_mockRoot, path), 'rb') as f:
+            f.seek(offset)
+            return {
+                'status_code': 200,
+                'content': f.read(length)
+            }
+    raise Exception('Unexpected request: ' + repr(url))
+
 
 def setUpModule():
     base.enabledPlugins.append('hdfs_assetstore')
@@ -312,25 +345,37 @@ class HdfsAssetstoreTest(base.TestCase):
         self.assertStatusOk(resp)
         self.assertEqual(resp.collapse_body().strip(), 'hello')
 
-        # Test download with range header
-        resp = self.request(path='/file/%s/download' % file['_id'],
-                            user=self.admin, isJson=False,
-                            additionalHeaders=[('Range', 'bytes=1-3')])
-        self.assertStatus(resp, 206)
-        self.assertEqual('ell', self.getBody(resp))
-        self.assertEqual(resp.headers['Accept-Ranges'], 'bytes')
-        self.assertEqual(resp.headers['Content-Length'], 3)
-        self.assertEqual(resp.headers['Content-Range'], 'bytes 1-3/6')
-
-        # Test download with range header with skipped chunk
+        # A range at the start of the file is read with the native client
         resp = self.request(path='/file/%s/download' % file['_id'],
                             user=self.admin, isJson=False,
-                            additionalHeaders=[('Range', 'bytes=4-')])
+                            additionalHeaders=[('Range', 'bytes=0-3')])
         self.assertStatus(resp, 206)
-        self.assertEqual('o\n', self.getBody(resp))
-        self.assertEqual(resp.headers['Accept-Ranges'], 'bytes')
-        self.assertEqual(resp.headers['Content-Length'], 2)
-        self.assertEqual(resp.headers['Content-Range'], 'bytes 4-5/6')
+        self.assertEqual('hell', self.getBody(resp))
+        self.assertEqual(resp.headers['Content-Range'], 'bytes 0-3/6')
+
+        # Other ranges are read from WebHDFS, starting at their offset
+        del _webHdfsReads[:]
+        with httmock.HTTMock(webHdfsReadMock):
+            # Test download with range header
+            resp = self.request(path='/file/%s/download' % file['_id'],
+                                user=self.admin, isJson=False,
+                                additionalHeaders=[('Range', 'bytes=1-3')])
+            self.assertStatus(resp, 206)
+            self.assertEqual('ell', self.getBody(resp))
+            self.assertEqual(resp.headers['Accept-Ranges'], 'bytes')
+            self.assertEqual(resp.headers['Content-Length'], 3)
+            self.assertEqual(resp.headers['Content-Range'], 'bytes 1-3/6')
+
+            # Test download with range header with skipped chunk
+            resp = self.request(path='/file/%s/download' % file['_id'],
+                                user=self.admin, isJson=False,
+                                additionalHeaders=[('Range', 'bytes=4-')])
+            self.assertStatus(resp, 206)
+            self.assertEqual('o\n', self.getBody(resp))
+            self.assertEqual(resp.headers['Accept-Ranges'], 'bytes')
+            self.assertEqual(resp.headers['Content-Length'], 2)
+            self.assertEqual(resp.headers['Content-Range'], 'bytes 4-5/6')
+        self.assertEqual(_webHdfsReads, [(1, 3), (4, 2)])
 
         helloTxtPath = os.path.join(_mockRoot, 'to_import', 'hello.txt')
 
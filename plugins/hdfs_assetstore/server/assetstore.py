@@ -22,6 +22,7 @@ import posixpath
 import pwd
 import requests
 from snakebite.client import Client as HdfsClient
+import threading
 import uuid
 
 from girder import logger
@@ -31,9 +32,42 @@ from girder.utility.abstract_assetstore_adapter import AbstractAssetstoreAdapter
 
 
 class HdfsAssetstoreAdapter(AbstractAssetstoreAdapter):
+    """
+    This assetstore type stores files in HDFS. Metadata operations and reads
+    of whole files use the native snakebite client. Reads that start partway
+    into a file ask WebHDFS for just the requested byte range, since
+    snakebite can only stream a file from its beginning, and appends also go
+    through WebHDFS. WebHDFS responses are read ``readBufferSize`` bytes at
+    a time.
+    """
+    readBufferSize = 65536
+
     def __init__(self, assetstore):
         super(HdfsAssetstoreAdapter, self).__init__(assetstore)
-        self.client = self._getClient(self.assetstore)
+        self._local = threading.local()
+
+    @property
+    def client(self):
+        """
+        The snakebite client of the current thread. Adapters are shared
+        between requests, but snakebite clients must not be used by several
+        threads at once.
+        """
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self._getClient(self.assetstore)
+        return client
+
+    @property
+    def session(self):
+        """
+        The requests session of the current thread, which keeps connections
+        to the WebHDFS name and data nodes open between calls.
+        """
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
 
     @staticmethod
     def _getHdfsUser(assetstore):
@@ -51,6 +85,29 @@ class HdfsAssetstoreAdapter(AbstractAssetstoreAdapter):
             effective_user=HdfsAssetstoreAdapter._getHdfsUser(assetstore)
         )
 
+    def _webHdfsRequest(self, method, path, op, **kwargs):
+        """
+        Send a request to the WebHDFS name node for an operation on a path.
+        Extra keyword arguments are passed to the requests session.
+        """
+        hdfs = self.assetstore['hdfs']
+        params = {
+            'op': op,
+            'namenoderpcaddress': '%s:%d' % (hdfs['host'], hdfs['port']),
+            'user.name': self._getHdfsUser(self.assetstore)
+        }
+        params.update(kwargs.pop('params', {}))
+        url = 'http://%s:%d/webhdfs/v1%s' % (hdfs['host'], hdfs['webHdfsPort'], path)
+        return self.session.request(method, url, params=params, **kwargs)
+
+    @staticmethod
+    def _checkResponse(resp, action):
+        try:
+            resp.raise_for_status()
+        except Exception:
+            logger.exception('HDFS response: ' + resp.text)
+            raise Exception('Error %s HDFS, see log for details.' % action)
+
     def _absPath(self, doc):
         """
         Return the absolute path in HDFS for a given file or upload.
@@ -128,30 +185,38 @@ class HdfsAssetstoreAdapter(AbstractAssetstoreAdapter):
             path = self._absPath(file)
 
         def stream():
+            if offset >= endByte:
+                return
+            if offset > 0:
+                for chunk in self._readRange(path, offset, endByte - offset):
+                    yield chunk
+                return
+
             position = 0
-            fileStream = self.client.cat([path]).next()
-            shouldBreak = False
-            for chunk in fileStream:
-                chunkLen = len(chunk)
-
-                if position < offset:
-                    if position + chunkLen > offset:
-                        if position + chunkLen > endByte:
-                            chunkLen = endByte - position
-                            shouldBreak = True
-                        yield chunk[offset - position:chunkLen]
-                else:
-                    if position + chunkLen > endByte:
-                        chunkLen = endByte - position
-                        shouldBreak = True
-                    yield chunk[:chunkLen]
-
-                position += chunkLen
-
-                if shouldBreak:
+            for chunk in self.client.cat([path]).next():
+                if position + len(chunk) >= endByte:
+                    yield chunk[:endByte - position]
                     break
+                yield chunk
+                position += len(chunk)
         return stream
 
+    def _readRange(self, path, offset, length):
+        """
+        Stream a byte range of a file from WebHDFS, which redirects the read
+        to a data node holding the range.
+        """
+        resp = self._webHdfsRequest('GET', path, 'OPEN', stream=True, params={
+            'offset': offset,
+            'length': length
+        })
+        try:
+            self._checkResponse(resp, 'reading from')
+            for chunk in resp.iter_content(self.readBufferSize):
+                yield chunk
+        finally:
+            resp.close()
+
     def deleteFile(self, file):
         """
         Only deletes the file if it is managed (i.e. not an imported file).
@@ -162,6 +227,19 @@ class HdfsAssetstoreAdapter(AbstractAssetstoreAdapter):
                 raise Exception('Failed to delete HDFS file %s: %s' % (
                     res['path'], res.get('error')))
 
+    def deleteFiles(self, files):
+        """
+        Deletes the managed files of a batch with a single request.
+        """
+        paths = [self._absPath(file) for file in files
+                 if not file['hdfs'].get('imported')]
+        if not paths:
+            return
+        for res in self.client.delete(paths):
+            if not res['result']:
+                raise Exception('Failed to delete HDFS file %s: %s' % (
+                    res['path'], res.get('error')))
+
     def initUpload(self, upload):
         uid = uuid.uuid4().hex
         relPath = posixpath.join(uid[0:2], uid[2:4], uid)
@@ -192,45 +270,19 @@ class HdfsAssetstoreAdapter(AbstractAssetstoreAdapter):
         # implementing the append operation ourselves with protobuf is too
         # expensive. If snakebite adds support for append in future releases,
         # we should use that instead.
-        url = ('http://%s:%d/webhdfs/v1%s?op=APPEND&namenoderpcaddress=%s:%d'
-               '&user.name=%s')
-        url %= (
-            self.assetstore['hdfs']['host'],
-            self.assetstore['hdfs']['webHdfsPort'],
-            self._absPath(upload),
-            self.assetstore['hdfs']['host'],
-            self.assetstore['hdfs']['port'],
-            self._getHdfsUser(self.assetstore)
-        )
-
-        resp = requests.post(url, allow_redirects=False)
-
-        try:
-            resp.raise_for_status()
-        except Exception:
-            logger.exception('HDFS response: ' + resp.text)
-            raise Exception('Error appending to HDFS, see log for details.')
+        resp = self._webHdfsRequest(
+            'POST', self._absPath(upload), 'APPEND', allow_redirects=False)
+        self._checkResponse(resp, 'appending to')
 
         if resp.status_code != 307:
             raise Exception('Expected 307 redirection to data node, instead '
                             'got %d: %s' % (resp.status_code, resp.text))
 
-        resp = requests.post(resp.headers['Location'], data=chunk)
+        resp = self.session.post(resp.headers['Location'], data=chunk)
         chunk.close()
-        try:
-            resp.raise_for_status()
-        except Exception:
-            logger.exception('HDFS response: ' + resp.text)
-            raise Exception('Error appending to HDFS, see log for details.')
+        self._checkResponse(resp, 'appending to')
 
         upload['received'] = self.requestOffset(upload)
-
-        try:
-            resp.raise_for_status()
-        except Exception:
-            logger.exception('HDFS response: ' + resp.text)
-            raise Exception('Error appending to HDFS, see log for details.')
-
         return upload
 
     def finalizeUpload(self, upload, file):
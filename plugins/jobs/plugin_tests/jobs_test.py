@@ -17,12 +17,14 @@
 #  limitations under the License.
 ###############################################################################
 
+import importlib
 import time
 
 from tests import base
 from girder import events
 from girder.constants import AccessType
 from girder.models.model_base import ValidationException
+from girder.utility import config
 
 
 JobStatus = None
@@ -103,11 +105,15 @@ class JobsTestCase(base.TestCase):
         # We shouldn't get the log back in this case
         self.assertNotIn('log', resp.json)
 
-        # Do a fetch on the job itself to get the log
+        # The log is not included in the job, but can be read separately
         resp = self.request(path, user=self.users[1])
         self.assertStatusOk(resp)
-        self.assertEqual(
-            resp.json['log'], ['My log message\n', 'append message'])
+        self.assertNotIn('log', resp.json)
+        resp = self.request(path + '/log', user=self.users[1])
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json, ['My log message\n', 'append message'])
+        resp = self.request(path + '/log', user=self.users[2])
+        self.assertStatus(resp, 403)
 
         # Test overwriting the log and updating status
         resp = self.request(path, method='PUT', params={
@@ -144,6 +150,76 @@ class JobsTestCase(base.TestCase):
                                              includeLog=True)
         self.assertEqual(job['log'], ['legacy log'])
 
+    def testJobLog(self):
+        jobModel = self.model('job', 'jobs')
+        logModel = self.model('job_log', 'jobs')
+        job = jobModel.createJob(title='log', type='log', user=self.users[1])
+        path = '/job/%s/log' % job['_id']
+
+        def stopMonitor():
+            if logModel._monitor:
+                logModel._monitor.unsubscribe()
+                logModel._monitor.stop()
+                logModel._monitor = None
+
+        # Only flush the buffer when the test does
+        stopMonitor()
+        jobsConfig = config.getConfig().setdefault('jobs', {})
+        jobsConfig['log_flush_interval'] = 3600
+        logModel.flush()
+        try:
+
+            # Messages are buffered, and written in a batch with one notification
+            for n in range(5):
+                job = jobModel.updateJob(job, log='line %d\n' % n)
+            self.assertEqual(logModel.find({'jobId': job['_id']}).count(), 0)
+            self.assertNotIn('log', jobModel.findOne({'_id': job['_id']}, includeLog=True))
+            logModel.flush()
+            self.assertEqual(logModel.find({'jobId': job['_id']}).count(), 5)
+            notifications = list(self.model('notification').find({
+                'type': 'job_log', 'userId': self.users[1]['_id']}))
+            self.assertEqual(len(notifications), 1)
+            self.assertEqual(notifications[0]['data']['text'], ''.join(
+                'line %d\n' % n for n in range(5)))
+
+            # Messages can be read from an offset, including buffered ones
+            job = jobModel.updateJob(job, log='line 5\n')
+            resp = self.request(path, user=self.users[1], params={'offset': 4})
+            self.assertStatusOk(resp)
+            self.assertEqual(resp.json, ['line 4\n', 'line 5\n'])
+            resp = self.request(path, user=self.users[1], params={
+                'offset': 1, 'limit': 2})
+            self.assertStatusOk(resp)
+            self.assertEqual(resp.json, ['line 1\n', 'line 2\n'])
+            resp = self.request(path, user=self.users[1], params={'offset': 6})
+            self.assertStatusOk(resp)
+            self.assertEqual(resp.json, [])
+
+            # A full batch is written right away
+            for n in range(logModel.batchSize):
+                job = jobModel.updateJob(job, log='x', notify=False)
+            self.assertEqual(logModel.find({'jobId': job['_id']}).count(),
+                             6 + logModel.batchSize)
+
+            # The log of a job that kept it in its document comes first
+            jobModel.update({'_id': job['_id']}, {'$set': {'log': ['old 1', 'old 2']}})
+            self.assertEqual(logModel.getLog(job, offset=1, limit=3),
+                             ['old 2', 'line 0\n', 'line 1\n'])
+            self.assertEqual(logModel.getLog(job, offset=2, limit=1), ['line 0\n'])
+
+            # Overwriting replaces both
+            job = jobModel.updateJob(job, log='new log', overwrite=True)
+            self.assertEqual(logModel.getLog(job), ['new log'])
+
+            # Finishing a job writes its log, and removing the job deletes it
+            job = jobModel.updateJob(job, log='done', status=JobStatus.SUCCESS)
+            self.assertEqual(logModel.find({'jobId': job['_id']}).count(), 2)
+            jobModel.remove(job)
+            self.assertEqual(logModel.find({'jobId': job['_id']}).count(), 0)
+        finally:
+            del jobsConfig['log_flush_interval']
+            stopMonitor()
+
     def testListJobs(self):
         job = self.model('job', 'jobs').createJob(
             title='A job', type='t', user=self.users[1], public=False)
@@ -322,6 +398,19 @@ class JobsTestCase(base.TestCase):
         job = self.model('job', 'jobs').filter(job, self.users[1])
         self.assertFalse('kwargs' in job)
 
+    def _waitFor(self, condition, timeout=10):
+        end = time.time() + timeout
+        while not condition():
+            if time.time() > end:
+                raise AssertionError('Timed out waiting for condition.')
+            time.sleep(0.02)
+
+    def _waitForJob(self, job):
+        jobModel = self.model('job', 'jobs')
+        self._waitFor(lambda: jobModel.load(job['_id'], force=True)['status'] in (
+            JobStatus.SUCCESS, JobStatus.ERROR, JobStatus.CANCELED))
+        return jobModel.load(job['_id'], force=True, includeLog=True)
+
     def testLocalJob(self):
         job = self.model('job', 'jobs').createLocalJob(
             title='local', type='local', user=self.users[0], kwargs={
@@ -330,9 +419,11 @@ class JobsTestCase(base.TestCase):
 
         self.model('job', 'jobs').scheduleJob(job)
 
-        job = self.model('job', 'jobs').load(job['_id'], force=True,
-                                             includeLog=True)
+        job = self._waitForJob(job)
         self.assertEqual(job['log'], ['job ran!'])
+        self.assertEqual(job['status'], JobStatus.SUCCESS)
+        self.assertEqual([ts['status'] for ts in job['timestamps']], [
+            JobStatus.QUEUED, JobStatus.RUNNING, JobStatus.SUCCESS])
 
         job = self.model('job', 'jobs').createLocalJob(
             title='local', type='local', user=self.users[0], kwargs={
@@ -341,10 +432,122 @@ class JobsTestCase(base.TestCase):
 
         self.model('job', 'jobs').scheduleJob(job)
 
-        job = self.model('job', 'jobs').load(job['_id'], force=True,
-                                             includeLog=True)
+        job = self._waitForJob(job)
         self.assertEqual(job['log'], ['job failed'])
 
+    def testLocalJobExecutor(self):
+        from girder.plugins.jobs.executor import LocalJobExecutor
+        impl = importlib.import_module('plugin_tests.local_job_impl')
+        jobModel = self.model('job', 'jobs')
+
+        def createJob(name, function, type='local', priority=0):
+            return jobModel.createLocalJob(
+                title=name, type=type, user=self.users[0], kwargs={'name': name},
+                module='plugin_tests.local_job_impl', function=function,
+                priority=priority)
+
+        # Queued jobs start in order of priority, and can be canceled
+        impl.release.clear()
+        del impl.started[:]
+        executor = LocalJobExecutor(threads=1)
+        try:
+            first = createJob('first', 'block')
+            executor.schedule(first)
+            self._waitFor(lambda: impl.started == ['first'])
+            jobs = [createJob('low', 'record'), createJob('high', 'record', priority=5),
+                    createJob('canceled', 'record', priority=5)]
+            for job in jobs:
+                executor.schedule(job)
+            self.assertEqual(executor.stats(), {
+                'threads': 1,
+                'processes': 0,
+                'queued': 3,
+                'running': 1,
+                'queuedByType': {'local': 3},
+                'runningByType': {'local': 1}
+            })
+            self.assertTrue(executor.cancel(jobs[2]))
+            self.assertFalse(executor.cancel(first))
+            jobModel.cancelJob(jobs[2])
+            self.assertTrue(jobModel.isCanceled(jobs[2]))
+            self.assertFalse(jobModel.isCanceled(jobs[1]))
+
+            impl.release.set()
+            for job in [first] + jobs[:2]:
+                self.assertEqual(self._waitForJob(job)['status'], JobStatus.SUCCESS)
+            self.assertEqual(impl.started, ['first', 'high', 'low'])
+            self.assertEqual(self._waitForJob(jobs[2])['status'], JobStatus.CANCELED)
+
+            # Failures are recorded on the job
+            job = createJob('error', 'error')
+            executor.schedule(job)
+            job = self._waitForJob(job)
+            self.assertEqual(job['status'], JobStatus.ERROR)
+            self.assertIn('job error', job['log'][0])
+
+            # A job canceled after it was taken off the queue doesn't start
+            job = jobModel.updateJob(createJob('late', 'record'), status=JobStatus.QUEUED)
+            jobModel.cancelJob(job)
+            executor._run(job)
+            self.assertNotIn('late', impl.started)
+            self.assertEqual(jobModel.load(job['_id'], force=True)['status'],
+                             JobStatus.CANCELED)
+        finally:
+            impl.release.set()
+            executor.stop()
+
+        # Jobs beyond the limit of their type wait, even with threads free
+        impl.release.clear()
+        del impl.started[:]
+        executor = LocalJobExecutor(threads=2, typeLimits={'limited': 1})
+        try:
+            limited = [createJob('limited1', 'block', type='limited'),
+                       createJob('limited2', 'block', type='limited')]
+            for job in limited:
+                executor.schedule(job)
+            self._waitFor(lambda: impl.started == ['limited1'])
+            other = createJob('other', 'record')
+            executor.schedule(other)
+            self.assertEqual(self._waitForJob(other)['status'], JobStatus.SUCCESS)
+            self.assertEqual(executor.stats()['queuedByType'], {'limited': 1})
+
+            impl.release.set()
+            for job in limited:
+                self.assertEqual(self._waitForJob(job)['status'], JobStatus.SUCCESS)
+            self.assertEqual(impl.started, ['limited1', 'other', 'limited2'])
+        finally:
+            impl.release.set()
+            executor.stop()
+
+        # Admins can see the state of the server's executor
+        resp = self.request('/job/executor', user=self.users[0])
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json['queued'], 0)
+        resp = self.request('/job/executor', user=self.users[1])
+        self.assertStatus(resp, 403)
+
+    def testLocalJobMemoryLimit(self):
+        from girder.plugins.jobs.executor import LocalJobExecutor
+        jobModel = self.model('job', 'jobs')
+
+        # Jobs run in a worker process can't allocate beyond their limit
+        executor = LocalJobExecutor(threads=1, processes=1)
+        try:
+            jobs = [jobModel.createLocalJob(
+                title='allocate', type='local', user=self.users[0],
+                kwargs={'size': size}, module='plugin_tests.local_job_impl',
+                function='allocate', process=True, memoryLimit=64 * 1024 * 1024)
+                for size in (1024 * 1024, 256 * 1024 * 1024)]
+            for job in jobs:
+                executor.schedule(job)
+            small, large = [self._waitForJob(job) for job in jobs]
+            self.assertEqual(small['status'], JobStatus.SUCCESS)
+            self.assertEqual(small['log'], ['allocated 1048576 bytes'])
+            self.assertEqual(large['status'], JobStatus.ERROR)
+            self.assertIn('MemoryError', large['log'][0])
+        finally:
+            executor.stop()
+
     def testValidateCustomStatus(self):
         jobModel = self.model('job', 'jobs')
         job = jobModel.createJob(title='test', type='x', user=self.users[0])
@@ -17,6 +17,8 @@
 #  limitations under the License.
 ###############################################################################
 
+import threading
+
 from girder.utility.model_importer import ModelImporter
 
 
@@ -26,3 +28,28 @@ def run(job):
 
 def fail(job):
     ModelImporter.model('job', 'jobs').updateJob(job, log='job failed')
+
+
+# Jobs run by "block" wait until this is set
+release = threading.Event()
+# The names of the jobs run by "block" and "record", in the order they started
+started = []
+
+
+def block(job):
+    started.append(job['kwargs']['name'])
+    release.wait(10)
+
+
+def record(job):
+    started.append(job['kwargs']['name'])
+
+
+def error(job):
+    raise Exception('job error')
+
+
+def allocate(job):
+    data = bytearray(job['kwargs']['size'])
+    ModelImporter.model('job', 'jobs').updateJob(
+        job, log='allocated %d bytes' % len(data))
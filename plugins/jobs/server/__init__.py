@@ -17,10 +17,11 @@
 #  limitations under the License.
 ###############################################################################
 
-import importlib
+import cherrypy
 
 from girder import events
 from . import constants, job_rest
+from .executor import getLocalExecutor
 
 
 def scheduleLocal(event):
@@ -30,7 +31,9 @@ def scheduleLocal(event):
     be executed, and optionally a "function" field to declare what function
     within that module should be executed. If no "function" field is specified,
     the function is assumed to be named "run". The function will be passed the
-    args and kwargs of the job.
+    job document, and is run by the local job executor (see
+    :py:func:`executor.getLocalExecutor`) rather than in the thread that
+    scheduled the job.
     """
     job = event.info
 
@@ -38,11 +41,17 @@ def scheduleLocal(event):
         if 'module' not in job:
             raise Exception('Locally scheduled jobs must have a module field.')
 
-        module = importlib.import_module(job['module'])
-        fn = getattr(module, job.get('function', 'run'))
-        fn(job)
+        getLocalExecutor().schedule(job)
+
+
+def cancelLocal(event):
+    if event.info.get('handler') == constants.JOB_HANDLER_LOCAL:
+        getLocalExecutor().cancel(event.info)
 
 
 def load(info):
     info['apiRoot'].job = job_rest.Job()
     events.bind('jobs.schedule', 'jobs', scheduleLocal)
+    events.bind('jobs.cancel', 'jobs', cancelLocal)
+    cherrypy.engine.subscribe('start', getLocalExecutor().start)
+    cherrypy.engine.subscribe('stop', getLocalExecutor().stop)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import bisect
+import collections
+import contextlib
+import importlib
+import itertools
+import multiprocessing
+import six
+import threading
+import traceback
+
+import girder.models
+from girder import logger
+from girder.utility import assetstore_utilities, config, model_importer
+from girder.utility.model_importer import ModelImporter
+from .constants import JobStatus
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+_localExecutor = None
+_localExecutorLock = threading.Lock()
+_inWorkerProcess = False
+
+
+def getLocalExecutor():
+    """
+    Get the executor of local jobs, which is configured by the ``jobs``
+    section of the config file:
+
+    * ``local_threads``: the number of threads running local jobs (default
+      4). If this is 0, local jobs run in the thread that schedules them.
+    * ``local_processes``: the number of worker processes for local jobs that
+      are created with ``process=True`` (default 0). Without worker
+      processes, those jobs run on the threads like the others.
+    * ``local_type_limits``: a dict of job types to the number of jobs of
+      that type that may run at once.
+    """
+    global _localExecutor
+
+    with _localExecutorLock:
+        if _localExecutor is None:
+            cfg = config.getConfig().get('jobs', {})
+            _localExecutor = LocalJobExecutor(
+                threads=int(cfg.get('local_threads', 4)),
+                processes=int(cfg.get('local_processes', 0)),
+                typeLimits=cfg.get('local_type_limits'))
+        return _localExecutor
+
+
+def _runJob(job):
+    module = importlib.import_module(job['module'])
+    memoryLimit = job.get('memoryLimit') if _inWorkerProcess else None
+    try:
+        with _memoryLimit(memoryLimit):
+            getattr(module, job.get('function', 'run'))(job)
+    finally:
+        # Worker processes must write the log before they return the job
+        ModelImporter.model('job_log', 'jobs').flush(job)
+
+
+@contextlib.contextmanager
+def _memoryLimit(limit):
+    """
+    Limit the address space of this process to its current size plus a
+    number of bytes while the block runs, so that allocations beyond that
+    raise MemoryError. This does nothing if the limit is None or the
+    platform has no resource limits.
+    """
+    if not limit or resource is None:
+        yield
+        return
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[0]) * resource.getpagesize()
+    except (IOError, ValueError):
+        current = 0
+    newLimit = current + limit
+    if hard != resource.RLIM_INFINITY:
+        newLimit = min(newLimit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (newLimit, hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+def _initProcess():
+    global _inWorkerProcess
+    _inWorkerProcess = True
+
+    # A forked worker must not share the server's database connections
+    girder.models._dbClients.clear()
+    assetstore_utilities.clearAssetstoreAdapters()
+    model_importer.reinitializeAll()
+
+
+class LocalJobExecutor(object):
+    """
+    Runs local jobs on a pool of threads, outside of the request that
+    scheduled them. Queued jobs are started in order of their ``priority``
+    field (higher first), then in the order they were scheduled, skipping
+    jobs whose type is already running as many times as its limit allows.
+    Jobs created with ``process=True`` are run in a pool of worker processes
+    by the thread that takes them off the queue, and their ``memoryLimit``
+    field, if set, limits the memory they may allocate in the worker.
+
+    The executor sets the status of each job to QUEUED, RUNNING, and finally
+    SUCCESS or ERROR, unless the job function sets a final status itself.
+    Canceling a queued job removes it from the queue, and a job that was
+    canceled just after it left the queue is not started; jobs that are already
+    running should call :py:meth:`Job.isCanceled` from time to time and stop
+    early once it returns True.
+
+    :param threads: the number of threads running jobs. If 0, jobs run in
+        the thread that schedules them.
+    :type threads: int
+    :param processes: the number of worker processes.
+    :type processes: int
+    :param typeLimits: the maximum number of jobs of each type to run at once.
+    :type typeLimits: dict
+    """
+    def __init__(self, threads=4, processes=0, typeLimits=None):
+        self.threads = threads
+        self.processes = processes
+        self.typeLimits = typeLimits or {}
+        self._cond = threading.Condition()
+        self._queue = []
+        self._counter = itertools.count()
+        self._running = collections.Counter()
+        self._workers = []
+        self._pool = None
+
+    def start(self):
+        """
+        Start the worker threads and processes, if they aren't running.
+        """
+        with self._cond:
+            if self.processes > 0 and self._pool is None:
+                self._pool = multiprocessing.Pool(
+                    self.processes, initializer=_initProcess)
+            while len(self._workers) < self.threads:
+                worker = threading.Thread(target=self._work, name='LocalJobWorker')
+                worker.daemon = True
+                self._workers.append(worker)
+                worker.start()
+
+    def stop(self):
+        """
+        Stop the workers once they finish their current job. Jobs that are
+        still queued stay in the queue until the executor is started again.
+        """
+        with self._cond:
+            self._workers = []
+            pool, self._pool = self._pool, None
+            self._cond.notify_all()
+        if pool is not None:
+            pool.close()
+
+    def schedule(self, job):
+        """
+        Queue a local job to be run.
+
+        :param job: the job to run.
+        :type job: dict
+        """
+        if self.threads <= 0:
+            self._run(job, reraise=True)
+            return
+
+        job = ModelImporter.model('job', 'jobs').updateJob(
+            job, status=JobStatus.QUEUED)
+        with self._cond:
+            bisect.insort(self._queue, (-job.get('priority', 0), next(self._counter), job))
+            self._cond.notify()
+        self.start()
+
+    def cancel(self, job):
+        """
+        Remove a job from the queue if it hasn't started.
+
+        :param job: the job to cancel.
+        :type job: dict
+        :returns: whether the job was removed from the queue.
+        """
+        with self._cond:
+            for i, (_, _, queued) in enumerate(self._queue):
+                if queued['_id'] == job['_id']:
+                    del self._queue[i]
+                    return True
+        return False
+
+    def stats(self):
+        """
+        Get the number of jobs that are queued and running, in total and by
+        job type.
+        """
+        with self._cond:
+            queued = collections.Counter(job['type'] for _, _, job in self._queue)
+            return {
+                'threads': len(self._workers),
+                'processes': self.processes if self._pool is not None else 0,
+                'queued': len(self._queue),
+                'running': sum(six.viewvalues(self._running)),
+                'queuedByType': dict(queued),
+                'runningByType': {
+                    type: count for type, count in six.viewitems(self._running) if count}
+            }
+
+    def _next(self):
+        """
+        Wait for a queued job that may be started, and take it off the queue.
+        Returns None when the calling worker thread should stop.
+        """
+        with self._cond:
+            while threading.current_thread() in self._workers:
+                for i, (_, _, job) in enumerate(self._queue):
+                    limit = self.typeLimits.get(job['type'])
+                    if limit is None or self._running[job['type']] < limit:
+                        del self._queue[i]
+                        self._running[job['type']] += 1
+                        return job
+                self._cond.wait()
+
+    def _work(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            try:
+                self._run(job)
+            finally:
+                with self._cond:
+                    self._running[job['type']] -= 1
+                    # A job that was held back by the type limit may start now
+                    self._cond.notify_all()
+
+    def _run(self, job, reraise=False):
+        jobModel = ModelImporter.model('job', 'jobs')
+        if reraise:
+            # Jobs run in the scheduling thread were never queued
+            job = jobModel.updateJob(job, status=JobStatus.RUNNING)
+        else:
+            # The job may have been canceled after it left the queue
+            job = jobModel.startJob(job)
+            if job is None:
+                return
+        try:
+            pool = self._pool
+            if job.get('process') and pool is not None:
+                pool.apply(_runJob, (job,))
+            else:
+                _runJob(job)
+        except Exception:
+            logger.exception('Local job %s failed.' % job['_id'])
+            self._finish(job, JobStatus.ERROR, traceback.format_exc())
+            if reraise:
+                raise
+        else:
+            self._finish(job, JobStatus.SUCCESS)
+
+    def _finish(self, job, status, log=None):
+        """
+        Set the final status of a job, unless the job function has changed
+        the status itself.
+        """
+        jobModel = ModelImporter.model('job', 'jobs')
+        current = jobModel.findOne({'_id': job['_id']}, fields=['status'])
+        if current is not None and current['status'] == JobStatus.RUNNING:
+            jobModel.updateJob(job, status=status, log=log)
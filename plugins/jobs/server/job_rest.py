@@ -21,6 +21,7 @@ from girder.api import access
 from girder.api.describe import Description, describeRoute
 from girder.api.rest import Resource, filtermodel, loadmodel
 from girder.constants import AccessType, SortDir
+from .executor import getLocalExecutor
 
 
 class Job(Resource):
@@ -29,7 +30,9 @@ class Job(Resource):
         self.resourceName = 'job'
 
         self.route('GET', (), self.listJobs)
+        self.route('GET', ('executor',), self.getExecutorStats)
         self.route('GET', (':id',), self.getJob)
+        self.route('GET', (':id', 'log'), self.getJobLog)
         self.route('PUT', (':id',), self.updateJob)
         self.route('DELETE', (':id',), self.deleteJob)
 
@@ -60,11 +63,21 @@ class Job(Resource):
             user=user, offset=offset, limit=limit, sort=sort,
             currentUser=currentUser))
 
+    @access.admin
+    @describeRoute(
+        Description('Get the number of local jobs that are queued and running '
+                    'on this server process.')
+        .errorResponse('You are not a system administrator.', 403)
+    )
+    def getExecutorStats(self, params):
+        return getLocalExecutor().stats()
+
     @access.public
-    @loadmodel(model='job', plugin='jobs', level=AccessType.READ,
-               includeLog=True)
+    @loadmodel(model='job', plugin='jobs', level=AccessType.READ)
     @describeRoute(
         Description('Get a job by ID.')
+        .notes('The log of the job is not included; use GET /job/{id}/log to '
+               'read it.')
         .param('id', 'The ID of the job.', paramType='path')
         .errorResponse('ID was invalid.')
         .errorResponse('Read access was denied for the job.', 403)
@@ -73,6 +86,26 @@ class Job(Resource):
     def getJob(self, job, params):
         return job
 
+    @access.public
+    @loadmodel(model='job', plugin='jobs', level=AccessType.READ)
+    @describeRoute(
+        Description('Get the log messages of a job.')
+        .notes('Messages are returned in the order they were logged. To follow '
+               'the log of a running job, pass the number of messages already '
+               'read as the offset.')
+        .param('id', 'The ID of the job.', paramType='path')
+        .param('offset', 'The number of messages to skip.', dataType='integer',
+               required=False, default=0)
+        .param('limit', 'The maximum number of messages to return, or 0 for '
+               'all of them.', dataType='integer', required=False, default=0)
+        .errorResponse('ID was invalid.')
+        .errorResponse('Read access was denied for the job.', 403)
+    )
+    def getJobLog(self, job, params):
+        return self.model('job_log', 'jobs').getLog(
+            job, offset=int(params.get('offset', 0)),
+            limit=int(params.get('limit', 0)))
+
     @access.token
     @loadmodel(model='job', plugin='jobs', force=True)
     @filtermodel(model='job', plugin='jobs')
@@ -64,12 +64,10 @@ class Job(AccessControlledModel):
         :param currentUser: User for access filtering.
         """
         userId = user['_id'] if user else None
-        cursor = self.find({'userId': userId}, sort=sort)
 
-        for r in self.filterResultsByPermission(cursor=cursor, user=currentUser,
-                                                level=AccessType.READ,
-                                                limit=limit, offset=offset):
-            yield r
+        return self.findWithPermissions(
+            {'userId': userId}, sort=sort, user=currentUser,
+            level=AccessType.READ, limit=limit, offset=offset)
 
     def cancelJob(self, job):
         """
@@ -87,7 +85,57 @@ class Job(AccessControlledModel):
 
         return job
 
-    def createLocalJob(self, module, function=None, **kwargs):
+    def startJob(self, job, notify=True):
+        """
+        Move a queued job to the RUNNING status. This is done with a single
+        conditional update, so a job that is canceled at the same time is
+        either canceled after it starts running, or never starts.
+
+        :param job: The queued job.
+        :param notify: Whether to notify the job's user of the status change.
+        :type notify: bool
+        :returns: the updated job, or None if the job was no longer queued.
+        """
+        now = datetime.datetime.utcnow()
+        ts = {
+            'status': JobStatus.RUNNING,
+            'time': now
+        }
+        result = self.collection.update_one({
+            '_id': job['_id'],
+            'status': JobStatus.QUEUED
+        }, {
+            '$set': {'status': JobStatus.RUNNING, 'updated': now},
+            '$push': {'timestamps': ts}
+        })
+        if not result.modified_count:
+            return None
+
+        job['status'] = JobStatus.RUNNING
+        job['updated'] = now
+        job['timestamps'].append(ts)
+        if notify and job['userId']:
+            self._notifyStatus(
+                job, now, self.model('user').load(job['userId'], force=True))
+        events.trigger('jobs.job.update.after', {
+            'job': job
+        })
+        return job
+
+    def isCanceled(self, job):
+        """
+        Check whether a job has been canceled or deleted since it started.
+        Long-running local jobs should call this from time to time, and stop
+        early if it returns True.
+
+        :param job: The job.
+        :returns: Whether the job should stop.
+        """
+        current = self.findOne({'_id': job['_id']}, fields=['status'])
+        return current is None or current['status'] == JobStatus.CANCELED
+
+    def createLocalJob(self, module, function=None, priority=0, process=False,
+                       memoryLimit=None, **kwargs):
         """
         Takes the same keyword arguments as :py:func:`createJob`, except this
         sets the handler to the local handler and takes additional parameters
@@ -98,6 +146,19 @@ class Job(AccessControlledModel):
         :param function: Function name within the module to run. If not passed,
             the default name of "run" will be used.
         :type function: str or None
+        :param priority: Queued local jobs with a higher priority are started
+            first.
+        :type priority: int
+        :param process: Whether to run the job in one of the worker processes
+            of the local job executor, if it has any, rather than in a thread
+            of the server. The job document and the function's module must be
+            picklable and importable by the worker.
+        :type process: bool
+        :param memoryLimit: The number of bytes of memory that the job may
+            allocate in a worker process, beyond what the worker already
+            uses, before allocations fail with MemoryError. This only applies
+            when the job is run in a worker process.
+        :type memoryLimit: int or None
         :returns: The job that was created.
         """
         kwargs['handler'] = JOB_HANDLER_LOCAL
@@ -106,6 +167,9 @@ class Job(AccessControlledModel):
         job = self.createJob(**kwargs)
 
         job['module'] = module
+        job['priority'] = priority
+        job['process'] = process
+        job['memoryLimit'] = memoryLimit
 
         if function is not None:
             job['function'] = function
@@ -141,8 +205,9 @@ class Job(AccessControlledModel):
         :param externalToken: If an external token was created for updating this
         job, pass it in and it will have the job-specific scope set.
         :type externalToken: token (dict) or None.
-        :param async: Whether the job is to be run asynchronously. For now this
-            only applies to jobs that are scheduled to run locally.
+        :param async: Whether the jobs.schedule event is to be handled
+            asynchronously, on the events daemon. Local jobs are run by the
+            local job executor in either case.
         :type async: bool
         :param save: Whether the documented should be saved to the database.
         :type save: bool
@@ -170,7 +235,6 @@ class Job(AccessControlledModel):
             'interval': interval,
             'status': JobStatus.INACTIVE,
             'progress': None,
-            'log': [],
             'meta': {},
             'handler': handler,
             'async': async,
@@ -217,9 +281,12 @@ class Job(AccessControlledModel):
         We extend load to deserialize the kwargs back into a dict since we
         serialized them on the way into the database.
 
-        :param includeLog: Whether to include the log field in the document.
+        :param includeLog: Whether to read the whole log of the job into its
+            log field. Use the ``getLog`` method of the ``job_log`` model to
+            read part of it instead.
         :type includeLog: bool
         """
+        includeLog = kwargs.get('includeLog', False)
         kwargs['fields'] = self._computeFields(kwargs)
         job = super(Job, self).load(*args, **kwargs)
 
@@ -229,9 +296,18 @@ class Job(AccessControlledModel):
             # Legacy support: log used to be just a string, but we want to
             # consistently return a list of strings now.
             job['log'] = [job['log']]
+        if job and includeLog:
+            job['log'] = self.model('job_log', 'jobs').getLog(job)
 
         return job
 
+    def remove(self, job, **kwargs):
+        """
+        Delete a job and its log.
+        """
+        self.model('job_log', 'jobs').removeLog(job)
+        return super(Job, self).remove(job, **kwargs)
+
     def scheduleJob(self, job):
         """
         Trigger the event to schedule this job. Other plugins are in charge of
@@ -261,6 +337,10 @@ class Job(AccessControlledModel):
         If notify=True, job status changes will also create a notification with type="job_status",
         and log changes will create a notification with type="job_log".
 
+        Log messages are stored by the ``job_log`` model rather than in the job document, and
+        may be buffered for a moment before they are written; they are written right away when
+        the job reaches a final status.
+
         :param job: The job document to update.
         :param log: Message to append to the job log. If you wish to overwrite
             instead of append, pass overwrite=True.
@@ -312,6 +392,9 @@ class Job(AccessControlledModel):
             job[k] = v
             updates['$set'][k] = v
 
+        if job['status'] in (JobStatus.SUCCESS, JobStatus.ERROR, JobStatus.CANCELED):
+            self.model('job_log', 'jobs').flush(job)
+
         if updates['$set'] or updates['$push']:
             if not updates['$push']:
                 del updates['$push']
@@ -329,17 +412,10 @@ class Job(AccessControlledModel):
     def _updateLog(self, job, log, overwrite, now, notify, user, updates):
         """Helper for updating a job's log."""
         if overwrite:
-            updates['$set']['log'] = [log]
-        else:
-            updates['$push']['log'] = log
-        if notify and user:
-            expires = now + datetime.timedelta(seconds=30)
-            self.model('notification').createNotification(
-                type='job_log', data={
-                    '_id': job['_id'],
-                    'overwrite': overwrite,
-                    'text': log
-                }, user=user, expires=expires)
+            # Also drop the log of jobs that kept it in their document
+            updates['$set']['log'] = []
+        self.model('job_log', 'jobs').append(
+            job, log, overwrite=overwrite, notify=notify, user=user)
 
     def _updateStatus(self, job, status, now, notify, user, updates):
         """Helper for updating job progress information."""
@@ -362,12 +438,16 @@ class Job(AccessControlledModel):
             updates['$push']['timestamps'] = ts
 
             if notify and user:
-                expires = now + datetime.timedelta(seconds=30)
-                filtered = self.filter(job, user)
-                filtered.pop('kwargs', None)
-                filtered.pop('log', None)
-                self.model('notification').createNotification(
-                    type='job_status', data=filtered, user=user, expires=expires)
+                self._notifyStatus(job, now, user)
+
+    def _notifyStatus(self, job, now, user):
+        """Helper for notifying the job's user of a status change."""
+        expires = now + datetime.timedelta(seconds=30)
+        filtered = self.filter(job, user)
+        filtered.pop('kwargs', None)
+        filtered.pop('log', None)
+        self.model('notification').createNotification(
+            type='job_status', data=filtered, user=user, expires=expires)
 
     def _updateProgress(self, job, total, current, message, notify, user, updates):
         """Helper for updating job progress information."""
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import cherrypy
+import collections
+import datetime
+import six
+import threading
+import time
+
+from girder.constants import SortDir
+from girder.models.model_base import Model
+from girder.utility import config
+
+
+class JobLog(Model):
+    """
+    This model holds the log output of jobs, one document per message, so
+    that the job documents themselves stay small however much a job logs.
+
+    Appended messages are buffered in the server process and written with one
+    insert per job. The buffer of a job is written once it holds
+    ``batchSize`` messages, when the job reaches a final status, before its
+    log is read by this process, and otherwise every ``log_flush_interval``
+    seconds of the ``jobs`` config section (default 1). Each write of the
+    buffer creates a single ``job_log`` notification with the concatenated
+    text. If the interval is 0, messages are written as they are appended.
+
+    Jobs created before logs were kept in this collection have their log in
+    the ``log`` field of the job document; it is returned ahead of the
+    messages in this collection.
+    """
+    batchSize = 100
+
+    def initialize(self):
+        self.name = 'job_log'
+        self.ensureIndices([(
+            (('jobId', SortDir.ASCENDING), ('_id', SortDir.ASCENDING)), {})])
+        self._pending = collections.OrderedDict()
+        self._pendingLock = threading.Lock()
+        self._flushLock = threading.Lock()
+        self._lastFlush = time.time()
+        self._monitor = None
+
+    def validate(self, doc):
+        return doc
+
+    def interval(self):
+        """
+        The maximum number of seconds that appended messages are buffered.
+        """
+        return float(config.getConfig().get('jobs', {}).get('log_flush_interval', 1))
+
+    def append(self, job, text, overwrite=False, notify=True, user=None):
+        """
+        Append a message to the log of a job.
+
+        :param job: The job.
+        :type job: dict
+        :param text: The message.
+        :type text: str
+        :param overwrite: Whether to replace the existing log with the message.
+        :type overwrite: bool
+        :param notify: Whether to send the message to the owner of the job in
+            a ``job_log`` notification.
+        :type notify: bool
+        :param user: The owner of the job, who receives the notification.
+        :type user: dict or None
+        """
+        if overwrite:
+            self.removeLog(job)
+
+        with self._pendingLock:
+            pending = self._pending.setdefault(job['_id'], {
+                'lines': [],
+                'notify': [],
+                'overwrite': False,
+                'user': user
+            })
+            pending['lines'].append(text)
+            if notify:
+                pending['notify'].append(text)
+            pending['overwrite'] = pending['overwrite'] or overwrite
+            full = len(pending['lines']) >= self.batchSize
+
+        interval = self.interval()
+        if interval <= 0 or full:
+            self.flush(job)
+            return
+
+        self._startMonitor(interval)
+        if time.time() - self._lastFlush > interval:
+            self.flush()
+
+    def _startMonitor(self, interval):
+        # Flush periodically, so buffered messages are written once jobs go
+        # quiet
+        if self._monitor is None:
+            self._monitor = cherrypy.process.plugins.Monitor(
+                cherrypy.engine, self.flush, frequency=interval,
+                name='JobLog')
+            self._monitor.subscribe()
+            cherrypy.engine.subscribe('stop', self.flush)
+            if cherrypy.engine.state == cherrypy.engine.states.STARTED:
+                self._monitor.start()
+
+    def flush(self, job=None):
+        """
+        Write the buffered messages of a job, or of all jobs, to the database.
+
+        :param job: The job whose messages should be written, or None for all.
+        :type job: dict or None
+        """
+        # Batches of one job are written in order, even by several threads
+        with self._flushLock:
+            with self._pendingLock:
+                if job is None:
+                    self._lastFlush = time.time()
+                    batches = list(six.viewitems(self._pending))
+                    self._pending.clear()
+                elif job['_id'] in self._pending:
+                    batches = [(job['_id'], self._pending.pop(job['_id']))]
+                else:
+                    return
+
+            for jobId, pending in batches:
+                self.collection.insert_many([{
+                    'jobId': jobId,
+                    'text': text
+                } for text in pending['lines']])
+
+                if pending['notify'] and pending['user']:
+                    expires = datetime.datetime.utcnow() + datetime.timedelta(seconds=30)
+                    self.model('notification').createNotification(
+                        type='job_log', data={
+                            '_id': jobId,
+                            'overwrite': pending['overwrite'],
+                            'text': ''.join(pending['notify'])
+                        }, user=pending['user'], expires=expires)
+
+    def getLog(self, job, offset=0, limit=0):
+        """
+        Get the messages of a job's log, in the order they were appended.
+
+        :param job: The job.
+        :type job: dict
+        :param offset: The number of messages to skip.
+        :type offset: int
+        :param limit: The maximum number of messages to return, or 0 for all.
+        :type limit: int
+        :returns: The messages, as a list of strings.
+        """
+        self.flush(job)
+
+        legacy = self.model('job', 'jobs').findOne(
+            {'_id': job['_id']}, fields=['log'])
+        legacy = (legacy or {}).get('log') or []
+        if isinstance(legacy, six.string_types):
+            legacy = [legacy]
+
+        lines = legacy[offset:offset + limit] if limit else legacy[offset:]
+        if limit and len(lines) >= limit:
+            return lines
+
+        cursor = self.find(
+            {'jobId': job['_id']}, offset=max(offset - len(legacy), 0),
+            limit=limit - len(lines) if limit else 0, fields=['text'],
+            sort=[('_id', SortDir.ASCENDING)])
+        lines.extend(doc['text'] for doc in cursor)
+        return lines
+
+    def removeLog(self, job):
+        """
+        Delete the log of a job, including any buffered messages.
+
+        :param job: The job.
+        :type job: dict
+        """
+        with self._flushLock:
+            with self._pendingLock:
+                self._pending.pop(job['_id'], None)
+            self.collection.delete_many({'jobId': job['_id']})
@@ -1,7 +1,26 @@
+import _ from 'underscore';
+
 import AccessControlledModel from 'girder/models/AccessControlledModel';
+import { restRequest } from 'girder/rest';
 
 var JobModel = AccessControlledModel.extend({
-    resourceName: 'job'
+    resourceName: 'job',
+
+    /**
+     * Fetch the log messages of this job that follow the ones already in its
+     * "log" attribute, and append them to it. Triggers "g:logFetched" with
+     * the new messages once they arrive.
+     */
+    fetchLog: function () {
+        var log = this.get('log') || [];
+        return restRequest({
+            path: this.resourceName + '/' + this.id + '/log',
+            data: {offset: log.length}
+        }).done(_.bind(function (messages) {
+            this.set('log', log.concat(messages));
+            this.trigger('g:logFetched', messages);
+        }, this));
+    }
 });
 
 export default JobModel;
@@ -24,7 +24,8 @@ var JobDetailsWidget = View.extend({
 
         eventStream.on('g:event.job_log', function (event) {
             var info = event.data;
-            if (info._id === this.job.id) {
+            // Messages logged before the log is fetched will be part of it
+            if (info._id === this.job.id && this.job.has('log')) {
                 var container = this.$('.g-job-log-container');
                 if (info.overwrite) {
                     this.job.set({log: [info.text]});
@@ -36,6 +37,15 @@ var JobDetailsWidget = View.extend({
             }
         }, this);
 
+        // Jobs are fetched without their log, which is read separately
+        if (!this.job.has('log')) {
+            this.job.fetchLog().done(_.bind(function () {
+                if (this.$el.children().length) {
+                    this.render();
+                }
+            }, this));
+        }
+
         if (settings.renderImmediate) {
             this.render();
         }
@@ -62,7 +62,11 @@ class ResourceExt(Resource):
             raise RestException('The query parameter must be a JSON object.')
 
         model = ModelImporter().model(coll)
-        if hasattr(model, 'filterResultsByPermission'):
+        if hasattr(model, 'findWithPermissions'):
+            return list(model.findWithPermissions(
+                query, fields=allowed[coll], user=self.getCurrentUser(),
+                level=AccessType.READ, limit=limit, offset=offset))
+        elif hasattr(model, 'filterResultsByPermission'):
             cursor = model.find(
                 query, fields=allowed[coll] + ['public', 'access'])
             return list(model.filterResultsByPermission(
@@ -366,7 +366,22 @@ class ResourceExt(Resource):
         because we want to know its id.  We record it here, instead.
         :param event: the event with the file information.
         """
-        file = event.info
+        self.recordFileAdded(event.info)
+
+    def fileSaveManyCreatedHandler(self, event):
+        """
+        When a batch of files is created together, record each of them as
+        fileSaveCreatedHandler does.
+        :param event: the event with the list of file information.
+        """
+        for file in event.info:
+            self.recordFileAdded(file)
+
+    def recordFileAdded(self, file):
+        """
+        Add a record of a new file to the provenance of its parent item.
+        :param file: the new file.
+        """
         if not file.get('itemId') or '_id' not in file:
             return
         user = self.getProvenanceUser(file)
@@ -19,6 +19,7 @@
 
 import os
 import six
+import time
 
 from tests import base
 from girder import events
@@ -70,6 +71,21 @@ class ThumbnailsTestCase(base.TestCase):
 
         events.unbind('thumbnails.create', 'test')
 
+    def _waitForJob(self, job, timeout=10):
+        """
+        Thumbnails are created by a local job, which runs in the background.
+        Wait for it to finish and return it.
+        """
+        from girder.plugins.jobs.constants import JobStatus
+        end = time.time() + timeout
+        while True:
+            job = self.model('job', 'jobs').load(job['_id'], force=True)
+            if job['status'] in (JobStatus.SUCCESS, JobStatus.ERROR):
+                return job
+            if time.time() > end:
+                raise AssertionError('Thumbnail job did not finish.')
+            time.sleep(0.02)
+
     def testThumbnailCreation(self):
         path = os.path.join(ROOT_DIR, 'clients', 'web', 'static', 'img',
                             'Girder_Mark.png')
@@ -123,7 +139,7 @@ class ThumbnailsTestCase(base.TestCase):
         resp = self.request(
             path='/thumbnail', method='POST', user=self.user, params=params)
         self.assertStatusOk(resp)
-        job = resp.json
+        job = self._waitForJob(resp.json)
 
         from girder.plugins.jobs.constants import JobStatus
         self.assertEqual(job['status'], JobStatus.SUCCESS)
@@ -158,6 +174,7 @@ class ThumbnailsTestCase(base.TestCase):
                 'fileId': fileId
             })
         self.assertStatusOk(resp)
+        self._waitForJob(resp.json)
         self.publicFolder = self.model('folder').load(
             self.publicFolder['_id'], force=True)
         self.assertEqual(len(self.publicFolder['_thumbnails']), 1)
@@ -227,7 +244,7 @@ class ThumbnailsTestCase(base.TestCase):
         resp = self.request(
             path='/thumbnail', method='POST', user=self.user, params=params)
         self.assertStatusOk(resp)
-        job = resp.json
+        job = self._waitForJob(resp.json)
 
         from girder.plugins.jobs.constants import JobStatus
         self.assertEqual(job['status'], JobStatus.SUCCESS)
@@ -262,6 +279,7 @@ class ThumbnailsTestCase(base.TestCase):
                 'fileId': fileId
             })
         self.assertStatusOk(resp)
+        self._waitForJob(resp.json)
         self.publicFolder = self.model('folder').load(
             self.publicFolder['_id'], force=True)
         self.assertEqual(len(self.publicFolder['_thumbnails']), 1)
@@ -278,6 +296,46 @@ class ThumbnailsTestCase(base.TestCase):
         self.model('folder').remove(self.publicFolder)
         self.assertEqual(self.model('file').load(thumbnailId), None)
 
+    def testLargeJpegThumbnail(self):
+        from girder.plugins.thumbnails import worker
+
+        out = six.BytesIO()
+        Image.new('RGB', (2400, 1600), (255, 0, 0)).save(out, 'JPEG')
+        data = out.getvalue()
+
+        # Only a reduced scale of the image needs to be decoded
+        image = Image.open(six.BytesIO(data))
+        worker._reduceImage(image, 64, 32, True)
+        self.assertEqual(image.size, (300, 200))
+
+        item = self.model('item').createItem(
+            'large.jpg', creator=self.admin, folder=self.publicFolder)
+        file = self.model('upload').uploadFromFile(
+            six.BytesIO(data), len(data), 'large.jpg', 'item', item, self.admin,
+            mimeType='image/jpeg')
+
+        resp = self.request(
+            path='/thumbnail', method='POST', user=self.admin, params={
+                'width': 64,
+                'height': 32,
+                'attachToId': str(item['_id']),
+                'attachToType': 'item',
+                'fileId': str(file['_id'])
+            })
+        self.assertStatusOk(resp)
+        job = self._waitForJob(resp.json)
+        from girder.plugins.jobs.constants import JobStatus
+        self.assertEqual(job['status'], JobStatus.SUCCESS)
+        self.assertTrue(job['process'])
+        self.assertEqual(job['memoryLimit'], 1024 * 1024 * 1024)
+
+        item = self.model('item').load(item['_id'], force=True)
+        resp = self.request('/file/%s/download' % item['_thumbnails'][0],
+                            isJson=False)
+        image = Image.open(six.BytesIO(self.getBody(resp, text=False)))
+        self.assertEqual(image.size, (64, 32))
+        self.assertGreater(image.getpixel((32, 16))[0], 200)
+
     def testCreateThumbnailOverride(self):
         def override(event):
             # Override thumbnail creation -- just grab the first 4 bytes
@@ -336,6 +394,7 @@ class ThumbnailsTestCase(base.TestCase):
                 'fileId': fileId
             })
         self.assertStatusOk(resp)
+        self._waitForJob(resp.json)
 
         # Download the new thumbnail
         folder = self.model('folder').load(self.publicFolder['_id'], force=True)
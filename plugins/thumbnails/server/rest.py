@@ -21,6 +21,7 @@ from girder.api import access
 from girder.api.describe import Description, describeRoute
 from girder.api.rest import filtermodel, loadmodel, Resource, RestException
 from girder.constants import AccessType
+from girder.utility import config
 
 
 class Thumbnail(Resource):
@@ -81,10 +82,14 @@ class Thumbnail(Resource):
             'attachToId': params['attachToId']
         }
 
+        # Decoding large images takes a lot of memory, so thumbnails are made
+        # in the worker processes of the local job executor, if it has any
+        memoryLimit = int(config.getConfig().get('thumbnails', {}).get('memory_limit', 1024))
         job = self.model('job', 'jobs').createLocalJob(
             title='Generate thumbnail for %s' % file['name'], user=user,
             type='thumbnails.create', public=False, kwargs=kwargs,
-            module='girder.plugins.thumbnails.worker')
+            module='girder.plugins.thumbnails.worker', process=True,
+            memoryLimit=memoryLimit * 1024 * 1024 or None)
 
         self.model('job', 'jobs').scheduleJob(job)
 
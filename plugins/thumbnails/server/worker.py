@@ -19,7 +19,9 @@
 
 from bson.objectid import ObjectId
 import functools
+import math
 import six
+import struct
 import sys
 import traceback
 import dicom
@@ -76,37 +78,40 @@ def createThumbnail(width, height, crop, fileId, attachToType, attachToId):
             return newFile
         else:
             file = newFile
-            streamFn = functools.partial(
-                fileModel.download, file, headers=False)
 
     if 'assetstoreId' not in file:
         # TODO(zachmullen) we could thumbnail link files if we really wanted.
         raise Exception('File %s has no assetstore.' % fileId)
 
-    stream = streamFn()
-    data = b''.join(stream())
+    # The image is decoded while it is read from the file, so it must be
+    # resized before the file is closed
+    with fileModel.open(file) as stream:
+        image = _getImage(file['mimeType'], file['exts'], stream)
 
-    image = _getImage(file['mimeType'], file['exts'], data)
+        # Images are only cropped to fit both a width and a height
+        crop = crop and width and height
+        if not width:
+            width = int(height * image.size[0] / image.size[1])
+        elif not height:
+            height = int(width * image.size[1] / image.size[0])
 
-    if not width:
-        width = int(height * image.size[0] / image.size[1])
-    elif not height:
-        height = int(width * image.size[1] / image.size[0])
-    elif crop:
-        x1 = y1 = 0
-        x2, y2 = image.size
-        wr = float(image.size[0]) / width
-        hr = float(image.size[1]) / height
+        _reduceImage(image, width, height, crop)
 
-        if hr > wr:
-            y1 = int(y2 / 2 - height * wr / 2)
-            y2 = int(y2 / 2 + height * wr / 2)
-        else:
-            x1 = int(x2 / 2 - width * hr / 2)
-            x2 = int(x2 / 2 + width * hr / 2)
-        image = image.crop((x1, y1, x2, y2))
+        if crop:
+            x1 = y1 = 0
+            x2, y2 = image.size
+            wr = float(image.size[0]) / width
+            hr = float(image.size[1]) / height
+
+            if hr > wr:
+                y1 = int(y2 / 2 - height * wr / 2)
+                y2 = int(y2 / 2 + height * wr / 2)
+            else:
+                x1 = int(x2 / 2 - width * hr / 2)
+                x2 = int(x2 / 2 + width * hr / 2)
+            image = image.crop((x1, y1, x2, y2))
 
-    image.thumbnail((width, height), Image.ANTIALIAS)
+        image.thumbnail((width, height), Image.ANTIALIAS)
 
     uploadModel = ModelImporter.model('upload')
 
@@ -163,20 +168,104 @@ def attachThumbnail(file, thumbnail, attachToType, attachToId, width, height):
     return ModelImporter.model('file').save(thumbnail)
 
 
-def _getImage(mimeType, extension, data):
+def _getImage(mimeType, extension, stream):
     """
-    Check extension of image and opens it.
+    Check extension of image and opens it. Only the header of images other
+    than DICOM is read; their pixels are decoded when they are first used.
 
     :param extension: The extension of the image that needs to be opened.
-    :param data: The image file stream.
+    :param stream: The seekable image file stream.
     """
     if (extension and extension[-1] == 'dcm') or mimeType == 'application/dicom':
         # Open the dicom image
-        dicomData = dicom.read_file(six.BytesIO(data))
+        dicomData = _readDicom(stream)
         return scaleDicomLevels(dicomData)
     else:
         # Open other types of images
-        return Image.open(six.BytesIO(data))
+        return Image.open(stream)
+
+
+def _reduceImage(image, width, height, crop):
+    """
+    Make an image that has not been decoded yet decode at the smallest size
+    from which the thumbnail can still be made. JPEG images are decoded at a
+    reduced scale by Pillow's draft mode, and pyramidal TIFF images are read
+    from their smallest level that is large enough.
+
+    :param image: The image, as returned by Image.open.
+    :param width: The width of the thumbnail.
+    :param height: The height of the thumbnail.
+    :param crop: Whether the thumbnail will be cropped to its aspect ratio.
+    """
+    w, h = image.size
+    scales = (float(width) / w, float(height) / h)
+    scale = max(scales) if crop else min(scales)
+    size = (int(math.ceil(w * scale)), int(math.ceil(h * scale)))
+
+    if image.format == 'TIFF' and getattr(image, 'n_frames', 1) > 1:
+        best = (w * h, 0)
+        for frame in range(1, image.n_frames):
+            image.seek(frame)
+            fw, fh = image.size
+            # Levels of a pyramid are the full image, scaled down by a power
+            # of two
+            factor = float(w) / fw
+            levels = math.log(factor, 2)
+            if (fw >= size[0] and fh >= size[1] and round(levels) >= 1 and
+                    abs(levels - round(levels)) < 0.01 and
+                    abs(fh * factor - h) <= factor):
+                best = min(best, (fw * fh, frame))
+        image.seek(best[1])
+
+    image.draft(image.mode, size)
+
+
+def _readDicom(stream):
+    """
+    Read a DICOM dataset from a stream. If its pixel data is not compressed,
+    only the first frame of it is read.
+
+    :param stream: The seekable DICOM file stream.
+    """
+    dicomData = dicom.read_file(stream, stop_before_pixels=True)
+    frame = _readFirstFrame(stream, dicomData)
+    if frame is None:
+        stream.seek(0)
+        return dicom.read_file(stream)
+
+    dicomData.PixelData = frame
+    dicomData.NumberOfFrames = 1
+    return dicomData
+
+
+def _readFirstFrame(stream, dicomData):
+    """
+    Read the first frame of the pixel data of a DICOM dataset, from a stream
+    positioned at the start of its Pixel Data element.
+
+    :returns: the bytes of the frame, or None if the pixel data is compressed
+        or can't be read this way.
+    """
+    endian = '<' if dicomData.is_little_endian else '>'
+    header = stream.read(8)
+    if len(header) < 8 or struct.unpack(endian + 'HH', header[:4]) != (0x7fe0, 0x0010):
+        return None
+
+    if dicomData.is_implicit_VR:
+        length = struct.unpack(endian + 'L', header[4:])[0]
+    elif header[4:6] in (b'OB', b'OW', b'OF', b'UN'):
+        length = struct.unpack(endian + 'L', stream.read(4))[0]
+    else:
+        length = struct.unpack(endian + 'H', header[6:])[0]
+
+    # Compressed pixel data is encapsulated, with an undefined length
+    if length == 0xFFFFFFFF:
+        return None
+
+    frameSize = (dicomData.Rows * dicomData.Columns * dicomData.BitsAllocated // 8 *
+                 getattr(dicomData, 'SamplesPerPixel', 1))
+    frame = stream.read(min(length, frameSize))
+    return frame if len(frame) == frameSize else None
 
 
 def scaleDicomLevels(dicomData):
@@ -2,6 +2,8 @@ import _ from 'underscore';
 
 import SearchFieldWidget from 'girder/views/widgets/SearchFieldWidget';
 import View from 'girder/views/View';
+import { restRequest } from 'girder/rest';
+import JobStatus from 'girder_plugins/jobs/JobStatus';
 
 import 'girder/utilities/jquery/girderEnable';
 import 'girder/utilities/jquery/girderModal';
@@ -40,23 +42,32 @@ var CreateThumbnailView = View.extend({
             this.$('.g-validation-failed-message').empty();
             this.$('.g-submit-create-thumbnail').girderEnable(false);
 
-            new ThumbnailModel({
+            var job = new ThumbnailModel({
                 width: Number(this.$('#g-thumbnail-width').val()) || 0,
                 height: Number(this.$('#g-thumbnail-height').val()) || 0,
                 crop: this.$('#g-thumbnail-crop').is(':checked'),
                 fileId: this.file.id,
                 attachToId: this.attachToId,
                 attachToType: this.attachToType
-            }).on('g:saved', function () {
-                this.$el.on('hidden.bs.modal', _.bind(function () {
-                    this.trigger('g:created', {
-                        attachedToType: this.attachToType,
-                        attachedToId: this.attachToId
-                    });
-                }, this)).modal('hide');
+            });
+            job.on('g:saved', function () {
+                this.waitForJob(job.id, function (jobInfo) {
+                    if (jobInfo.status === JobStatus.ERROR) {
+                        this.showError('Thumbnail creation failed.');
+                        return;
+                    } else if (jobInfo.status === JobStatus.CANCELED) {
+                        this.showError('Thumbnail creation was canceled.');
+                        return;
+                    }
+                    this.$el.on('hidden.bs.modal', _.bind(function () {
+                        this.trigger('g:created', {
+                            attachedToType: this.attachToType,
+                            attachedToId: this.attachToId
+                        });
+                    }, this)).modal('hide');
+                });
             }, this).on('g:error', function (resp) {
-                this.$('.g-submit-create-thumbnail').girderEnable(true);
-                this.$('.g-validation-failed-message').text(resp.responseJSON.message);
+                this.showError(resp.responseJSON.message);
             }, this).save();
         }
     },
@@ -90,6 +101,32 @@ var CreateThumbnailView = View.extend({
         return this;
     },
 
+    /**
+     * Thumbnails are created by a job that runs in the background on the
+     * server. Poll the job until it has finished, then call the callback with
+     * the job. If polling fails, the error is shown in the dialog.
+     */
+    waitForJob: function (jobId, callback) {
+        restRequest({
+            path: 'job/' + jobId,
+            error: null
+        }).done(_.bind(function (job) {
+            if (_.contains([JobStatus.SUCCESS, JobStatus.ERROR, JobStatus.CANCELED], job.status)) {
+                callback.call(this, job);
+            } else {
+                window.setTimeout(_.bind(this.waitForJob, this, jobId, callback), 250);
+            }
+        }, this)).fail(_.bind(function (resp) {
+            this.showError((resp.responseJSON && resp.responseJSON.message) ||
+                           'Could not get the status of the thumbnail job.');
+        }, this));
+    },
+
+    showError: function (message) {
+        this.$('.g-submit-create-thumbnail').girderEnable(true);
+        this.$('.g-validation-failed-message').text(message);
+    },
+
     pickTarget: function (target) {
         this.searchWidget.resetState();
         this.attachToType = target.type;
@@ -387,17 +387,18 @@ class QuotaPolicy(Resource):
         fileSizeQuota = self._getFileSizeQuota(model, resource)
         if not fileSizeQuota:
             return None
-        newSize = resource['size'] + upload['size'] - origSize
+        used = self.model('size_ledger').getSize(model, resource, exact=True)
+        newSize = used + upload['size'] - origSize
         # always allow replacement with a smaller object
         if newSize <= fileSizeQuota or upload['size'] < origSize:
             return None
-        left = fileSizeQuota - resource['size']
+        left = fileSizeQuota - used
         if left < 0:
             left = 0
         return {'fileSizeQuota': fileSizeQuota,
                 'sizeNeeded': upload['size'] - origSize,
                 'quotaLeft': left,
-                'quotaUsed': resource['size']}
+                'quotaUsed': used}
 
     def checkUploadStart(self, event):
         """
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+"""
+Benchmark item and file searches whose results are spread across many
+folders, which exercises AccessControlMixin.filterResultsByPermission.
+Setting the access batch size to 1 reproduces the cost of resolving every
+parent folder with its own query.
+"""
+
+from __future__ import print_function
+
+import benchmark_utils
+
+
+def main():
+    parser = benchmark_utils.argumentParser(__doc__)
+    parser.add_argument('--folders', type=int, default=2000)
+    parser.add_argument('--items', type=int, default=2,
+                        help='Number of items (and files) per folder.')
+    args = parser.parse_args()
+
+    benchmark_utils.setupDatabase(args.db)
+
+    from girder.constants import AccessType
+    from girder.utility.model_importer import ModelImporter
+    model = ModelImporter.model
+
+    admin = model('user').createUser(
+        'admin', 'password', 'Admin', 'Admin', 'admin@example.com')
+    user = model('user').createUser(
+        'user', 'password', 'User', 'User', 'user@example.com')
+    coll = model('collection').createCollection(
+        'benchmark', creator=admin, public=False)
+
+    for i in range(args.folders):
+        folder = model('folder').createFolder(
+            coll, 'folder %d' % i, parentType='collection', creator=admin)
+        if i % 2:
+            model('folder').setUserAccess(
+                folder, user, level=AccessType.READ, save=True)
+        for j in range(args.items):
+            item = model('item').createItem(
+                'sample %d %d' % (i, j), creator=admin, folder=folder)
+            model('file').createLinkFile(
+                'sample %d %d' % (i, j), item, 'item', 'http://example.com',
+                admin)
+
+    def itemSearch():
+        list(model('item').textSearch('sample', user=user))
+
+    def fileSearch():
+        list(model('file').prefixSearch('sample', user=user))
+
+    for batchSize in (1, model('item').accessBatchSize):
+        model('item').accessBatchSize = batchSize
+        model('file').accessBatchSize = batchSize
+        benchmark_utils.measure(
+            'item text search, access batch size %d' % batchSize, itemSearch,
+            args.repeat)
+        benchmark_utils.measure(
+            'file prefix search, access batch size %d' % batchSize, fileSearch,
+            args.repeat)
+
+    benchmark_utils.dropDatabase()
+
+
+if __name__ == '__main__':
+    main()
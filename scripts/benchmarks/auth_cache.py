@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+"""
+Benchmark authenticated GET /item/:id requests served over HTTP, with and
+without the token cache (see the token_cache_ttl configuration value).
+"""
+
+from __future__ import print_function
+
+import benchmark_utils
+import requests
+
+
+def main():
+    parser = benchmark_utils.argumentParser(__doc__)
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='Number of requests to time.')
+    args = parser.parse_args()
+
+    benchmark_utils.setupDatabase(args.db)
+    apiUrl = benchmark_utils.startServer(args.port)
+
+    import cherrypy
+    from girder.api import rest
+    from girder.utility.model_importer import ModelImporter
+    model = ModelImporter.model
+
+    try:
+        user = model('user').createUser(
+            'user', 'password', 'User', 'User', 'user@example.com')
+        folder = next(model('folder').childFolders(
+            user, 'user', user=user, filters={'name': 'Private'}))
+        item = model('item').createItem('item', creator=user, folder=folder)
+        token = model('token').createToken(user)
+
+        session = requests.Session()
+        session.headers['Girder-Token'] = token['_id']
+        url = '%s/item/%s' % (apiUrl, item['_id'])
+
+        def getItem():
+            session.get(url).raise_for_status()
+
+        ttl = cherrypy.config['auth'].get('token_cache_ttl', 30)
+        for label, cacheTtl in (('without token cache', 0), ('with token cache', ttl)):
+            cherrypy.config['auth']['token_cache_ttl'] = cacheTtl
+            rest.authCache.clear()
+            getItem()
+            benchmark_utils.measureRate(
+                'GET /item/:id, %s' % label, getItem, args.requests)
+    finally:
+        benchmark_utils.stopServer()
+        benchmark_utils.dropDatabase()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+"""
+Shared helpers for the scripts in this directory.
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import os
+import sys
+import time
+
+import pymongo.monitoring
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+
+class CommandCounter(pymongo.monitoring.CommandListener):
+    """
+    Counts the MongoDB commands issued by this process, by command name.
+    """
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def started(self, event):
+        self.counts[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def reset(self):
+        self.counts.clear()
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+
+commandCounter = CommandCounter()
+
+
+def argumentParser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        '--db', default='mongodb://localhost:27017/girder_benchmark',
+        help='URI of the scratch database to use. It will be dropped.')
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='Number of times to repeat each timed operation.')
+    return parser
+
+
+def connectDatabase(uri):
+    """
+    Point Girder at a database without dropping it, e.g. from a process
+    started by a benchmark that set the database up. This must be called
+    before any model is used.
+    """
+    import cherrypy
+    from girder.utility import config
+
+    pymongo.monitoring.register(commandCounter)
+    config.loadConfig()
+    cherrypy.config['database'] = {'uri': uri}
+
+
+def setupDatabase(uri):
+    """
+    Point Girder at a scratch database and drop it. This must be called
+    before any model is used.
+    """
+    connectDatabase(uri)
+
+    from girder.models import getDbConnection
+    getDbConnection().drop_database(getDbConnection().get_default_database())
+
+
+def loadPlugins(plugins):
+    """
+    Mount Girder with a set of plugins, without serving it, so that the
+    plugins can be used through girder.plugins. Call this after
+    :py:func:`setupDatabase` or :py:func:`connectDatabase`.
+    """
+    from girder.utility import server
+
+    server.setup(plugins=plugins)
+
+
+def dropDatabase():
+    from girder.models import getDbConnection
+    getDbConnection().drop_database(getDbConnection().get_default_database())
+
+
+def startServer(port):
+    """
+    Mount Girder and serve it over HTTP on the given port of localhost. Call
+    this after :py:func:`setupDatabase`.
+
+    :returns: the root URL of the REST API.
+    """
+    import cherrypy
+    from girder.utility import server
+
+    server.setup()
+    cherrypy.config.update({
+        'environment': 'embedded',
+        'server.socket_host': '127.0.0.1',
+        'server.socket_port': port
+    })
+    cherrypy.engine.start()
+    return 'http://127.0.0.1:%d/api/v1' % port
+
+
+def stopServer():
+    import cherrypy
+
+    cherrypy.engine.exit()
+
+
+def measureRate(label, func, count):
+    """
+    Call a function a number of times, and print the number of calls per
+    second and the number of database commands issued per call.
+    """
+    commandCounter.reset()
+    start = time.time()
+    for _ in range(count):
+        func()
+    elapsed = time.time() - start
+    print('%-50s %10.1f /s %8.1f db commands each' % (
+        label, count / elapsed, float(commandCounter.total) / count))
+    return count / elapsed
+
+
+def measure(label, func, repeat=5):
+    """
+    Run a function several times, and print its best wall time and the number
+    of database commands issued by a single run.
+    """
+    best = None
+    for _ in range(repeat):
+        commandCounter.reset()
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print('%-50s %10.4f s %8d db commands' % (
+        label, best, commandCounter.total))
+    return best
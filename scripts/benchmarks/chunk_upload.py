@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+"""
+Benchmark the rate at which small upload chunks are accepted by filesystem
+and GridFS assetstores, with assetstore adapters shared between chunks and
+with a new adapter built for every chunk, as was done before adapters were
+pooled.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+
+import benchmark_utils
+
+
+def main():
+    parser = benchmark_utils.argumentParser(__doc__)
+    parser.add_argument('--chunks', type=int, default=500,
+                        help='Number of chunks in each upload.')
+    parser.add_argument('--chunk-size', type=int, default=64,
+                        help='Size of each chunk in KiB.')
+    parser.add_argument('--assetstore-db', default='girder_benchmark_chunks',
+                        help='Database for the GridFS chunks. It will be dropped.')
+    args = parser.parse_args()
+
+    benchmark_utils.setupDatabase(args.db)
+
+    from girder.models import getDbConnection
+    from girder.utility import assetstore_utilities
+    from girder.utility.model_importer import ModelImporter
+    model = ModelImporter.model
+
+    root = tempfile.mkdtemp()
+    getDbConnection().drop_database(args.assetstore_db)
+    try:
+        assetstores = [
+            model('assetstore').createFilesystemAssetstore('filesystem', root),
+            model('assetstore').createGridFsAssetstore('gridfs', args.assetstore_db)
+        ]
+        user = model('user').createUser(
+            'user', 'password', 'User', 'User', 'user@example.com')
+        folder = next(model('folder').childFolders(
+            user, 'user', user=user, filters={'name': 'Private'}))
+        data = os.urandom(args.chunk_size * 1024)
+
+        def uploadFile(assetstore, pooled):
+            upload = model('upload').createUpload(
+                user, 'chunks.bin', 'folder', folder, len(data) * args.chunks,
+                assetstore=assetstore)
+            for _ in range(args.chunks):
+                if not pooled:
+                    assetstore_utilities.clearAssetstoreAdapters()
+                upload = model('upload').handleChunk(upload, data)
+
+        for assetstore in assetstores:
+            for pooled in (False, True):
+                best = benchmark_utils.measure(
+                    '%s, %s adapters' % (
+                        assetstore['name'], 'pooled' if pooled else 'new'),
+                    lambda: uploadFile(assetstore, pooled), args.repeat)
+                print('%-50s %10.1f chunks/s' % ('', args.chunks / best))
+    finally:
+        shutil.rmtree(root)
+        getDbConnection().drop_database(args.assetstore_db)
+        benchmark_utils.dropDatabase()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+"""
+Benchmark copying a folder tree of many items, each with one file. The files
+are link files, so this measures the database work only. A batch size of 1
+approximates creating every document on its own.
+"""
+
+from __future__ import print_function
+
+import benchmark_utils
+import time
+
+
+def main():
+    parser = benchmark_utils.argumentParser(__doc__)
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--folders', type=int, default=100,
+                        help='Number of subfolders to spread the items over.')
+    parser.add_argument('--batch-sizes', type=int, nargs='+',
+                        default=[1, 1000], dest='batchSizes')
+    args = parser.parse_args()
+
+    benchmark_utils.setupDatabase(args.db)
+
+    from girder.utility.model_importer import ModelImporter
+    model = ModelImporter.model
+
+    admin = model('user').createUser(
+        'admin', 'password', 'Admin', 'Admin', 'admin@example.com')
+    coll = model('collection').createCollection(
+        'benchmark', creator=admin, public=False)
+
+    folder = model('folder').createFolder(
+        coll, 'folder', parentType='collection', creator=admin)
+    perFolder = args.items // args.folders
+    for i in range(args.folders):
+        subfolder = model('folder').createFolder(
+            folder, 'sub %d' % i, parentType='folder', creator=admin)
+        item = model('item').createItem('item', creator=admin, folder=subfolder)
+        file = model('file').createLinkFile(
+            'file', item, 'item', 'http://example.com', admin)
+        del item['_id'], file['_id']
+        items = [dict(item, name='item %d' % j) for j in range(1, perFolder)]
+        itemIds = model('item').collection.insert_many(items).inserted_ids
+        model('file').collection.insert_many(
+            [dict(file, itemId=itemId, size=1) for itemId in itemIds])
+
+    for batchSize in args.batchSizes:
+        model('folder').copyBatchSize = batchSize
+        benchmark_utils.commandCounter.reset()
+        start = time.time()
+        model('folder').copyFolder(folder, creator=admin)
+        print('%-50s %10.4f s %8d db commands' % (
+            'copy %d items, batch size %d' % (args.items, batchSize),
+            time.time() - start, benchmark_utils.commandCounter.total))
+
+    benchmark_utils.dropDatabase()
+
+
+if __name__ == '__main__':
+    main()
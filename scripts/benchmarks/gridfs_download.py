@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+"""
+Benchmark the throughput of streaming a large file out of a GridFS
+assetstore at different prefetch depths (see
+GridFsAssetstoreAdapter.prefetchDepth). Use --assetstore-host to put the
+chunks on a remote server or replica set, where latency matters most.
+"""
+
+from __future__ import print_function
+
+import os
+
+import benchmark_utils
+
+
+def main():
+    parser = benchmark_utils.argumentParser(__doc__)
+    parser.add_argument('--size', type=int, default=1024,
+                        help='Size of the file in MiB.')
+    parser.add_argument('--depths', default='0,1,2,4,8',
+                        help='Comma-separated prefetch depths to compare.')
+    parser.add_argument('--assetstore-db', default='girder_benchmark_gridfs',
+                        help='Database for the GridFS chunks. It will be dropped.')
+    parser.add_argument('--assetstore-host', default=None,
+                        help='MongoDB URI of the server holding the chunks.')
+    args = parser.parse_args()
+
+    benchmark_utils.setupDatabase(args.db)
+
+    from girder.models import getDbConnection
+    from girder.utility import assetstore_utilities
+    from girder.utility.gridfs_assetstore_adapter import CHUNK_SIZE, GridFsAssetstoreAdapter
+    from girder.utility.model_importer import ModelImporter
+    model = ModelImporter.model
+
+    getDbConnection(args.assetstore_host).drop_database(args.assetstore_db)
+    try:
+        assetstore = model('assetstore').createGridFsAssetstore(
+            'benchmark', args.assetstore_db, mongohost=args.assetstore_host)
+        user = model('user').createUser(
+            'user', 'password', 'User', 'User', 'user@example.com')
+        folder = next(model('folder').childFolders(
+            user, 'user', user=user, filters={'name': 'Private'}))
+
+        size = args.size * 1024 * 1024
+        upload = model('upload').createUpload(
+            user, 'large.bin', 'folder', folder, size, assetstore=assetstore)
+        data = os.urandom(CHUNK_SIZE * 8)
+        for offset in range(0, size, len(data)):
+            upload = model('upload').handleChunk(upload, data[:size - offset])
+        file = upload
+
+        adapter = assetstore_utilities.getAssetstoreAdapter(assetstore)
+
+        def download():
+            for _ in adapter.downloadFile(file, headers=False)():
+                pass
+
+        for depth in [int(depth) for depth in args.depths.split(',')]:
+            GridFsAssetstoreAdapter.prefetchDepth = depth
+            best = benchmark_utils.measure(
+                'download %d MiB, prefetch depth %d' % (args.size, depth),
+                download, args.repeat)
+            print('%-50s %10.1f MiB/s' % ('', args.size / best))
+    finally:
+        getDbConnection(args.assetstore_host).drop_database(args.assetstore_db)
+        benchmark_utils.dropDatabase()
+
+
+if __name__ == '__main__':
+    main()
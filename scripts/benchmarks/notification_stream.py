@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+"""
+Open many idle /notification/stream connections over HTTP, and measure the
+database commands per second they cause while nothing happens, then how long
+it takes for a notification to reach all of them.
+"""
+
+from __future__ import print_function
+
+import benchmark_utils
+import requests
+import threading
+import time
+
+
+def main():
+    parser = benchmark_utils.argumentParser(__doc__)
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--subscribers', type=int, default=500,
+                        help='Number of streams to open.')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='Seconds to measure the idle streams for.')
+    args = parser.parse_args()
+
+    benchmark_utils.setupDatabase(args.db)
+
+    import cherrypy
+    cherrypy.config['server.thread_pool'] = args.subscribers + 10
+    apiUrl = benchmark_utils.startServer(args.port)
+
+    from girder.utility.model_importer import ModelImporter
+    from girder.utility.notification_bus import getNotificationBus
+    model = ModelImporter.model
+    bus = getNotificationBus()
+
+    received = []
+    receivedLock = threading.Lock()
+
+    def subscribe(token):
+        resp = requests.get(
+            apiUrl + '/notification/stream', stream=True,
+            headers={'Girder-Token': token['_id']},
+            params={'timeout': int(args.duration) + 60})
+        for line in resp.iter_lines():
+            if line:
+                with receivedLock:
+                    received.append(time.time())
+                break
+        resp.close()
+
+    try:
+        user = model('user').createUser(
+            'user', 'password', 'User', 'User', 'user@example.com')
+        threads = []
+        for _ in range(args.subscribers):
+            thread = threading.Thread(
+                target=subscribe, args=(model('token').createToken(user),))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        while bus.subscriberCount() < args.subscribers:
+            time.sleep(0.1)
+
+        benchmark_utils.commandCounter.reset()
+        time.sleep(args.duration)
+        print('%-50s %10.1f /s' % (
+            '%d idle streams, db commands' % args.subscribers,
+            benchmark_utils.commandCounter.total / args.duration))
+
+        start = time.time()
+        model('notification').createNotification('benchmark', {}, user)
+        for thread in threads:
+            thread.join(60)
+        print('%-50s %10.4f s %8d received' % (
+            'notification delivered to every stream', max(received or [start]) - start,
+            len(received)))
+    finally:
+        benchmark_utils.stopServer()
+        benchmark_utils.dropDatabase()
+
+
+if __name__ == '__main__':
+    main()
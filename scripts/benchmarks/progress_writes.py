@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+"""
+Benchmark deleting a folder of many items with progress recording on. An
+interval of 0 writes the progress record on every update.
+"""
+
+from __future__ import print_function
+
+import benchmark_utils
+import time
+
+
+def main():
+    parser = benchmark_utils.argumentParser(__doc__)
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--intervals', type=float, nargs='+', default=[0, 0.5],
+                        help='Progress write intervals to compare, in seconds.')
+    args = parser.parse_args()
+
+    benchmark_utils.setupDatabase(args.db)
+
+    from girder.utility.model_importer import ModelImporter
+    from girder.utility.progress import ProgressContext
+    model = ModelImporter.model
+
+    admin = model('user').createUser(
+        'admin', 'password', 'Admin', 'Admin', 'admin@example.com')
+    coll = model('collection').createCollection(
+        'benchmark', creator=admin, public=False)
+
+    for interval in args.intervals:
+        folder = model('folder').createFolder(
+            coll, 'folder', parentType='collection', creator=admin)
+        template = model('item').createItem('item', creator=admin, folder=folder)
+        del template['_id']
+        for start in range(1, args.items, 1000):
+            docs = []
+            for i in range(start, min(start + 1000, args.items)):
+                doc = dict(template)
+                doc['name'] = 'item %d' % i
+                docs.append(doc)
+            model('item').collection.insert_many(docs)
+
+        before = model('notification').progressStats()
+        benchmark_utils.commandCounter.reset()
+        begin = time.time()
+        with ProgressContext(True, user=admin, title='Deleting',
+                             total=args.items, interval=interval) as ctx:
+            model('folder').remove(folder, progress=ctx)
+        elapsed = time.time() - begin
+        after = model('notification').progressStats()
+        print('%-50s %10.4f s %8d db commands %8d progress writes' % (
+            'delete %d items, progress interval %g s' % (args.items, interval),
+            elapsed, benchmark_utils.commandCounter.total,
+            after['writes'] - before['writes']))
+
+    benchmark_utils.dropDatabase()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+"""
+Benchmark the overhead of Resource.handleRoute for a resource with many
+routes, such as the item resource once several plugins have added to it.
+Handlers do no work, so this measures matching the path and firing the
+before/after events only. No database is used.
+"""
+
+from __future__ import print_function
+
+import benchmark_utils
+
+
+def main():
+    parser = benchmark_utils.argumentParser(__doc__)
+    parser.add_argument('--routes', type=int, default=60,
+                        help='Number of routes on the resource.')
+    parser.add_argument('--calls', type=int, default=100000,
+                        help='Number of requests to route per timing.')
+    args = parser.parse_args()
+
+    from girder import events
+    from girder.api import access
+    from girder.api.rest import Resource
+
+    @access.public
+    def handler(**kwargs):
+        return kwargs
+
+    resource = Resource()
+    resource.resourceName = 'item'
+    paths = []
+    for i in range(args.routes // 3):
+        resource.route('GET', (':id', 'action%d' % i), handler, nodoc=True)
+        resource.route('PUT', (':id', 'action%d' % i), handler, nodoc=True)
+        resource.route('GET', ('action%d' % i, ':id', 'files'), handler, nodoc=True)
+        paths.append(('GET', ('5700a6c2f8c5a5004a0a1cb9', 'action%d' % i)))
+        paths.append(('GET', ('action%d' % i, '5700a6c2f8c5a5004a0a1cb9', 'files')))
+    resource.route('GET', (':id',), handler, nodoc=True)
+    paths.append(('GET', ('5700a6c2f8c5a5004a0a1cb9',)))
+
+    def dispatch():
+        for i in range(args.calls):
+            method, path = paths[i % len(paths)]
+            resource.handleRoute(method, path, {})
+
+    benchmark_utils.measure(
+        '%d calls, no event handlers' % args.calls, dispatch, args.repeat)
+    with events.bound('rest.get.item/:id.after', 'benchmark', lambda event: None):
+        benchmark_utils.measure(
+            '%d calls, one event handler' % args.calls, dispatch, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
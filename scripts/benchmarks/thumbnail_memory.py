@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+"""
+Benchmark the peak memory use and wall time of making a cropped thumbnail of
+large JPEG, PNG and TIFF images. Images are either decoded from a stream over
+the file, at a reduced size where the format allows it, or read into memory
+whole and decoded at full size, as was done before. Each thumbnail is made by
+a new Python process, which reports its own peak resident set size, so the
+figures include the memory used by the interpreter and Girder itself.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import six
+import subprocess
+import sys
+import tempfile
+import time
+
+import benchmark_utils
+
+MODES = (
+    ('streamed', 'streamed, reduced decode'),
+    ('whole', 'whole file, full decode')
+)
+
+
+def makeThumbnail(args):
+    """
+    Make one thumbnail in this process, and print the time it took and the
+    peak memory use of the process as JSON.
+    """
+    mode, fileId, itemId = args.child
+    benchmark_utils.connectDatabase(args.db)
+    benchmark_utils.loadPlugins(['thumbnails'])
+
+    from girder.plugins.thumbnails import worker
+    from girder.utility.model_importer import ModelImporter
+
+    if mode == 'whole':
+        fileModel = ModelImporter.model('file')
+        fileModel.open = lambda file: six.BytesIO(
+            b''.join(fileModel.download(file, headers=False)()))
+        worker._reduceImage = lambda *args: None
+
+    start = time.time()
+    worker.createThumbnail(
+        args.thumbnail, args.thumbnail, True, fileId, 'item', itemId)
+    elapsed = time.time() - start
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak *= 1024
+    print(json.dumps({'time': elapsed, 'peak': peak}))
+
+
+def main():
+    parser = benchmark_utils.argumentParser(__doc__)
+    parser.add_argument('--size', type=int, default=8000,
+                        help='Width of the images in pixels. Their height is '
+                        'three quarters of it.')
+    parser.add_argument('--thumbnail', type=int, default=256,
+                        help='Width and height of the thumbnails.')
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        makeThumbnail(args)
+        return
+
+    benchmark_utils.setupDatabase(args.db)
+
+    from girder.utility.model_importer import ModelImporter
+    from PIL import Image
+    model = ModelImporter.model
+
+    root = tempfile.mkdtemp()
+    try:
+        model('assetstore').createFilesystemAssetstore('filesystem', root)
+        user = model('user').createUser(
+            'user', 'password', 'User', 'User', 'user@example.com')
+        folder = next(model('folder').childFolders(
+            user, 'user', user=user, filters={'name': 'Private'}))
+
+        # Noise compresses about as badly as a photograph does
+        image = Image.effect_noise(
+            (args.size, args.size * 3 // 4), 64).convert('RGB')
+        files = []
+        for format, mimeType in (('JPEG', 'image/jpeg'), ('PNG', 'image/png'),
+                                 ('TIFF', 'image/tiff')):
+            name = 'image.' + format.lower()
+            item = model('item').createItem(name, creator=user, folder=folder)
+            with tempfile.TemporaryFile() as out:
+                image.save(out, format)
+                size = out.tell()
+                out.seek(0)
+                file = model('upload').uploadFromFile(
+                    out, size, name, 'item', item, user, mimeType=mimeType)
+            files.append((format, file, item))
+        del image
+
+        for format, file, item in files:
+            for mode, label in MODES:
+                times, peaks = [], []
+                for _ in range(args.repeat):
+                    output = subprocess.check_output([
+                        sys.executable, os.path.abspath(__file__),
+                        '--db', args.db, '--thumbnail', str(args.thumbnail),
+                        '--child', mode, str(file['_id']), str(item['_id'])])
+                    result = json.loads(output.decode('utf8').splitlines()[-1])
+                    times.append(result['time'])
+                    peaks.append(result['peak'])
+                print('%-50s %10.4f s %10.1f MiB peak RSS' % (
+                    '%s, %.1f MiB, %s' % (format, file['size'] / 1048576.0, label),
+                    min(times), max(peaks) / 1048576.0))
+    finally:
+        shutil.rmtree(root)
+        benchmark_utils.dropDatabase()
+
+
+if __name__ == '__main__':
+    main()
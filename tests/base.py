@@ -460,6 +460,9 @@ class TestCase(unittest.TestCase, model_importer.ModelImporter):
             headers.append(('Content-Length', '%d' % len(qs)))
             fd = BytesIO(qs)
             qs = None
+            if type is not None and params:
+                # The body is not a form, so send the parameters in the URL
+                qs = urllib.parse.urlencode(params)
         elif params:
             qs = urllib.parse.urlencode(params)
 
@@ -393,6 +393,39 @@ class AssetstoreTestCase(base.TestCase):
         current = self.model('assetstore').getCurrent()
         self.assertEqual(current['_id'], secondStore['_id'])
 
+    def testAdapterReuse(self):
+        assetstore = self.model('assetstore').getCurrent()
+        adapter = assetstore_utilities.getAssetstoreAdapter(assetstore)
+        self.assertIs(assetstore_utilities.getAssetstoreAdapter(
+            self.model('assetstore').load(assetstore['_id'])), adapter)
+        self.assertIsNot(assetstore_utilities.getAssetstoreAdapter(
+            assetstore, instance=False), adapter)
+
+        # Saving the assetstore changes its revision, so the adapter is rebuilt
+        assetstore['perms'] = 0o600
+        assetstore = self.model('assetstore').save(assetstore)
+        newAdapter = assetstore_utilities.getAssetstoreAdapter(assetstore)
+        self.assertIsNot(newAdapter, adapter)
+        self.assertEqual(newAdapter.assetstore['perms'], 0o600)
+        self.assertIs(assetstore_utilities.getAssetstoreAdapter(assetstore), newAdapter)
+
+        # Changing the adapter class of a type also discards the instances
+        class SubclassAdapter(type(adapter)):
+            pass
+
+        original = type(adapter)
+        assetstore_utilities.setAssetstoreAdapter(assetstore['type'], SubclassAdapter)
+        try:
+            self.assertIsInstance(
+                assetstore_utilities.getAssetstoreAdapter(assetstore), SubclassAdapter)
+        finally:
+            assetstore_utilities.setAssetstoreAdapter(assetstore['type'], original)
+
+        # Adapters that can't be shared are built every time
+        with mock.patch.object(original, 'shareable', False):
+            self.assertIsNot(assetstore_utilities.getAssetstoreAdapter(assetstore),
+                             assetstore_utilities.getAssetstoreAdapter(assetstore))
+
     def testGetAssetstoreFiles(self):
         resp = self.request(path='/assetstore', method='GET', user=self.admin)
         self.assertStatusOk(resp)
@@ -17,6 +17,7 @@
 #  limitations under the License.
 ###############################################################################
 
+import cherrypy
 import io
 import json
 import mock
@@ -32,6 +33,7 @@ from girder import events
 from girder.constants import SettingKey
 from girder.models import getDbConnection
 from girder.models.model_base import AccessException
+from girder.utility import gridfs_assetstore_adapter
 from girder.utility.filesystem_assetstore_adapter import DEFAULT_PERMS
 from girder.utility.s3_assetstore_adapter import (makeBotoConnectParams,
                                                   S3AssetstoreAdapter)
@@ -298,6 +300,39 @@ class FileTestCase(base.TestCase):
             else:
                 self.assertStatusOk(resp)
 
+        # Test downloading several ranges, from the header and the ranges
+        # endpoint. Overlapping ranges are merged.
+        if len(contents) >= 10:
+            respHeader = self.request(
+                path='/file/%s/download' % file['_id'], user=self.user,
+                isJson=False, additionalHeaders=[('Range', 'bytes=0-1,5-7,4-5')])
+            respBatch = self.request(
+                path='/file/%s/ranges' % file['_id'], user=self.user,
+                isJson=False, params={'ranges': '[[4, 6], [5, 8], [0, 2]]'})
+            for resp in [respHeader, respBatch]:
+                self.assertStatus(resp, 206)
+                contentType, boundary = resp.headers['Content-Type'].split('; boundary=')
+                self.assertEqual(contentType, 'multipart/byteranges')
+                body = self.getBody(resp)
+                self.assertEqual(len(body), int(resp.headers['Content-Length']))
+                parts = body.split('--%s' % boundary)
+                self.assertEqual(parts[0], '\r\n')
+                self.assertEqual(parts[-1], '--\r\n')
+                self.assertEqual(parts[1:-1], [
+                    '\r\nContent-Type: text/plain\r\nContent-Range: '
+                    'bytes %d-%d/%d\r\n\r\n%s\r\n' % (
+                        start, end - 1, len(contents), contents[start:end])
+                    for start, end in ((0, 2), (4, 8))])
+
+            resp = self.request(
+                path='/file/%s/ranges' % file['_id'], user=self.user,
+                params={'ranges': '[[%d, %d]]' % (len(contents), len(contents) + 5)})
+            self.assertStatus(resp, 416)
+            resp = self.request(
+                path='/file/%s/ranges' % file['_id'], user=self.user,
+                params={'ranges': '[1, 2]'})
+            self.assertStatus(resp, 400)
+
         # Test downloading with a name
         resp = self.request(
             path='/file/%s/download/%s' % (
@@ -637,6 +672,31 @@ class FileTestCase(base.TestCase):
         self._testDownloadFolder()
         self._testDownloadCollection()
 
+        # Hand downloads off to a proxy
+        cherrypy.config['server']['sendfile_prefix'] = '/sendfile'
+        try:
+            path = '/file/%s/download' % file['_id']
+            for sendfileHeader in ('X-Sendfile', 'X-Accel-Redirect'):
+                cherrypy.config['server']['sendfile_header'] = sendfileHeader
+                for headers in ([], [('Range', 'bytes=2-7')]):
+                    resp = self.request(path=path, user=self.user, isJson=False,
+                                        additionalHeaders=headers)
+                    self.assertStatusOk(resp)
+                    self.assertEqual(resp.headers[sendfileHeader],
+                                     '/sendfile' + os.path.abspath(abspath))
+                    self.assertEqual(resp.headers['Accept-Ranges'], 'bytes')
+                    self.assertNotIn('Content-Range', resp.headers)
+                    self.assertEqual(self.getBody(resp), '')
+            # Ranges given as parameters are still served by Girder
+            resp = self.request(path=path, user=self.user, isJson=False,
+                                params={'offset': 2, 'endByte': 8})
+            self.assertStatus(resp, 206)
+            self.assertNotIn('X-Accel-Redirect', resp.headers)
+            self.assertEqual(self.getBody(resp), (chunk1 + chunk2)[2:8])
+        finally:
+            del cherrypy.config['server']['sendfile_header']
+            del cherrypy.config['server']['sendfile_prefix']
+
         # Change file permissions for the assetstore
         params = {
             'name': 'test assetstore',
@@ -749,6 +809,44 @@ class FileTestCase(base.TestCase):
         copyTestFile = self._testUploadFile('helloWorld1.txt')
         self._testCopyFile(copyTestFile)
 
+        # Chunks are written in batches, and chunks that were already written
+        # by an earlier attempt are tolerated.
+        with mock.patch.object(gridfs_assetstore_adapter, 'CHUNK_SIZE', 4), \
+                mock.patch.object(gridfs_assetstore_adapter, 'INSERT_BATCH_SIZE', 2):
+            upload = self.model('upload').createUpload(
+                self.user, 'batched.txt', 'folder', self.privateFolder,
+                len(chunk1) + len(chunk2), mimeType='text/plain')
+            self.assertEqual(upload['chunkCount'], 0)
+            chunkColl.insert_one({'uuid': upload['chunkUuid'], 'n': 1, 'data': b'o '})
+            upload = self.model('upload').handleChunk(upload, chunk1)
+            self.assertEqual(upload['chunkCount'], 2)
+            self.assertEqual(self.model('upload').requestOffset(upload), len(chunk1))
+            file = self.model('upload').handleChunk(upload, chunk2)
+        self.assertEqual(chunkColl.find({'uuid': file['chunkUuid']}).count(), 4)
+        self.assertEqual(file['sha512'], sha512(chunkData).hexdigest())
+        # Download chunks in several batches, with and without prefetching
+        with mock.patch.object(gridfs_assetstore_adapter, 'DOWNLOAD_BATCH_SIZE', 3):
+            for depth in (0, 2):
+                with mock.patch.object(gridfs_assetstore_adapter.GridFsAssetstoreAdapter,
+                                       'prefetchDepth', depth):
+                    self._testDownloadFile(file, chunk1 + chunk2)
+
+        # A range read only fetches the chunks that hold the range
+        fetched = []
+        chunkBatches = gridfs_assetstore_adapter.GridFsAssetstoreAdapter._chunkBatches
+
+        def countChunks(adapter, *args):
+            for batch in chunkBatches(adapter, *args):
+                fetched.append(len(batch))
+                yield batch
+
+        with mock.patch.object(gridfs_assetstore_adapter, 'DOWNLOAD_BATCH_SIZE', 3), \
+                mock.patch.object(gridfs_assetstore_adapter.GridFsAssetstoreAdapter,
+                                  '_chunkBatches', countChunks):
+            stream = self.model('file').download(file, offset=5, endByte=7, headers=False)
+            self.assertEqual(b''.join(stream()), chunkData[5:7])
+        self.assertEqual(fetched, [1])
+
     @moto.mock_s3bucket_path
     def atestS3Assetstore(self):
         botoParams = makeBotoConnectParams('access', 'secret')
@@ -942,6 +1040,40 @@ class FileTestCase(base.TestCase):
         extracted = zip.read('Private/My Link Item').decode('utf8')
         self.assertEqual(extracted, params['linkUrl'].strip())
 
+    def testFileHandle(self):
+        data = os.urandom(200000)
+        item = self.model('item').createItem(
+            'handle', creator=self.user, folder=self.privateFolder)
+        file = self.model('upload').uploadFromFile(
+            io.BytesIO(data), len(data), 'handle', 'item', item, self.user)
+
+        downloads = []
+        download = self.model('file').download
+
+        def countDownloads(file, offset=0, **kwargs):
+            downloads.append(offset)
+            return download(file, offset=offset, **kwargs)
+
+        with mock.patch.object(self.model('file'), 'download', countDownloads), \
+                self.model('file').open(file) as handle:
+            self.assertEqual(handle.read(16), data[:16])
+            self.assertEqual(handle.tell(), 16)
+
+            # Looking back a little, or ahead, continues the same download
+            handle.seek(4)
+            self.assertEqual(handle.read(100), data[4:104])
+            handle.seek(1000, os.SEEK_CUR)
+            self.assertEqual(handle.read(10), data[1104:1114])
+            self.assertEqual(downloads, [0])
+
+            # Seeking far away starts a new download
+            handle.seek(-10, os.SEEK_END)
+            self.assertEqual(handle.read(), data[-10:])
+            self.assertEqual(handle.read(), b'')
+            handle.seek(20)
+            self.assertEqual(handle.read(), data[20:])
+            self.assertEqual(downloads, [0, len(data) - 10, 20])
+
     def tearDown(self):
         if self.testForFinalizeUpload:
             self.assertTrue(self.finalizeUploadBeforeCalled)
@@ -18,7 +18,10 @@
 ###############################################################################
 
 import datetime
+import io
 import json
+import mock
+import os
 import six
 
 from .. import base
@@ -313,6 +316,45 @@ class FolderTestCase(base.TestCase):
                          'The key name $foobar must not contain a period' +
                          ' or begin with a dollar sign.')
 
+    def testFolderMetadataBulk(self):
+        """
+        Test setting metadata on many folders with one request.
+        """
+        adminFolders = list(self.model('folder').childFolders(
+            self.admin, 'user', user=self.admin))
+        userFolder = six.next(self.model('folder').childFolders(
+            self.user, 'user', user=self.user))
+
+        def setMetadataBulk(body, user=self.admin):
+            return self.request(path='/folder/metadata', method='PUT', user=user,
+                                body=json.dumps(body), type='application/json')
+
+        resp = setMetadataBulk([{
+            'id': str(folder['_id']), 'metadata': {'index': i}
+        } for i, folder in enumerate(adminFolders)])
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json, {'updated': len(adminFolders)})
+        for i, folder in enumerate(adminFolders):
+            folder = self.model('folder').load(folder['_id'], force=True)
+            self.assertEqual(folder['meta'], {'index': i})
+
+        # The regular user can't write to the admin's folders
+        resp = setMetadataBulk([
+            {'id': str(userFolder['_id']), 'metadata': {'index': None}},
+            {'id': str(adminFolders[0]['_id']), 'metadata': {'index': None}}
+        ], user=self.user)
+        self.assertStatus(resp, 403)
+        folder = self.model('folder').load(adminFolders[0]['_id'], force=True)
+        self.assertEqual(folder['meta'], {'index': 0})
+
+        resp = setMetadataBulk([
+            {'id': str(adminFolders[0]['_id']), 'metadata': {'index': None}}])
+        self.assertStatusOk(resp)
+        folder = self.model('folder').load(adminFolders[0]['_id'], force=True)
+        self.assertEqual(folder['meta'], {})
+        resp = setMetadataBulk({'id': str(adminFolders[0]['_id'])})
+        self.assertStatus(resp, 400)
+
     def testDeleteFolder(self):
         cbInfo = {}
 
@@ -412,6 +454,62 @@ class FolderTestCase(base.TestCase):
         self.assertEqual(item, None)
         self.assertEqual(subitem, None)
 
+    def testBulkDelete(self):
+        folders = self.model('folder').childFolders(
+            parent=self.admin, parentType='user', user=self.admin,
+            sort=[('name', SortDir.DESCENDING)])
+        folder, other = folders
+        sub = self.model('folder').createFolder(
+            folder, 'sub', parentType='folder', creator=self.admin)
+        subsub = self.model('folder').createFolder(
+            sub, 'subsub', parentType='folder', creator=self.admin)
+
+        def addFile(parent, name, data):
+            item = self.model('item').createItem(
+                name, creator=self.admin, folder=parent)
+            return self.model('upload').uploadFromFile(
+                io.BytesIO(data), len(data), name, 'item', item, self.admin)
+
+        # The shared data is also used by a file outside of the folder
+        sharedFiles = [addFile(parent, 'shared', b'shared data')
+                       for parent in (folder, subsub, other)]
+        unique = addFile(sub, 'unique', b'unique')
+        root = self.assetstore['root']
+        self.assertEqual(self.model('user').load(
+            self.admin['_id'], force=True)['size'], 39)
+
+        removed = {'item': [], 'file': []}
+
+        def itemsRemoved(event):
+            removed['item'].append([doc['_id'] for doc in event.info['documents']])
+
+        def fileRemoved(event):
+            removed['file'].append(event.info['_id'])
+
+        with mock.patch.object(type(self.model('folder')), 'removeBatchSize', 2), \
+                events.bound('model.item.remove_many', 'test', itemsRemoved), \
+                events.bound('model.file.remove', 'test', fileRemoved):
+            self.model('folder').clean(folder)
+
+        # Items are deleted in batches, and per document events still fire
+        self.assertEqual([len(batch) for batch in removed['item']], [2, 1])
+        self.assertEqual(set(removed['file']), set(
+            file['_id'] for file in sharedFiles[:2] + [unique]))
+
+        self.assertIsNotNone(self.model('folder').load(folder['_id'], force=True))
+        for doc in (sub, subsub):
+            self.assertIsNone(self.model('folder').load(doc['_id'], force=True))
+        for file in sharedFiles[:2] + [unique]:
+            self.assertIsNone(self.model('file').load(file['_id'], force=True))
+        self.assertTrue(os.path.isfile(os.path.join(root, sharedFiles[2]['path'])))
+        self.assertFalse(os.path.isfile(os.path.join(root, unique['path'])))
+
+        # Sizes are subtracted from the remaining folder and the root
+        self.assertEqual(self.model('folder').load(
+            folder['_id'], force=True)['size'], 0)
+        self.assertEqual(self.model('user').load(
+            self.admin['_id'], force=True)['size'], 11)
+
     def testLazyFieldComputation(self):
         """
         Demonstrate that a folder that is saved in the database without
@@ -443,6 +541,55 @@ class FolderTestCase(base.TestCase):
         self.assertEqual(folder['baseParentType'], 'user')
         self.assertEqual(folder['baseParentId'], self.admin['_id'])
 
+    def testAncestorIds(self):
+        folderModel = self.model('folder')
+        itemModel = self.model('item')
+        a = folderModel.createFolder(self.admin, 'a', parentType='user')
+        b = folderModel.createFolder(a, 'b')
+        c = folderModel.createFolder(b, 'c')
+        d = folderModel.createFolder(self.admin, 'd', parentType='user')
+        item = itemModel.createItem('item', self.admin, c)
+        self.assertEqual(a['ancestorIds'], [])
+        self.assertEqual(c['ancestorIds'], [a['_id'], b['_id']])
+        self.assertEqual(item['ancestorIds'], [a['_id'], b['_id'], c['_id']])
+        self.assertEqual(folderModel.subtreeCount(a), 4)
+        self.assertEqual(folderModel.subtreeCount(a, includeItems=False), 3)
+
+        # Moving a folder updates the ancestors of its whole subtree
+        b = folderModel.move(b, d, 'folder')
+        self.assertEqual(b['ancestorIds'], [d['_id']])
+        c = folderModel.load(c['_id'], force=True)
+        self.assertEqual(c['ancestorIds'], [d['_id'], b['_id']])
+        item = itemModel.load(item['_id'], force=True)
+        self.assertEqual(item['ancestorIds'], [d['_id'], b['_id'], c['_id']])
+        self.assertEqual(folderModel.subtreeCount(a), 1)
+        self.assertEqual(folderModel.subtreeCount(d), 4)
+        self.assertTrue(folderModel._isAncestor(d, c))
+        self.assertFalse(folderModel._isAncestor(a, c))
+
+        item = itemModel.move(item, a)
+        self.assertEqual(item['ancestorIds'], [a['_id']])
+
+        # Only subfolders reachable through accessible folders are counted
+        folderModel.setUserAccess(d, self.user, AccessType.READ, save=True)
+        folderModel.setUserAccess(c, self.user, AccessType.READ, save=True)
+        self.assertEqual(folderModel.subtreeCount(
+            d, user=self.user, level=AccessType.READ), 1)
+        folderModel.setUserAccess(b, self.user, AccessType.READ, save=True)
+        self.assertEqual(folderModel.subtreeCount(
+            d, user=self.user, level=AccessType.READ), 3)
+
+        # Legacy documents without ancestors get backfilled
+        folderModel.update({'_id': {'$in': [f['_id'] for f in (a, b, c, d)]}},
+                           {'$unset': {'ancestorIds': 1}})
+        itemModel.update({'_id': item['_id']}, {'$unset': {'ancestorIds': 1}})
+        self.assertEqual(folderModel.backfillAncestorIds(), 5)
+        c = folderModel.load(c['_id'], force=True)
+        self.assertEqual(c['ancestorIds'], [d['_id'], b['_id']])
+        item = itemModel.load(item['_id'], force=True)
+        self.assertEqual(item['ancestorIds'], [a['_id']])
+        self.assertEqual(folderModel.backfillAncestorIds(), 0)
+
     def testParentsToRoot(self):
         """
         Demonstrate that forcing parentsToRoot will cause it to skip the
@@ -638,3 +785,67 @@ class FolderTestCase(base.TestCase):
                 'parentType': 'folder',
                 'parentId': str(subFolder['_id'])})
         self.assertStatusOk(resp)
+
+    def testBulkCopy(self):
+        folderModel = self.model('folder')
+        itemModel = self.model('item')
+        folder = folderModel.createFolder(
+            self.admin, 'Source', parentType='user', creator=self.admin)
+        sub = folderModel.createFolder(folder, 'sub', creator=self.admin)
+        subsub = folderModel.createFolder(sub, 'subsub', creator=self.admin)
+        folderModel.setMetadata(subsub, {'level': 2})
+
+        files = []
+        for parent, name in ((folder, 'a'), (folder, 'b'), (sub, 'c'), (subsub, 'd')):
+            item = itemModel.createItem(name, creator=self.admin, folder=parent)
+            itemModel.setMetadata(item, {'name': name})
+            files.append(self.model('upload').uploadFromFile(
+                io.BytesIO(b'data ' + name.encode('utf8')), 6, name, 'item', item,
+                self.admin))
+        self.assertEqual(folderModel.load(folder['_id'], force=True)['size'], 24)
+
+        created = {'folder': [], 'item': [], 'file': []}
+
+        def saveMany(event):
+            created[event.name.split('.')[1]].append(len(event.info))
+
+        with mock.patch.object(type(folderModel), 'copyBatchSize', 2), \
+                events.bound('model.folder.save_many.created', 'test', saveMany), \
+                events.bound('model.item.save_many.created', 'test', saveMany), \
+                events.bound('model.file.save_many.created', 'test', saveMany):
+            newFolder = folderModel.copyFolder(folder, creator=self.admin)
+
+        # Each level of folders and each batch of items is created at once
+        self.assertEqual(created['folder'], [1, 1])
+        self.assertEqual(created['item'], [2, 1, 1])
+        self.assertEqual(created['file'], [2, 1, 1])
+        self.assertEqual(newFolder['name'], 'Source (1)')
+        self.assertEqual(newFolder['size'], 24)
+        newSub = folderModel.findOne({'parentId': newFolder['_id']})
+        self.assertEqual(newSub['size'], 6)
+        newSubsub = folderModel.findOne({'parentId': newSub['_id']})
+        self.assertEqual(newSubsub['meta'], {'level': 2})
+        self.assertEqual(newSubsub['ancestorIds'], [newFolder['_id'], newSub['_id']])
+        self.assertEqual(newSubsub['lowerName'], 'subsub')
+
+        newItems = list(itemModel.find({'ancestorIds': newFolder['_id']}))
+        self.assertEqual(sorted(item['name'] for item in newItems), ['a', 'b', 'c', 'd'])
+        for item in newItems:
+            self.assertEqual(item['meta'], {'name': item['name']})
+            self.assertEqual(item['size'], 6)
+            srcItem = itemModel.load(item['copyOfItem'], force=True)
+            self.assertEqual(srcItem['name'], item['name'])
+            # The copied files share their stored data with the originals
+            newFile = self.model('file').findOne({'itemId': item['_id']})
+            srcFile = self.model('file').findOne({'itemId': srcItem['_id']})
+            self.assertNotEqual(newFile['_id'], srcFile['_id'])
+            self.assertEqual(newFile['path'], srcFile['path'])
+            self.assertEqual(newFile['copierId'], self.admin['_id'])
+        self.assertEqual(self.model('user').load(
+            self.admin['_id'], force=True)['size'], 48)
+
+        # Adapters that copy the stored data are called for every file
+        adapter = type(self.model('file').getAssetstoreAdapter(files[0]))
+        with mock.patch.object(adapter, 'copyFile') as copyFile:
+            folderModel.copyFolder(sub, creator=self.admin)
+        self.assertEqual(copyFile.call_count, 2)
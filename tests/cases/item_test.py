@@ -26,6 +26,7 @@ import zipfile
 
 from .. import base
 
+from girder import events
 from girder.constants import AccessType
 
 
@@ -434,6 +435,71 @@ class ItemTestCase(base.TestCase):
         self.assertEqual(resp.json['message'],
                          'Key names must be at least one character long.')
 
+    def testItemMetadataBulk(self):
+        """
+        Test setting metadata on many items with one request.
+        """
+        items = [self.model('item').createItem(
+            'item %d' % i, self.users[0], self.privateFolder) for i in range(2)]
+        otherFolder = six.next(self.model('folder').childFolders(
+            self.users[1], 'user', user=self.users[1]))
+        otherItem = self.model('item').createItem(
+            'other item', self.users[1], otherFolder)
+        self.model('item').setMetadata(items[0], {'old': 'value'})
+
+        def setMetadataBulk(body, user=self.users[0]):
+            return self.request(path='/item/metadata', method='PUT', user=user,
+                                body=json.dumps(body), type='application/json')
+
+        bulkEvents = []
+        with events.bound('model.item.setMetadataBulk.after', 'test',
+                          bulkEvents.append):
+            resp = setMetadataBulk([
+                {'id': str(items[0]['_id']), 'metadata': {'a': 1, 'old': None}},
+                {'id': str(items[1]['_id']), 'metadata': {'a': 2, 'b': [3]}}
+            ])
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json, {'updated': 2})
+        self.assertEqual(len(bulkEvents), 1)
+        self.assertEqual(len(bulkEvents[0].info['updates']), 2)
+        items = [self.model('item').load(item['_id'], force=True) for item in items]
+        self.assertEqual(items[0]['meta'], {'a': 1})
+        self.assertEqual(items[1]['meta'], {'a': 2, 'b': [3]})
+
+        # Set the same metadata on every item in a folder
+        resp = setMetadataBulk({
+            'folderId': str(self.privateFolder['_id']),
+            'metadata': {'b': None, 'c': 'folder'}
+        })
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json, {'updated': 2})
+        items = [self.model('item').load(item['_id'], force=True) for item in items]
+        self.assertEqual(items[0]['meta'], {'a': 1, 'c': 'folder'})
+        self.assertEqual(items[1]['meta'], {'a': 2, 'c': 'folder'})
+        resp = setMetadataBulk({
+            'folderId': str(otherFolder['_id']), 'metadata': {'c': 'other'}})
+        self.assertStatus(resp, 403)
+
+        # Nothing is written unless every item can be updated
+        resp = setMetadataBulk([
+            {'id': str(items[0]['_id']), 'metadata': {'a': 'changed'}},
+            {'id': str(otherItem['_id']), 'metadata': {'a': 'changed'}}
+        ])
+        self.assertStatus(resp, 403)
+        resp = setMetadataBulk([
+            {'id': str(items[0]['_id']), 'metadata': {'a': 'changed'}},
+            {'id': str(items[1]['_id']), 'metadata': {'a.b': 'changed'}}
+        ])
+        self.assertStatus(resp, 400)
+        self.assertEqual(resp.json['message'], 'The key name a.b must not '
+                         'contain a period or begin with a dollar sign.')
+        resp = setMetadataBulk([{'id': 'notanid', 'metadata': {}}])
+        self.assertStatus(resp, 400)
+        resp = setMetadataBulk([{'id': str(items[0]['_id'])}])
+        self.assertStatus(resp, 400)
+        item = self.model('item').load(items[0]['_id'], force=True)
+        self.assertEqual(item['meta'], {'a': 1, 'c': 'folder'})
+
     def testItemFiltering(self):
         """
         Test filtering private metadata from items.
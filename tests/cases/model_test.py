@@ -189,3 +189,35 @@ class ModelTestCase(base.TestCase):
         self.assertEqual(len(doc1['access']['users']), 1)
         self.assertEqual(len(doc1['access']['groups']), 0)
         self.assertIsNone(doc1.get('creatorId'))
+
+    def testFindWithPermissions(self):
+        admin, user1, user2 = [self.model('user').createUser(
+            email='user%d@place.com' % i, login='user%d' % i, firstName='User',
+            lastName='%d' % i, password='password%d' % i) for i in range(3)]
+        group = self.model('group').createGroup(name='agroup', creator=user2)
+        self.model('group').addUser(group, user1, level=AccessType.READ)
+        user1 = self.model('user').load(user1['_id'], force=True)
+
+        docs = []
+        for public in (True, False):
+            for level in (None, AccessType.READ, AccessType.WRITE,
+                          AccessType.ADMIN):
+                doc = self.model('fake_ac').setPublic({}, public)
+                doc = self.model('fake_ac').setUserAccess(doc, user2, level)
+                doc = self.model('fake_ac').setGroupAccess(doc, group, level)
+                docs.append(self.model('fake_ac').save(doc))
+
+        # The database query must agree with hasAccess for every combination
+        for user in (None, admin, user1, user2):
+            for level in (AccessType.READ, AccessType.WRITE, AccessType.ADMIN):
+                expected = {doc['_id'] for doc in docs
+                            if self.model('fake_ac').hasAccess(doc, user, level)}
+                found = {doc['_id'] for doc in self.model(
+                    'fake_ac').findWithPermissions(user=user, level=level)}
+                self.assertEqual(found, expected)
+
+        # Offset and limit apply to the filtered results
+        found = list(self.model('fake_ac').findWithPermissions(
+            user=user1, level=AccessType.WRITE, sort=[('_id', 1)], offset=1,
+            limit=1))
+        self.assertEqual([doc['_id'] for doc in found], [docs[3]['_id']])
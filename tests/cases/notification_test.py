@@ -17,12 +17,14 @@
 #  limitations under the License.
 ###############################################################################
 
+import mock
 import time
 
 from .. import base
 
 from girder.models.model_base import ValidationException
 from girder.models.notification import ProgressState
+from girder.utility import notification_bus
 from girder.utility.progress import ProgressContext
 
 
@@ -134,3 +136,92 @@ class NotificationTestCase(base.TestCase):
         token = resp.json['token']
         tokenDoc = self.model('token').load(token, force=True, objectId=False)
         self._testStream(None, tokenDoc)
+
+    def testProgressCoalescing(self):
+        model = self.model('notification')
+        before = model.progressStats()
+        with ProgressContext(True, user=self.admin, title='Test', total=100,
+                             interval=1000) as progress:
+            for _ in range(100):
+                progress.update(increment=1, message='Working')
+            self.assertEqual(progress.progress['data']['current'], 100)
+            # Nothing has been written since the record was created
+            record = model.load(progress.progress['_id'])
+            self.assertEqual(record['data']['current'], 0)
+            self.assertEqual(record['data']['message'], '')
+
+            # Increments are applied on top of the stored value
+            model.update({'_id': record['_id']}, {'$inc': {'data.current': 5}})
+            progress.update(force=True, increment=1)
+            record = model.load(progress.progress['_id'])
+            self.assertEqual(record['data']['current'], 106)
+            self.assertEqual(record['data']['message'], 'Working')
+
+        record = model.load(progress.progress['_id'])
+        self.assertEqual(record['data']['state'], ProgressState.SUCCESS)
+        self.assertEqual(record['data']['message'], 'Done')
+        after = model.progressStats()
+        self.assertEqual(after['updates'] - before['updates'], 102)
+        self.assertEqual(after['writes'] - before['writes'], 2)
+        self.assertEqual(after['saved'] - before['saved'], 100)
+
+        # Updating a record directly only writes the progress fields
+        model.update({'_id': record['_id']}, {'$set': {'extra': True}})
+        record = model.updateProgress(progress.progress, current=3)
+        record = model.load(record['_id'])
+        self.assertEqual(record['data']['current'], 3)
+        self.assertTrue(record['extra'])
+
+    def testNotificationBus(self):
+        bus = notification_bus.getNotificationBus()
+        self.assertIsInstance(bus, notification_bus.LocalNotificationBus)
+        self.assertEqual(bus.subscriberCount(), 0)
+
+        subscription = bus.subscribe(self.admin['_id'])
+        other = bus.subscribe('other')
+        self.assertFalse(subscription.wait(0))
+
+        # Saving a notification should wake only that user's subscribers
+        self.model('notification').createNotification(
+            'test', {}, self.admin)
+        self.assertTrue(subscription.wait(0))
+        self.assertFalse(subscription.wait(0))
+        self.assertFalse(other.wait(0))
+
+        # A notification that arrives as a wait times out isn't lost
+        wait = subscription._event.wait
+
+        def notifyLate(timeout):
+            published = wait(timeout)
+            subscription.notify()
+            return published
+
+        with mock.patch.object(subscription._event, 'wait', notifyLate):
+            self.assertFalse(subscription.wait(0))
+        self.assertTrue(subscription.wait(0))
+
+        subscription.close()
+        other.close()
+        self.assertEqual(bus.subscriberCount(), 0)
+
+        # Streams should unsubscribe when they end
+        resp = self.request(path='/notification/stream', method='GET',
+                            user=self.admin, isJson=False,
+                            params={'timeout': 0})
+        self.assertEqual(len(self.getSseMessages(resp)), 1)
+        self.assertEqual(bus.subscriberCount(), 0)
+
+    def testMongoNotificationBus(self):
+        publisher = notification_bus.MongoNotificationBus()
+        bus = notification_bus.MongoNotificationBus()
+        subscription = bus.subscribe('key')
+        # Subscribers are woken once the bus starts tailing
+        self.assertTrue(subscription.wait(10))
+
+        publisher.publish('key')
+        self.assertTrue(subscription.wait(10))
+        # Our own publications aren't delivered twice
+        bus.publish('key')
+        self.assertTrue(subscription.wait(0))
+        self.assertFalse(subscription.wait(0.5))
+        subscription.close()
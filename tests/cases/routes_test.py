@@ -18,6 +18,7 @@
 ###############################################################################
 
 from .. import base
+from girder import events
 from girder.api import access
 from girder.api.describe import Description, describeRoute
 from girder.api.rest import Resource, RestException
@@ -94,6 +95,38 @@ class RoutesTestCase(base.TestCase):
         dummy.removeRoute('DUMMY', (':id', 'dummy'), dummy.handler)
         self.assertRaises(RestException, dummy.handleRoute, 'DUMMY',
                           ('guid', 'dummy'), {})
+        # Removing a route that doesn't exist is a no-op
+        dummy.removeRoute('DUMMY', ('nothing', ':here'), dummy.handler)
+
+        # A literal that matches a prefix of the path doesn't prevent matching
+        # a wildcard route
+        r = dummy.handleRoute('GET', ('literal1', 'admin'), {})
+        self.assertEqual(r, {'wc1': 'literal1', 'params': {}})
+
+    def testRouteEvents(self):
+        dummy = DummyResource()
+        calls = []
+
+        def before(event):
+            calls.append(event.name)
+
+        def after(event):
+            calls.append(event.name)
+            event.addResponse(event.info['returnVal']['wc2'])
+            event.preventDefault()
+
+        with events.bound('rest.get.routes_test/:wc1/:wc2.before', 'test', before), \
+                events.bound('rest.get.routes_test/:wc1/:wc2.after', 'test', after):
+            r = dummy.handleRoute('GET', ('a', 'b'), {})
+        self.assertEqual(r, 'b')
+        self.assertEqual(calls, [
+            'rest.get.routes_test/:wc1/:wc2.before',
+            'rest.get.routes_test/:wc1/:wc2.after'])
+
+        # Once the handlers are unbound, the handler's value is returned
+        r = dummy.handleRoute('GET', ('a', 'b'), {})
+        self.assertEqual(r, {'wc1': 'a', 'wc2': 'b', 'params': {}})
+        self.assertEqual(len(calls), 2)
 
     def testCORS(self):
         testServer.root.api.v1.dummy = DummyResource()
@@ -17,6 +17,8 @@
 #  limitations under the License.
 ###############################################################################
 
+import mock
+
 from .. import base
 
 from girder.api.v1 import resource
@@ -251,3 +253,52 @@ class SearchTestCase(base.TestCase):
             'types': '["assetstore"]'
         }, user=user)
         self.assertEqual(1, len(resp.json['assetstore']))
+
+    def testBatchedParentAccess(self):
+        admin = self.model('user').createUser(
+            'admin', 'password', 'Admin', 'Admin', 'admin@email.com')
+        user = self.model('user').createUser(
+            'user', 'password', 'User', 'User', 'user@email.com')
+        coll = self.model('collection').createCollection(
+            'coll', creator=admin, public=False)
+
+        items, files = [], []
+        for i in range(10):
+            folder = self.model('folder').createFolder(
+                coll, 'folder%d' % i, parentType='collection', creator=admin)
+            if i % 2:
+                self.model('folder').setUserAccess(
+                    folder, user, level=AccessType.READ, save=True)
+            for j in range(3):
+                item = self.model('item').createItem(
+                    'item %d %d' % (i, j), creator=admin, folder=folder)
+                items.append(item)
+                files.append(self.model('file').createLinkFile(
+                    'file %d %d' % (i, j), item, 'item',
+                    'http://example.com', admin))
+
+        itemModel = self.model('item')
+        fileModel = self.model('file')
+        itemModel.accessBatchSize = fileModel.accessBatchSize = 4
+        try:
+            with mock.patch.object(
+                    self.model('folder'), 'load',
+                    wraps=self.model('folder').load) as folderLoad:
+                for model, docs in ((itemModel, items), (fileModel, files)):
+                    expected = [doc['_id'] for doc in docs
+                                if model.hasAccess(doc, user=user)]
+                    folderLoad.reset_mock()
+                    results = model.filterResultsByPermission(
+                        model.find({}, sort=[('_id', 1)]), user=user,
+                        level=AccessType.READ)
+                    self.assertEqual([d['_id'] for d in results], expected)
+                    # Parent access must be resolved in bulk
+                    self.assertEqual(folderLoad.call_count, 0)
+
+                    results = model.filterResultsByPermission(
+                        model.find({}, sort=[('_id', 1)]), user=user,
+                        level=AccessType.READ, offset=5, limit=6)
+                    self.assertEqual(
+                        [d['_id'] for d in results], expected[5:11])
+        finally:
+            itemModel.accessBatchSize = fileModel.accessBatchSize = 1000
@@ -17,8 +17,10 @@
 #  limitations under the License.
 #############################################################################
 
+import mock
 import six
 from .. import base
+from girder.constants import SettingKey
 from girder.models.model_base import ValidationException
 from girder.utility import setting_utilities
 
@@ -108,3 +110,48 @@ class SettingTestCase(base.TestCase):
             return 'default value'
 
         self.assertEqual(self.model('setting').get('test.key'), 'default value')
+
+    def testCache(self):
+        settingModel = self.model('setting')
+        settingModel.set(SettingKey.SMTP_HOST, 'mail.example.com')
+        stats = settingModel.cacheStats()
+        self.assertEqual(settingModel.get(SettingKey.SMTP_HOST), 'mail.example.com')
+        self.assertEqual(settingModel.get(SettingKey.SMTP_HOST), 'mail.example.com')
+        newStats = settingModel.cacheStats()
+        self.assertEqual(newStats['misses'], stats['misses'] + 1)
+        self.assertEqual(newStats['hits'], stats['hits'] + 1)
+
+        # Setting and unsetting values invalidates the cache
+        settingModel.set(SettingKey.SMTP_HOST, 'smtp.example.com')
+        self.assertEqual(settingModel.get(SettingKey.SMTP_HOST), 'smtp.example.com')
+        settingModel.unset(SettingKey.SMTP_HOST)
+        self.assertEqual(settingModel.get(SettingKey.SMTP_HOST), 'localhost')
+
+        # Mutable values are copied so the cache can't be modified by callers
+        routes = settingModel.get(SettingKey.ROUTE_TABLE)
+        routes['extra'] = '/extra'
+        self.assertNotIn('extra', settingModel.get(SettingKey.ROUTE_TABLE))
+
+        # Changes made by another process are noticed via the version counter
+        settingModel.collection.insert_one({
+            'key': SettingKey.SMTP_HOST, 'value': 'other.example.com'})
+        self.assertEqual(settingModel.get(SettingKey.SMTP_HOST), 'localhost')
+        settingModel._versionCollection.update_one(
+            {'_id': 'setting'}, {'$inc': {'version': 1}}, upsert=True)
+        settingModel._cacheLastPoll = 0
+        self.assertEqual(settingModel.get(SettingKey.SMTP_HOST), 'other.example.com')
+
+        # A value that is changed while it is being read is not cached
+        findOne = settingModel.findOne
+
+        def findAndChange(*args, **kwargs):
+            setting = findOne(*args, **kwargs)
+            settingModel.collection.update_one(
+                {'key': SettingKey.SMTP_HOST}, {'$set': {'value': 'new.example.com'}})
+            settingModel.invalidateCache()
+            return setting
+
+        settingModel.invalidateCache()
+        with mock.patch.object(settingModel, 'findOne', findAndChange):
+            self.assertEqual(settingModel.get(SettingKey.SMTP_HOST), 'other.example.com')
+        self.assertEqual(settingModel.get(SettingKey.SMTP_HOST), 'new.example.com')
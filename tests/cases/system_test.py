@@ -17,11 +17,15 @@
 #  limitations under the License.
 ###############################################################################
 
+import datetime
 import json
+import mock
 import os
 import time
 import six
 
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
 from subprocess import check_output, CalledProcessError
 
 from .. import base
@@ -301,6 +305,8 @@ class SystemTestCase(base.TestCase):
         self.assertLess(check['bootTime'], time.time())
         self.assertGreaterEqual(check['cherrypyThreadsInUse'], 1)
         self.assertIn('rss', check['processMemory'])
+        self.assertGreater(check['settingCache']['hits'], 0)
+        self.assertIn('saved', check['progressWrites'])
         resp = self.request(path='/system/check', user=self.users[0], params={
             'mode': 'slow'})
         self.assertStatusOk(resp)
@@ -349,9 +355,16 @@ class SystemTestCase(base.TestCase):
         resp = self.request(path='/system/check', user=user, method='PUT')
         self.assertStatusOk(resp)
         self.assertEqual(resp.json['baseParentsFixed'], 0)
+        self.assertEqual(resp.json['ancestorsFixed'], 0)
         self.assertEqual(resp.json['orphansRemoved'], 0)
         self.assertEqual(resp.json['sizesChanged'], 0)
 
+        self.model('item').update(
+            {'_id': i1['_id']}, update={'$set': {'ancestorIds': []}})
+        resp = self.request(path='/system/check', user=user, method='PUT')
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json['ancestorsFixed'], 1)
+
         self.model('item').update(
             {'_id': i1['_id']}, update={'$set': {'baseParentId': None}})
 
@@ -396,6 +409,102 @@ class SystemTestCase(base.TestCase):
         self.assertEqual(
             0, self.model('user').load(user['_id'], force=True)['size'])
 
+    def testSizeLedger(self):
+        user = self.users[0]
+        ledger = self.model('size_ledger')
+        c1 = self.model('collection').createCollection('c1', user)
+        f1 = self.model('folder').createFolder(
+            c1, 'f1', parentType='collection')
+        i1 = self.model('item').createItem('i1', user, f1)
+        assetstore = {'_id': 0}
+
+        def sizes():
+            return [self.model(model).load(doc['_id'], force=True)['size']
+                    for model, doc in (('item', i1), ('folder', f1), ('collection', c1))]
+
+        config.getConfig()['database']['size_ledger_interval'] = 3600
+        try:
+            self.model('file').createFile(user, i1, 'foo', 7, assetstore)
+            self.model('file').createFile(user, i1, 'foo', 13, assetstore)
+            # Size changes are deferred, but can be read exactly
+            self.assertEqual(sizes(), [0, 0, 0])
+            c1 = self.model('collection').load(c1['_id'], force=True)
+            self.assertEqual(ledger.getSize('collection', c1), 0)
+            self.assertEqual(ledger.getSize('collection', c1, exact=True), 20)
+
+            self.assertEqual(ledger.fold(), 3)
+            self.assertEqual(sizes(), [20, 20, 20])
+            self.assertEqual(ledger.find().count(), 0)
+            self.assertEqual(ledger.fold(), 0)
+
+            # Claims left by a fold that never finished are taken over
+            self.model('file').createFile(user, i1, 'foo', 3, assetstore)
+            ledger.collection.update_many({}, {'$set': {
+                'claim': ObjectId(),
+                'claimed': datetime.datetime.utcnow() - datetime.timedelta(
+                    seconds=ledger.claimTimeout + 1)
+            }})
+            self.assertEqual(ledger.fold(), 3)
+            self.assertEqual(sizes(), [23, 23, 23])
+
+            # Moves account for size changes that are still pending
+            c2 = self.model('collection').createCollection('c2', user)
+            f2 = self.model('folder').createFolder(
+                c2, 'f2', parentType='collection')
+            self.model('file').createFile(user, i1, 'foo', 5, assetstore)
+            i1 = self.model('item').move(
+                self.model('item').load(i1['_id'], force=True), f2)
+            ledger.fold()
+            self.assertEqual(sizes(), [28, 0, 0])
+            self.assertEqual(
+                self.model('collection').load(c2['_id'], force=True)['size'], 28)
+
+            self.model('file').createFile(user, i1, 'foo', 5, assetstore)
+            self.model('folder').move(
+                self.model('folder').load(f2['_id'], force=True), c1,
+                'collection')
+            ledger.fold()
+            self.assertEqual(sizes(), [33, 0, 33])
+            self.assertEqual(
+                self.model('collection').load(c2['_id'], force=True)['size'], 0)
+
+            # Reconciliation fixes sizes and discards pending changes
+            self.model('file').createFile(user, i1, 'foo', 19, assetstore)
+            self.model('folder').update(
+                {'_id': f2['_id']}, update={'$set': {'size': 0}})
+            self.assertEqual(ledger.reconcile(), 3)
+            self.assertEqual(ledger.find().count(), 0)
+            self.assertEqual(sizes(), [52, 0, 52])
+            self.assertEqual(
+                self.model('folder').load(f2['_id'], force=True)['size'], 52)
+
+            # A failed bulk write may have been partly applied, so its changes
+            # are dropped rather than applied again
+            self.model('file').createFile(user, i1, 'foo', 1, assetstore)
+            applyDeltas = ledger._applyDeltas
+            calls = []
+
+            def failSecond(deltas):
+                calls.append(deltas)
+                if len(calls) == 2:
+                    raise BulkWriteError({})
+                return applyDeltas(deltas)
+
+            with mock.patch.object(ledger, '_applyDeltas', failSecond):
+                self.assertEqual(ledger.fold(), 1)
+            self.assertEqual(ledger.find({'claim': None}).count(), 1)
+            self.assertEqual(ledger.fold(), 1)
+            self.assertEqual(ledger.find().count(), 0)
+            self.assertEqual(sizes(), [53, 0, 53])
+            self.assertEqual(
+                self.model('folder').load(f2['_id'], force=True)['size'], 52)
+        finally:
+            config.getConfig()['database']['size_ledger_interval'] = 0
+            if ledger._monitor:
+                ledger._monitor.unsubscribe()
+                ledger._monitor.stop()
+                ledger._monitor = None
+
     def testLogRoute(self):
         logRoot = os.path.join(ROOT_DIR, 'tests', 'cases', 'dummylogs')
         config.getConfig()['logging'] = {'log_root': logRoot}
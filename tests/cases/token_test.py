@@ -17,9 +17,11 @@
 #  limitations under the License.
 ###############################################################################
 
+import mock
 import random
 
 from .. import base
+from girder.api import rest
 from girder.models.token import genToken
 
 
@@ -75,3 +77,52 @@ class TokensTestCase(base.TestCase):
         # Now the token is gone, so it should fail
         resp = self.request(path='/token/session', method='DELETE', token=token)
         self.assertStatus(resp, 401)
+
+    def testAuthCache(self):
+        user = self.model('user').createUser(
+            'tokenuser', 'password', 'Token', 'User', 'token@email.com')
+        token = self.model('token').createToken(user)
+        tokenModel = self.model('token')
+        userModel = self.model('user')
+
+        # Once the token is cached, neither it nor its user is reloaded
+        resp = self.request(path='/user/me', token=token['_id'])
+        self.assertStatusOk(resp)
+        with mock.patch.object(tokenModel, 'load') as tokenLoad, \
+                mock.patch.object(userModel, 'load') as userLoad:
+            resp = self.request(path='/user/me', token=token['_id'])
+            self.assertStatusOk(resp)
+            self.assertEqual(resp.json['login'], 'tokenuser')
+            self.assertFalse(tokenLoad.called)
+            self.assertFalse(userLoad.called)
+
+        # Saving the user evicts it from the cache
+        user['firstName'] = 'Changed'
+        userModel.save(user)
+        resp = self.request(path='/user/me', token=token['_id'])
+        self.assertEqual(resp.json['firstName'], 'Changed')
+
+        # Modifying the returned documents does not modify the cache
+        cachedUser = rest.authCache.getUser(token)
+        cachedUser['admin'] = True
+        self.assertFalse(rest.authCache.getUser(token)['admin'])
+
+        # A token that is removed while it is being loaded is not cached
+        rest.authCache.clear()
+        load = tokenModel.load
+
+        def loadAndRemove(*args, **kwargs):
+            loaded = load(*args, **kwargs)
+            rest.authCache.invalidateToken(loaded['_id'])
+            return loaded
+
+        with mock.patch.object(tokenModel, 'load', loadAndRemove):
+            rest.authCache.getToken(token['_id'])
+        with mock.patch.object(tokenModel, 'load', return_value=None):
+            self.assertIsNone(rest.authCache.getToken(token['_id']))
+
+        # Removing the token evicts it from the cache
+        tokenModel.remove(token)
+        resp = self.request(path='/user/me', token=token['_id'])
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json, None)
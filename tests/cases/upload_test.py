@@ -17,6 +17,7 @@
 #  limitations under the License.
 ###############################################################################
 
+import hashlib
 import json
 import os
 import re
@@ -24,6 +25,9 @@ import requests
 
 from .. import base
 from .. import mongo_replicaset
+from girder.constants import SettingKey
+from girder.utility import filesystem_assetstore_adapter
+from girder.utility.gridfs_assetstore_adapter import CHUNK_SIZE as GRIDFS_CHUNK_SIZE
 from girder.utility.s3_assetstore_adapter import botoConnectS3
 
 
@@ -251,6 +255,27 @@ class UploadTestCase(base.TestCase):
     def testFilesystemAssetstoreUpload(self):
         self._testUpload()
 
+    def testFilesystemUploadHasher(self):
+        """
+        The hasher of an upload is kept in memory between chunks, and the
+        data is hashed again from disk if it was lost, as after a restart.
+        """
+        sha512 = hashlib.sha512((Chunk1 + Chunk2).encode('utf8')).hexdigest()
+        for restart in (False, True):
+            name = 'hasher_%s' % restart
+            upload = self._uploadFile(name, partial=1)
+            self.assertNotIn('sha512state', upload)
+            self.assertIn(upload['tempFile'], filesystem_assetstore_adapter._hashers)
+            if restart:
+                filesystem_assetstore_adapter._hashers.clear()
+            fields = [('offset', len(Chunk1)), ('uploadId', upload['_id'])]
+            files = [('chunk', name, Chunk2)]
+            resp = self.multipartRequest(
+                path='/file/chunk', user=self.user, fields=fields, files=files)
+            self.assertStatusOk(resp)
+            self.assertEqual(resp.json['sha512'], sha512)
+            self.assertNotIn(upload['tempFile'], filesystem_assetstore_adapter._hashers)
+
     def testGridFSAssetstoreUpload(self):
         # Clear any old DB data
         base.dropGridFSDatabase('girder_test_upload_assetstore')
@@ -331,3 +356,223 @@ class UploadTestCase(base.TestCase):
                             user=self.admin)
         self.assertStatusOk(resp)
         self.assertEqual(resp.json, [])
+
+    def _testUploadDeduplication(self):
+        """
+        Upload a file, then create copies of it by passing its hash instead of
+        uploading the data again, subject to the deduplication policy.
+        """
+        self._uploadFile('original')
+        original = self.model('file').findOne({'name': 'original'})
+        sha512 = hashlib.sha512((Chunk1 + Chunk2).encode('utf8')).hexdigest()
+        self.assertEqual(original['sha512'], sha512)
+
+        def initUpload(user, size=len(Chunk1 + Chunk2), hash=sha512):
+            resp = self.request(
+                path='/file', method='POST', user=user, params={
+                    'parentType': 'folder',
+                    'parentId': self.folder['_id'],
+                    'name': 'copy',
+                    'size': size,
+                    'sha512': hash
+                })
+            return resp
+
+        # By default, the data is always uploaded
+        resp = initUpload(self.user)
+        self.assertStatusOk(resp)
+        self.assertNotIn('_modelType', resp.json)
+        self.assertEqual(resp.json['received'], 0)
+
+        self.model('setting').set(SettingKey.UPLOAD_DEDUPLICATION_POLICY, 'admin')
+        resp = initUpload(self.user)
+        self.assertStatusOk(resp)
+        self.assertNotIn('_modelType', resp.json)
+        resp = initUpload(self.admin)
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json['_modelType'], 'file')
+
+        self.model('setting').set(SettingKey.UPLOAD_DEDUPLICATION_POLICY, 'all')
+        resp = initUpload(self.user)
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json['_modelType'], 'file')
+        self.assertEqual(resp.json['size'], len(Chunk1 + Chunk2))
+        file = self.model('file').load(resp.json['_id'], force=True)
+        for key in ('sha512', 'path', 'chunkUuid'):
+            self.assertEqual(file.get(key), original.get(key))
+        resp = self.request(path='/file/%s/download' % file['_id'],
+                            user=self.user, isJson=False)
+        self.assertStatusOk(resp)
+        self.assertEqual(self.getBody(resp), Chunk1 + Chunk2)
+
+        # Data that isn't stored, or has a different size, must be uploaded
+        resp = initUpload(self.user, hash='0' * 128)
+        self.assertStatusOk(resp)
+        self.assertNotIn('_modelType', resp.json)
+        resp = initUpload(self.user, size=5)
+        self.assertStatusOk(resp)
+        self.assertNotIn('_modelType', resp.json)
+        resp = initUpload(self.user, hash='../' * 42)
+        self.assertStatus(resp, 400)
+        self.assertEqual(resp.json['message'], 'Invalid SHA-512 hash.')
+
+        # Deleting a copy leaves the data of the other files in place
+        self.model('file').remove(file)
+        resp = self.request(path='/file/%s/download' % original['_id'],
+                            user=self.user, isJson=False)
+        self.assertStatusOk(resp)
+        self.assertEqual(self.getBody(resp), Chunk1 + Chunk2)
+
+    def testFilesystemUploadDeduplication(self):
+        self._testUploadDeduplication()
+
+    def testGridFSUploadDeduplication(self):
+        base.dropGridFSDatabase('girder_test_upload_assetstore')
+        self.model('assetstore').remove(self.model('assetstore').getCurrent())
+        self.assetstore = self.model('assetstore').createGridFsAssetstore(
+            name='Test', db='girder_test_upload_assetstore')
+        self._testUploadDeduplication()
+
+    def _testPartUpload(self):
+        """
+        Upload a file in parts that are sent out of order, including a part
+        that is sent twice.
+        """
+        partSize = GRIDFS_CHUNK_SIZE
+        parts = ['a' * partSize, 'b' * partSize, 'c' * 10]
+        data = ''.join(parts)
+
+        def sendPart(offset, part):
+            fields = [('offset', offset), ('uploadId', upload['_id'])]
+            files = [('chunk', 'parts.txt', part)]
+            return self.multipartRequest(
+                path='/file/chunk', user=self.user, fields=fields, files=files)
+
+        resp = self.request(
+            path='/file', method='POST', user=self.user, params={
+                'parentType': 'folder',
+                'parentId': self.folder['_id'],
+                'name': 'parts.txt',
+                'size': len(data),
+                'partSize': partSize
+            })
+        self.assertStatusOk(resp)
+        upload = resp.json
+        self.assertEqual(upload['partSize'], partSize)
+        self.assertEqual(upload['partsReceived'], [])
+
+        resp = sendPart(2 * partSize, parts[2])
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json['received'], 10)
+        resp = sendPart(0, parts[0])
+        self.assertStatusOk(resp)
+        resp = sendPart(0, parts[0])
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json['received'], partSize + 10)
+        resp = self.request(path='/file/offset', user=self.user, params={
+            'uploadId': upload['_id']})
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json, {'partsReceived': [0, 2]})
+
+        # Parts must start at a part boundary and have the right length
+        resp = sendPart(5, parts[1])
+        self.assertStatus(resp, 400)
+        resp = sendPart(partSize, parts[1][:-1])
+        self.assertStatus(resp, 400)
+        self.assertEqual(resp.json['message'], 'Part 1 must be %d bytes long.' % partSize)
+        resp = sendPart(3 * partSize, parts[2])
+        self.assertStatus(resp, 400)
+        self.assertEqual(resp.json['message'], 'Invalid part 3.')
+
+        resp = sendPart(partSize, parts[1])
+        self.assertStatusOk(resp)
+        self.assertNotIn('partsReceived', resp.json)
+        self.assertEqual(resp.json['size'], len(data))
+        file = self.model('file').load(resp.json['_id'], force=True)
+        self.assertEqual(
+            file['sha512'], hashlib.sha512(data.encode('utf8')).hexdigest())
+        self.assertIsNone(self.model('upload').findOne({'_id': upload['_id']}))
+        resp = self.request(path='/file/%s/download' % file['_id'],
+                            user=self.user, isJson=False)
+        self.assertStatusOk(resp)
+        self.assertEqual(self.getBody(resp), data)
+
+    def _testRawBodyUpload(self):
+        """
+        Chunks may be sent as the request body, with the other parameters
+        in the query string.
+        """
+        data = Chunk1 + Chunk2
+        resp = self.request(
+            path='/file', method='POST', user=self.user, params={
+                'parentType': 'folder',
+                'parentId': self.folder['_id'],
+                'name': 'raw.txt',
+                'size': len(data)
+            })
+        self.assertStatusOk(resp)
+        upload = resp.json
+
+        def sendChunk(offset, chunk):
+            return self.request(
+                path='/file/chunk', method='POST', user=self.user, body=chunk,
+                type='application/octet-stream', params={
+                    'offset': offset, 'uploadId': upload['_id']})
+
+        resp = sendChunk(0, Chunk1)
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json['received'], len(Chunk1))
+        resp = sendChunk(0, Chunk2)
+        self.assertStatus(resp, 400)
+        resp = sendChunk(len(Chunk1), Chunk2 + 'extra')
+        self.assertStatus(resp, 400)
+        self.assertEqual(resp.json['message'], 'Received too many bytes.')
+
+        # A form body must include the chunk
+        resp = self.request(
+            path='/file/chunk', method='POST', user=self.user, params={
+                'offset': len(Chunk1), 'uploadId': upload['_id']})
+        self.assertStatus(resp, 400)
+        self.assertEqual(resp.json['message'], "Parameter 'chunk' is required.")
+
+        resp = sendChunk(len(Chunk1), Chunk2)
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json['size'], len(data))
+        file = self.model('file').load(resp.json['_id'], force=True)
+        self.assertEqual(
+            file['sha512'], hashlib.sha512(data.encode('utf8')).hexdigest())
+        resp = self.request(path='/file/%s/download' % file['_id'],
+                            user=self.user, isJson=False)
+        self.assertStatusOk(resp)
+        self.assertEqual(self.getBody(resp), data)
+
+    def testFilesystemRawBodyUpload(self):
+        self._testRawBodyUpload()
+
+    def testGridFSRawBodyUpload(self):
+        base.dropGridFSDatabase('girder_test_upload_assetstore')
+        self.model('assetstore').remove(self.model('assetstore').getCurrent())
+        self.assetstore = self.model('assetstore').createGridFsAssetstore(
+            name='Test', db='girder_test_upload_assetstore')
+        self._testRawBodyUpload()
+
+    def testFilesystemPartUpload(self):
+        self._testPartUpload()
+
+    def testGridFSPartUpload(self):
+        base.dropGridFSDatabase('girder_test_upload_assetstore')
+        self.model('assetstore').remove(self.model('assetstore').getCurrent())
+        self.assetstore = self.model('assetstore').createGridFsAssetstore(
+            name='Test', db='girder_test_upload_assetstore')
+        self._testPartUpload()
+
+        # GridFS parts must be made of whole chunks
+        resp = self.request(
+            path='/file', method='POST', user=self.user, params={
+                'parentType': 'folder',
+                'parentId': self.folder['_id'],
+                'name': 'parts.txt',
+                'size': 100,
+                'partSize': 10
+            })
+        self.assertValidationError(resp, 'partSize')